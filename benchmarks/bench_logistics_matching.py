@@ -0,0 +1,212 @@
+"""
+物流匹配基准测试
+
+用合成数据对 match_logistics_info（按姓名合并）和 match_logistics_info_fuzzy_phone
+（电话/地址/商品模糊匹配）计时，记录每秒处理行数和峰值内存，结果写入JSON文件，
+便于在不同提交之间对比。
+
+用法（在项目根目录运行）：
+    python benchmarks/bench_logistics_matching.py
+    python benchmarks/bench_logistics_matching.py --sizes 1000 10000 --output bench.json
+    python benchmarks/bench_logistics_matching.py --functions fuzzy --fuzzy-options tiered=true
+    python benchmarks/bench_logistics_matching.py --sizes --same-name-sizes 300 1000 --fuzzy-options assignment_mode=optimal
+
+测试模糊匹配时还会在默认生成器的数据上对比分层匹配（tiered=True）和逐条评分的结果，
+任何一行不同（包括商品列）都视为失败。
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from benchmarks.synthetic_logistics import (
+    PENDING_COLUMNS, LOGISTICS_COLUMNS, generate_logistics_frames, generate_same_name_frames
+)
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+# 所有记录同名的用例：一个姓名组内有上千条记录时，最优分配仍应与贪心同一量级
+DEFAULT_SAME_NAME_SIZES = [1000]
+COLUMNS_TO_ADD = [LOGISTICS_COLUMNS['tracking'], LOGISTICS_COLUMNS['company']]
+# 分层匹配一致性检查的数据规模和随机种子（默认生成器，含多商品单元格）
+TIERED_CHECK_ROWS = 400
+TIERED_CHECK_SEEDS = [0, 1, 2]
+
+def _run_name_match(pending_df, logistics_df, options):
+    from modules.logistics_matching import match_logistics_info
+    return match_logistics_info(
+        pending_df, logistics_df, PENDING_COLUMNS['name'], LOGISTICS_COLUMNS['name'],
+        COLUMNS_TO_ADD, "保留第一条记录", **options)
+
+def _run_fuzzy_match(pending_df, logistics_df, options):
+    from modules.logistics_matching import match_logistics_info_fuzzy_phone
+    return match_logistics_info_fuzzy_phone(
+        pending_df, logistics_df, PENDING_COLUMNS['name'], LOGISTICS_COLUMNS['name'],
+        COLUMNS_TO_ADD + [LOGISTICS_COLUMNS['product']], "保留第一条记录",
+        pending_phone_select=PENDING_COLUMNS['phone'], logistics_phone_select=LOGISTICS_COLUMNS['phone'],
+        pending_address_select=PENDING_COLUMNS['address'], logistics_address_select=LOGISTICS_COLUMNS['address'],
+        pending_product_select=PENDING_COLUMNS['product'], logistics_product_select=LOGISTICS_COLUMNS['product'],
+        **options)
+
+BENCHMARK_FUNCTIONS = {
+    'name': ('match_logistics_info', _run_name_match),
+    'fuzzy': ('match_logistics_info_fuzzy_phone', _run_fuzzy_match),
+}
+
+def _parse_option_value(value):
+    lowered = value.lower()
+    if lowered in ('true', 'false'):
+        return lowered == 'true'
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_case(function_key, rows, seed, options, measure_memory=True, same_name=False):
+    """
+    运行一个基准用例：先计时运行一次，再在tracemalloc下运行一次取峰值内存
+
+    same_name为True时所有记录同名（见generate_same_name_frames）
+
+    Returns:
+        dict: 单个用例的结果
+    """
+    function_name, runner = BENCHMARK_FUNCTIONS[function_key]
+    generate = generate_same_name_frames if same_name else generate_logistics_frames
+    pending_df, logistics_df = generate(rows, seed=seed)
+
+    start = time.perf_counter()
+    result_df = runner(pending_df.copy(), logistics_df.copy(), options)
+    seconds = time.perf_counter() - start
+    if result_df is None:
+        raise RuntimeError(f"{function_name} 在 {rows} 行数据上运行失败")
+
+    peak_memory_mb = None
+    if measure_memory:
+        tracemalloc.start()
+        try:
+            runner(pending_df.copy(), logistics_df.copy(), options)
+            peak_memory_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        finally:
+            tracemalloc.stop()
+
+    tracking_column = LOGISTICS_COLUMNS['tracking']
+    matched_rows = 0
+    if tracking_column in result_df.columns:
+        tracking = result_df[tracking_column]
+        matched_rows = int((tracking.notna() & ~tracking.astype(str).isin(['', 'nan', 'None'])).sum())
+
+    return {
+        'function': function_name,
+        'options': options,
+        'same_name': same_name,
+        'rows': rows,
+        'logistics_rows': len(logistics_df),
+        'seconds': round(seconds, 4),
+        'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None,
+        'peak_memory_mb': round(peak_memory_mb, 2) if peak_memory_mb is not None else None,
+        'matched_rows': matched_rows,
+    }
+
+def check_tiered_consistency(rows, seeds, options):
+    """
+    对比分层匹配与逐条评分在默认生成器数据上的结果，两者应逐行一致
+
+    Returns:
+        dict: 检查结果，differences 为 {随机种子: 不一致的行号列表}
+    """
+    options = {key: value for key, value in options.items() if key != 'tiered'}
+    differences = {}
+    for seed in seeds:
+        pending_df, logistics_df = generate_logistics_frames(rows, seed=seed)
+        serial_df = _run_fuzzy_match(pending_df.copy(), logistics_df.copy(), {**options, 'tiered': False})
+        tiered_df = _run_fuzzy_match(pending_df.copy(), logistics_df.copy(), {**options, 'tiered': True})
+        if serial_df is None or tiered_df is None:
+            raise RuntimeError(f"分层匹配一致性检查在种子 {seed} 上运行失败")
+        different = (serial_df.astype(str) != tiered_df.astype(str)).any(axis=1)
+        if different.any():
+            differences[seed] = different[different].index.tolist()
+    return {'rows': rows, 'seeds': list(seeds), 'options': options, 'differences': differences}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="物流匹配基准测试（合成数据）")
+    parser.add_argument('--sizes', type=int, nargs='*', default=DEFAULT_SIZES, help="待发货明细行数，默认 1000 10000 100000")
+    parser.add_argument('--same-name-sizes', type=int, nargs='*', default=DEFAULT_SAME_NAME_SIZES,
+                        help="所有记录同名的用例行数，默认 1000；不带数值时不运行")
+    parser.add_argument('--functions', nargs='+', choices=sorted(BENCHMARK_FUNCTIONS), default=['name', 'fuzzy'],
+                        help="要测试的匹配函数：name=按姓名合并，fuzzy=模糊匹配")
+    parser.add_argument('--fuzzy-options', nargs='*', default=[], metavar='KEY=VALUE',
+                        help="传给模糊匹配函数的参数，如 tiered=true assignment_mode=optimal")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    parser.add_argument('--no-memory', action='store_true', help="不测峰值内存（tracemalloc会让函数变慢，单独运行一次）")
+    parser.add_argument('--no-tiered-check', action='store_true', help="不检查分层匹配与逐条评分的结果是否一致")
+    parser.add_argument('--output', default='benchmark_results.json', help="结果JSON文件路径")
+    args = parser.parse_args(argv)
+
+    # 脱离streamlit运行时，st.write会产生大量提示日志；先读取一次配置，
+    # 否则配置解析完成后会把日志级别重置为配置中的值
+    import streamlit.config
+    import streamlit.logger
+    streamlit.config.get_option('logger.level')
+    streamlit.logger.set_log_level('error')
+
+    fuzzy_options = {}
+    for item in args.fuzzy_options:
+        key, _, value = item.partition('=')
+        fuzzy_options[key] = _parse_option_value(value)
+
+    results = []
+    cases = [(rows, False) for rows in args.sizes] + [(rows, True) for rows in args.same_name_sizes]
+    for rows, same_name in cases:
+        for function_key in args.functions:
+            options = fuzzy_options if function_key == 'fuzzy' else {}
+            case = run_case(function_key, rows, args.seed, options, measure_memory=not args.no_memory, same_name=same_name)
+            results.append(case)
+            memory = f"{case['peak_memory_mb']:.1f} MB" if case['peak_memory_mb'] is not None else "-"
+            label = case['function'] + ('（同名）' if same_name else '')
+            print(f"{label:<36} {rows:>8} 行  {case['seconds']:>9.3f} 秒  "
+                  f"{case['rows_per_sec']:>10.1f} 行/秒  峰值内存 {memory}  匹配 {case['matched_rows']}")
+
+    tiered_check = None
+    if 'fuzzy' in args.functions and not args.no_tiered_check:
+        tiered_check = check_tiered_consistency(TIERED_CHECK_ROWS, TIERED_CHECK_SEEDS, fuzzy_options)
+        for seed, rows in tiered_check['differences'].items():
+            print(f"分层匹配与逐条评分不一致：种子 {seed}，行 {rows[:10]}")
+        if not tiered_check['differences']:
+            print(f"分层匹配一致性检查通过（{TIERED_CHECK_ROWS} 行，种子 {TIERED_CHECK_SEEDS}）")
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'results': results,
+        'tiered_check': tiered_check,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+    if tiered_check is not None and tiered_check['differences']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+物流匹配基准测试用的合成数据生成器
+
+生成的两张表与 match_logistics_info / match_logistics_info_fuzzy_phone 的输入形态一致：
+- 待发货明细：收货人、联系电话、收货地址、商品名称
+- 物流单号表：收件人、电话（部分隐藏，如138****5678）、地址（部分用**隐藏）、
+  商品（多个商品用+或、连接）、物流单号、物流公司
+
+同一个随机种子总是生成完全相同的数据，便于在不同提交之间对比
+"""
+import random
+
+import pandas as pd
+
+SURNAMES = list('王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈姚卢姜崔钟谭陆汪范金石廖贾夏韦付方白邹孟熊秦邱江尹薛闫段雷侯龙史陶黎贺顾毛郝龚邵万钱严覃武戴莫孔向汤')
+GIVEN_CHARS = list('伟芳娜秀英敏静丽强磊军洋勇艳杰娟涛明超秀兰霞平刚桂英华建国志红玉萍辉鹏飞斌宇浩凯健俊帆帅旭宁龙林欣佳琳雪梅晨阳')
+PROVINCES = [('河南省', ['郑州市', '洛阳市', '开封市']), ('广东省', ['广州市', '深圳市', '佛山市']),
+             ('浙江省', ['杭州市', '宁波市', '温州市']), ('四川省', ['成都市', '绵阳市', '宜宾市'])]
+DISTRICTS = ['金水区', '二七区', '高新区', '天河区', '南山区', '西湖区', '武侯区', '经开区']
+STREETS = ['文化路', '建设路', '人民路', '科技大道', '中山路', '解放路', '花园路', '滨江路']
+COMMUNITIES = ['阳光小区', '锦绣花园', '幸福家园', '世纪城', '绿地公寓', '东方大厦']
+PRODUCTS = [
+    "奥克斯（AUX） 除螨仪 90W （计价单位：台）",
+    "国产定制 黄金葉  盒装抽纸  （计价单位：盒）",
+    "国产定制 黄金葉 湿纸巾 10片/包 （计价单位：包）",
+    "国产定制 黄金葉 四盒装翻盖式礼盒 30个/箱 （计价单位：个）",
+    "品胜（PISEN） 数据线三合一充电线100W  一拖三 （计价单位：条）",
+    "有色 剃须刀便携合金电动刮胡刀男士  MINI 2.0 （计价单位：个） 颜色随机",
+    "苏泊尔(SUPOR) 锅具三件套 炒锅30cm+煎锅24cm+汤锅20cm （计价单位：套）",
+]
+# 物流单号表中的商品常是简称
+PRODUCT_SHORT_NAMES = ['除螨仪', '盒装抽纸', '湿纸巾', '翻盖式礼盒', '数据线', '剃须刀', '锅具三件套']
+
+PENDING_COLUMNS = {'name': '收货人', 'phone': '联系电话', 'address': '收货地址', 'product': '商品名称'}
+LOGISTICS_COLUMNS = {'name': '收件人', 'phone': '电话', 'address': '地址', 'product': '商品',
+                     'tracking': '物流单号', 'company': '物流公司'}
+
+def _random_name(rng):
+    return rng.choice(SURNAMES) + ''.join(rng.choice(GIVEN_CHARS) for _ in range(rng.choice((1, 2))))
+
+def _random_phone(rng):
+    return rng.choice(['13', '15', '17', '18', '19']) + ''.join(rng.choice('0123456789') for _ in range(9))
+
+def _random_address(rng):
+    province, cities = rng.choice(PROVINCES)
+    return (province + rng.choice(cities) + rng.choice(DISTRICTS) + rng.choice(STREETS)
+            + f"{rng.randint(1, 300)}号" + rng.choice(COMMUNITIES) + f"{rng.randint(1, 30)}栋{rng.randint(101, 2605)}室")
+
+def _mask_phone(rng, phone):
+    roll = rng.random()
+    if roll < 0.55:
+        return phone[:3] + '****' + phone[-4:]    # 138****5678
+    if roll < 0.7:
+        return phone[:4] + '*' + phone[-3:]       # 1580*995
+    if roll < 0.8:
+        return phone[:7]
+    return phone
+
+def _mask_address(rng, address):
+    roll = rng.random()
+    if roll < 0.5:
+        # 保留省市区，隐藏中间的详细地址
+        return address[:9] + '**' + address[-4:]
+    if roll < 0.7:
+        return address[:6] + '**'
+    return address
+
+def generate_logistics_frames(rows, seed=0, duplicate_name_rate=0.15, multi_product_rate=0.3):
+    """
+    生成一对合成的待发货明细和物流单号表
+
+    Args:
+        rows: 待发货明细的行数
+        seed: 随机种子
+        duplicate_name_rate: 与已有收件人同名（但电话、地址不同）的比例
+        multi_product_rate: 同一收件人多件商品合并在一个物流单元格中的比例
+
+    Returns:
+        tuple: (待发货明细DataFrame, 物流单号表DataFrame)
+    """
+    rng = random.Random(seed)
+    pending = {column: [] for column in PENDING_COLUMNS.values()}
+    logistics = {column: [] for column in LOGISTICS_COLUMNS.values()}
+    names = []
+    tracking_number = 0
+
+    while len(pending[PENDING_COLUMNS['name']]) < rows:
+        # 故意生成同名不同人的收件人
+        if names and rng.random() < duplicate_name_rate:
+            name = rng.choice(names)
+        else:
+            name = _random_name(rng)
+            names.append(name)
+        phone = _random_phone(rng)
+        address = _random_address(rng)
+
+        product_indexes = [rng.randrange(len(PRODUCTS)) for _ in range(rng.choice((1, 1, 1, 2, 3)))]
+        product_indexes = product_indexes[:rows - len(pending[PENDING_COLUMNS['name']])]
+        for product_index in product_indexes:
+            pending[PENDING_COLUMNS['name']].append(name)
+            pending[PENDING_COLUMNS['phone']].append(phone)
+            pending[PENDING_COLUMNS['address']].append(address)
+            pending[PENDING_COLUMNS['product']].append(PRODUCTS[product_index])
+
+        if len(product_indexes) > 1 and rng.random() < multi_product_rate:
+            shipments = [product_indexes]
+        else:
+            shipments = [[product_index] for product_index in product_indexes]
+        for shipment in shipments:
+            tracking_number += 1
+            separator = rng.choice(['+', '、'])
+            logistics[LOGISTICS_COLUMNS['name']].append(name)
+            logistics[LOGISTICS_COLUMNS['phone']].append(_mask_phone(rng, phone))
+            logistics[LOGISTICS_COLUMNS['address']].append(_mask_address(rng, address))
+            logistics[LOGISTICS_COLUMNS['product']].append(separator.join(PRODUCT_SHORT_NAMES[index] for index in shipment))
+            logistics[LOGISTICS_COLUMNS['tracking']].append(f"SF{seed:02d}{tracking_number:010d}")
+            logistics[LOGISTICS_COLUMNS['company']].append(rng.choice(['顺丰速运', '中通快递', '京东物流']))
+
+    pending_df = pd.DataFrame(pending)
+    # 物流导出的顺序与待发货明细无关
+    logistics_df = pd.DataFrame(logistics).sample(frac=1, random_state=seed).reset_index(drop=True)
+    return pending_df, logistics_df
+
+def generate_same_name_frames(rows, seed=0, name='张伟'):
+    """
+    生成所有收件人同名（电话、地址、商品各不相同）的合成数据，
+    用于测试一个姓名下有成百上千条记录时的匹配耗时
+
+    Returns:
+        tuple: (待发货明细DataFrame, 物流单号表DataFrame)
+    """
+    pending_df, logistics_df = generate_logistics_frames(rows, seed=seed)
+    pending_df[PENDING_COLUMNS['name']] = name
+    logistics_df[LOGISTICS_COLUMNS['name']] = name
+    return pending_df, logistics_df
@@ -0,0 +1,389 @@
+"""
+命令行批处理入口
+
+不启动Streamlit服务，直接对目录或通配符匹配到的工作簿运行处理流程，结果写入输出目录，
+适合定时任务。互不依赖的文件在多个进程中并行处理，结束时输出每个阶段的文件数、行数和吞吐量。
+
+子命令：
+    issue       批量处理发放明细查询文件，合并为发货明细（同页面"批量处理发放明细"）
+    reconcile   核对发放明细与供应商订单并标记集采信息，每个发放明细文件单独输出
+    logistics   把物流单号表的信息匹配到待发货明细表，每个待发货明细文件单独输出
+
+用法（在项目根目录运行）：
+    python cli.py issue data/发放明细查询/ --output-dir out
+    python cli.py reconcile --delivery "data/发货明细/*.xlsx" --orders data/供应商订单/ --output-dir out
+    python cli.py logistics --pending data/待发货/ --logistics data/物流单号.xlsx --columns 物流公司 物流单号
+    python cli.py logistics --pending data/待发货/ --logistics data/物流单号.xlsx --columns 物流单号 \\
+        --method fuzzy --pending-phone-col 手机 --logistics-phone-col 收件人电话 --report report.json
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+# 自动检测收件人列时的候选列名，与页面"物流单号匹配"一致
+PENDING_NAME_COLUMNS = ['收货人', '收件人', '客户名称', '姓名']
+LOGISTICS_NAME_COLUMNS = ['收件人', '收货人', '客户名称', '姓名']
+HANDLE_DUPLICATES = {'first': "保留第一条记录", 'all': "合并所有记录（可能导致行数增加）"}
+
+# 工作进程中共享的只读数据（由进程池的initializer设置，每个进程只传一次）
+_shared = {}
+
+def _quiet_streamlit():
+    # 脱离streamlit运行时，st.*调用会产生大量提示日志；先读取一次配置，
+    # 否则配置解析完成后会把日志级别重置为配置中的值
+    import streamlit.config
+    import streamlit.logger
+    streamlit.config.get_option('logger.level')
+    streamlit.logger.set_log_level('error')
+
+def _init_worker(shared):
+    _quiet_streamlit()
+    _shared.clear()
+    _shared.update(shared)
+
+def expand_inputs(patterns):
+    """
+    把目录、通配符和文件路径展开为xlsx文件列表（按名称排序，去重，跳过Excel的~$临时文件）
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, '*.xlsx')))
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [pattern]
+        for path in matches:
+            if os.path.basename(path).startswith('~$') or path in paths:
+                continue
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"找不到文件: {path}")
+            paths.append(path)
+    return paths
+
+def run_parallel(worker, items, workers, shared=None):
+    """
+    对每个输入调用worker，workers不少于2且输入多于1个时在进程池中并行执行
+
+    Returns:
+        list: 每个输入的 (结果, 异常)，按输入顺序，失败时结果为None
+    """
+    shared = shared or {}
+    results = [None] * len(items)
+    worker_count = min(workers, len(items))
+    if worker_count < 2:
+        _init_worker(shared)
+        for index, item in enumerate(items):
+            try:
+                results[index] = (worker(item), None)
+            except Exception as e:
+                results[index] = (None, e)
+        return results
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(max_workers=worker_count, initializer=_init_worker, initargs=(shared,)) as executor:
+        futures = {executor.submit(worker, item): index for index, item in enumerate(items)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = (future.result(), None)
+            except Exception as e:
+                results[index] = (None, e)
+    return results
+
+def write_output(df, output_dir, name, file_format):
+    """
+    导出到输出目录，xlsx超过行数上限时改为csv
+
+    Returns:
+        str: 写入的文件路径
+    """
+    from modules.excel_io import EXPORT_FORMATS, export_formats, export_dataframe
+    if file_format not in export_formats(df) and file_format == 'xlsx':
+        file_format = 'csv'
+    path = os.path.join(output_dir, name + EXPORT_FORMATS[file_format][0])
+    with export_dataframe(df, file_format) as file, open(path, 'wb') as output:
+        shutil.copyfileobj(file, output)
+    return path
+
+def _stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+def _detect_column(columns, candidates, label):
+    # 优先"收货人"，否则取候选列名中第一个出现的列，与页面的自动检测规则相同
+    if '收货人' in columns:
+        return '收货人'
+    for col in columns:
+        if col in candidates:
+            return col
+    raise ValueError(f"{label}中找不到收件人列，请用参数指定")
+
+def add_stage(report, stage, files, rows, seconds, failed=0):
+    """
+    记录并输出一个阶段处理的文件数、行数、耗时和吞吐量
+    """
+    entry = {
+        'stage': stage,
+        'files': files,
+        'failed': failed,
+        'rows': rows,
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None,
+        'files_per_sec': round(files / seconds, 2) if seconds > 0 else None,
+    }
+    report.append(entry)
+    rate = f"{entry['rows_per_sec']:>10.1f} 行/秒" if entry['rows_per_sec'] is not None else "-"
+    print(f"{stage:<8} {files:>4} 个文件  {rows:>9} 行  {seconds:>8.2f} 秒  {rate}"
+          + (f"  失败 {failed}" if failed else ""))
+
+def _report_errors(paths, results):
+    failed = 0
+    for path, (_, error) in zip(paths, results):
+        if error is not None:
+            failed += 1
+            print(f"处理文件 {path} 时出错: {type(error).__name__}: {error}", file=sys.stderr)
+    return failed
+
+# ---- issue：批量处理发放明细 ----
+
+def _issue_worker(path):
+    from modules.data_processing import read_发放明细查询文件, process_发放明细查询文件
+    return process_发放明细查询文件(path, read_发放明细查询文件(path))
+
+def run_issue(args, report):
+    from modules.data_processing import merge_发放明细
+    paths = expand_inputs(args.inputs)
+    start = time.perf_counter()
+    results = run_parallel(_issue_worker, paths, args.workers)
+    failed = _report_errors(paths, results)
+    frames = [df for df, _ in results if df is not None and not df.empty]
+    add_stage(report, '读取处理', len(paths), sum(len(df) for df in frames), time.perf_counter() - start, failed)
+
+    result_df = merge_发放明细(frames)
+    if result_df is None:
+        print("没有成功处理任何数据", file=sys.stderr)
+        return 1
+    path = write_output(result_df, args.output_dir, args.output_name, args.format)
+    print(f"共汇总 {len(result_df)} 行数据，已写入 {path}")
+    return 1 if failed else 0
+
+# ---- reconcile：核对发放明细与供应商订单 ----
+
+def _order_worker(path):
+    from modules.data_processing import process_supplier_order_file
+    from modules.excel_io import read_excel
+    return process_supplier_order_file(path, read_excel(path, header=None))
+
+def _reconcile_worker(path):
+    from modules.data_processing import COMPARE_RESULTS, compare_data, mark_procurement_info
+    from modules.excel_io import read_excel
+    发货明细_df = read_excel(path)
+    stats = {'rows': len(发货明细_df), 'outputs': []}
+    if _shared['compare']:
+        buckets = compare_data(发货明细_df, match_method=_shared['match_method'], order_summary=_shared['order_summary'])
+        compare_df = pd.concat(buckets, ignore_index=True)
+        stats['counts'] = {bucket_name: len(bucket) for bucket_name, bucket in zip(COMPARE_RESULTS, buckets)}
+        stats['outputs'].append(write_output(compare_df, _shared['output_dir'], f"{_stem(path)}_核对结果", _shared['format']))
+    if _shared['mark']:
+        marked_df = mark_procurement_info(发货明细_df, _shared['orders'], _shared['match_method'])
+        stats['outputs'].append(write_output(marked_df, _shared['output_dir'], f"{_stem(path)}_处理结果", _shared['format']))
+    return stats
+
+def run_reconcile(args, report):
+    from modules.data_processing import summarize_supplier_orders
+    order_paths = expand_inputs(args.orders)
+    delivery_paths = expand_inputs(args.delivery)
+
+    # 供应商订单只读取、汇总一次，供所有发放明细文件共用
+    start = time.perf_counter()
+    results = run_parallel(_order_worker, order_paths, args.workers)
+    failed = _report_errors(order_paths, results)
+    orders = [df for df, _ in results if df is not None]
+    add_stage(report, '供应商订单', len(order_paths), sum(len(df) for df in orders), time.perf_counter() - start, failed)
+    if not orders:
+        print("没有成功读取任何供应商订单", file=sys.stderr)
+        return 1
+    供应商订单_df = pd.concat(orders, ignore_index=True)
+
+    compare = not args.no_compare
+    shared = {
+        'orders': 供应商订单_df,
+        'order_summary': summarize_supplier_orders(供应商订单_df, args.match_method) if compare else None,
+        'match_method': args.match_method,
+        'compare': compare,
+        'mark': not args.no_mark,
+        'output_dir': args.output_dir,
+        'format': args.format,
+    }
+
+    start = time.perf_counter()
+    results = run_parallel(_reconcile_worker, delivery_paths, args.workers, shared)
+    delivery_failed = _report_errors(delivery_paths, results)
+    add_stage(report, '核对标记', len(delivery_paths), sum(stats['rows'] for stats, _ in results if stats),
+              time.perf_counter() - start, delivery_failed)
+    for path, (stats, _) in zip(delivery_paths, results):
+        if stats is None:
+            continue
+        counts = '，'.join(f"{name} {count}" for name, count in stats.get('counts', {}).items())
+        print(f"{os.path.basename(path)}: {stats['rows']} 行" + (f"（{counts}）" if counts else "")
+              + f" -> {', '.join(stats['outputs'])}")
+    return 1 if failed or delivery_failed else 0
+
+# ---- logistics：物流单号匹配 ----
+
+def _logistics_worker(path):
+    from modules.excel_io import read_excel
+    from modules.logistics_matching import match_logistics_info, match_logistics_info_fuzzy_phone
+    options = _shared['options']
+    pending_df = read_excel(path, header=options['pending_header'])
+    pending_name = options['pending_name_col'] or _detect_column(pending_df.columns, PENDING_NAME_COLUMNS, path)
+    if options['method'] == 'fuzzy':
+        result_df = match_logistics_info_fuzzy_phone(
+            pending_df, _shared['logistics'], pending_name, _shared['logistics_name_col'],
+            options['columns'], HANDLE_DUPLICATES[options['duplicates']],
+            pending_phone_select=options['pending_phone_col'],
+            logistics_phone_select=options['logistics_phone_col'],
+            pending_address_select=options['pending_address_col'],
+            logistics_address_select=options['logistics_address_col'],
+            pending_product_select=options['pending_product_col'],
+            logistics_product_select=options['logistics_product_col'],
+            cross_name_phone=options['cross_name_phone'],
+            assignment_mode=options['assignment_mode'],
+            tiered=options['tiered'])
+    else:
+        result_df = match_logistics_info(
+            pending_df, _shared['logistics'], pending_name, _shared['logistics_name_col'],
+            options['columns'], HANDLE_DUPLICATES[options['duplicates']])
+    if result_df is None:
+        raise RuntimeError("匹配失败")
+    output = write_output(result_df, _shared['output_dir'], f"{_stem(path)}_物流匹配", _shared['format'])
+    return {'rows': len(pending_df), 'result_rows': len(result_df), 'output': output}
+
+def run_logistics(args, report):
+    from modules.excel_io import read_excel
+    pending_paths = expand_inputs(args.pending)
+
+    start = time.perf_counter()
+    logistics_df = read_excel(args.logistics, header=args.logistics_header)
+    logistics_name_col = args.logistics_name_col or _detect_column(logistics_df.columns, LOGISTICS_NAME_COLUMNS, args.logistics)
+    missing = [col for col in args.columns if col not in logistics_df.columns]
+    if missing:
+        print(f"物流单号表中没有列: {', '.join(missing)}", file=sys.stderr)
+        return 1
+    add_stage(report, '物流单号表', 1, len(logistics_df), time.perf_counter() - start)
+
+    shared = {
+        'logistics': logistics_df,
+        'logistics_name_col': logistics_name_col,
+        'output_dir': args.output_dir,
+        'format': args.format,
+        'options': {
+            'pending_header': args.pending_header,
+            'pending_name_col': args.pending_name_col,
+            'columns': args.columns,
+            'method': args.method,
+            'duplicates': args.duplicates,
+            'pending_phone_col': args.pending_phone_col,
+            'logistics_phone_col': args.logistics_phone_col,
+            'pending_address_col': args.pending_address_col,
+            'logistics_address_col': args.logistics_address_col,
+            'pending_product_col': args.pending_product_col,
+            'logistics_product_col': args.logistics_product_col,
+            'cross_name_phone': args.cross_name_phone,
+            'assignment_mode': args.assignment_mode,
+            'tiered': args.tiered,
+        },
+    }
+
+    start = time.perf_counter()
+    results = run_parallel(_logistics_worker, pending_paths, args.workers, shared)
+    failed = _report_errors(pending_paths, results)
+    add_stage(report, '物流匹配', len(pending_paths), sum(stats['rows'] for stats, _ in results if stats),
+              time.perf_counter() - start, failed)
+    for path, (stats, _) in zip(pending_paths, results):
+        if stats is not None:
+            print(f"{os.path.basename(path)}: {stats['rows']} 行 -> {stats['result_rows']} 行，已写入 {stats['output']}")
+    return 1 if failed else 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="数据处理系统命令行批处理（不启动Streamlit服务）")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--output-dir', default='output', help="结果输出目录，默认 output")
+    common.add_argument('--format', choices=['xlsx', 'csv', 'parquet'], default='xlsx', help="输出格式，默认 xlsx")
+    common.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="并行进程数，默认为CPU核数，1为单进程")
+    common.add_argument('--report', help="把各阶段的吞吐量统计写入此JSON文件")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    issue = subparsers.add_parser('issue', parents=[common], help="批量处理发放明细查询文件")
+    issue.add_argument('inputs', nargs='+', help="发放明细查询文件、目录或通配符")
+    issue.add_argument('--output-name', default='发货明细', help="输出文件名（不含扩展名），默认 发货明细")
+    issue.set_defaults(run=run_issue)
+
+    reconcile = subparsers.add_parser('reconcile', parents=[common], help="核对发放明细与供应商订单并标记集采信息")
+    reconcile.add_argument('--delivery', nargs='+', required=True, help="发放明细文件、目录或通配符，每个文件单独核对")
+    reconcile.add_argument('--orders', nargs='+', required=True, help="供应商订单文件、目录或通配符，合并后与每个发放明细核对")
+    reconcile.add_argument('--match-method', choices=['name', 'scheme_product'], default='scheme_product',
+                           help="name=按姓名+方案编号+商品名称，scheme_product=按方案编号+商品名称（默认）")
+    reconcile.add_argument('--no-compare', action='store_true', help="不核对数量")
+    reconcile.add_argument('--no-mark', action='store_true', help="不标记集采信息")
+    reconcile.set_defaults(run=run_reconcile)
+
+    logistics = subparsers.add_parser('logistics', parents=[common], help="物流单号匹配")
+    logistics.add_argument('--pending', nargs='+', required=True, help="待发货明细文件、目录或通配符，每个文件单独匹配")
+    logistics.add_argument('--logistics', required=True, help="物流单号表文件")
+    logistics.add_argument('--columns', nargs='+', required=True, help="从物流单号表添加的列")
+    logistics.add_argument('--pending-header', type=int, default=0, help="待发货明细表列名所在的行（从0开始）")
+    logistics.add_argument('--logistics-header', type=int, default=0, help="物流单号表列名所在的行（从0开始）")
+    logistics.add_argument('--pending-name-col', help="待发货明细表的收件人列，默认自动检测")
+    logistics.add_argument('--logistics-name-col', help="物流单号表的收件人列，默认自动检测")
+    logistics.add_argument('--method', choices=['name', 'fuzzy'], default='name',
+                           help="name=按姓名匹配（默认），fuzzy=电话/地址/商品模糊匹配")
+    logistics.add_argument('--duplicates', choices=sorted(HANDLE_DUPLICATES), default='first',
+                           help="物流单号表中重复收件人的处理：first=保留第一条（默认），all=合并所有记录")
+    for field, label in (('phone', '电话'), ('address', '地址'), ('product', '商品')):
+        logistics.add_argument(f'--pending-{field}-col', help=f"待发货明细表的{label}列（模糊匹配）")
+        logistics.add_argument(f'--logistics-{field}-col', help=f"物流单号表的{label}列（模糊匹配）")
+    logistics.add_argument('--cross-name-phone', action='store_true', help="找不到同名记录时按电话跨姓名查找")
+    logistics.add_argument('--assignment-mode', choices=['greedy', 'optimal'], default='greedy', help="模糊匹配的分配方式")
+    logistics.add_argument('--tiered', action='store_true', help="模糊匹配使用分层匹配")
+    logistics.set_defaults(run=run_logistics)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    _quiet_streamlit()
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    report = []
+    start = time.perf_counter()
+    try:
+        exit_code = args.run(args, report)
+    except (FileNotFoundError, ValueError) as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    print(f"总耗时 {time.perf_counter() - start:.2f} 秒（{args.workers} 个进程）")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'command': args.command,
+                'workers': args.workers,
+                'stages': report,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"统计已写入 {args.report}")
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,55 @@
+import numpy as np
 import pandas as pd
 import streamlit as st
-import os
-import tempfile
-from datetime import datetime
 
-def process_发放明细查询文件(file_path):
+from modules.excel_io import read_excel, read_excel_columns, read_excel_files
+
+# 核对数量的匹配键（发货明细的列重命名为供应商订单的列名后）
+COMPARE_MATCH_KEYS = {
+    'name': ['方案编号', '收货人', '商品名称'],
+    'scheme_product': ['方案编号', '商品名称'],
+}
+# 核对结果，顺序与compare_data的返回值一致
+COMPARE_RESULTS = ['数量一致', '数量不一致', '发货明细中未找到', '供应商订单中未找到']
+# 标记集采信息的匹配键：匹配方式 -> (供应商订单中的列, 发货明细中对应的列)
+PROCUREMENT_MATCH_KEYS = {
+    'name': (['方案编号', '收货人', '联系方式', '商品名称'], ['领用说明', '收货人', '收货人电话', '产品名称']),
+    'scheme_product': (['方案编号', '商品名称'], ['领用说明', '产品名称']),
+}
+
+def 发放明细所需列(header_df):
+    """
+    发放明细查询文件需要的列：前14列通用信息，以及第三行（公司名称）包含"怡亚通"的列
+
+    Args:
+        header_df: 文件的前三行（header=None）
+
+    Returns:
+        list: 列位置（超出工作表宽度的列读取时忽略）
+    """
+    info_columns = list(range(14))
+    if len(header_df) < 3:
+        return info_columns
+    header_row3 = header_df.iloc[2]
+    yiyatong_mask = header_row3.notna() & header_row3.astype(str).str.contains('怡亚通', regex=False)
+    return info_columns + [i for i in np.flatnonzero(yiyatong_mask.to_numpy()).tolist() if i >= 14]
+
+def read_发放明细查询文件(file):
+    """
+    只读取发放明细查询文件中需要的列（header=None），列按原顺序重新编号
+    """
+    return read_excel_columns(file, 发放明细所需列, header_rows=3)
+
+def process_发放明细查询文件(file_path, raw_df=None):
     """
     处理发放明细查询文件，提取怡亚通公司的数据
+
+    raw_df为已读取的原始数据（header=None，可以是read_发放明细查询文件只读取了所需列的结果），
+    为None时从file_path读取
     """
     try:
         # 读取Excel文件，不指定header以便手动处理
-        df = pd.read_excel(file_path, header=None)
+        df = read_发放明细查询文件(file_path) if raw_df is None else raw_df
         
         if df.empty:
             return pd.DataFrame()
@@ -19,68 +58,61 @@ def process_发放明细查询文件(file_path):
         header_row2 = df.iloc[1]  # 第二行（产品名称）
         header_row3 = df.iloc[2]  # 第三行（公司名称）
         
-        # 找到包含"怡亚通"的列
-        yiyatong_cols = []
-        for i in range(len(header_row3)):
-            if pd.notna(header_row3[i]) and '怡亚通' in str(header_row3[i]):
-                product_name = header_row2[i] if pd.notna(header_row2[i]) else ""
-                yiyatong_cols.append((i, product_name))
-        
-        if not yiyatong_cols:
+        # 找到包含"怡亚通"的列，以第二行的产品名称作为产品名
+        yiyatong_mask = header_row3.notna() & header_row3.astype(str).str.contains('怡亚通', regex=False)
+        yiyatong_positions = np.flatnonzero(yiyatong_mask.to_numpy())
+        if len(yiyatong_positions) == 0:
             return pd.DataFrame()
+        product_names = np.array([name if pd.notna(name) else "" for name in header_row2.iloc[yiyatong_positions]],
+                                 dtype=object)
         
-        # 提取前14列的通用信息
-        info_columns = list(range(14))
+        # 从第4行开始是数据行（索引3），跳过合计行
+        data_df = df.iloc[3:]
+        first_col = data_df.iloc[:, 0]
+        total_rows = (first_col.notna() & first_col.astype(str).str.contains('合计', regex=False)).to_numpy()
         
-        # 构建结果数据
-        result_data = []
+        # 怡亚通各列转为长表：每个 (数据行, 产品) 一行，按数据行、产品列的顺序排列
+        quantity_df = pd.DataFrame(data_df.iloc[:, yiyatong_positions].to_numpy(dtype=object))
+        long_df = quantity_df.reset_index(names='row').melt(id_vars='row', var_name='product', value_name='quantity')
+        long_df = long_df.sort_values('row', kind='stable')
         
-        # 从第4行开始是数据行（索引3）
-        for row_idx in range(3, len(df)):
-            row = df.iloc[row_idx]
-            
-            # 跳过合计行
-            if pd.notna(row.iloc[0]) and '合计' in str(row.iloc[0]):
-                continue
-            
-            # 为每个怡亚通产品创建一行
-            for col_idx, product_name in yiyatong_cols:
-                # 检查该列的数量是否不为0
-                if col_idx < len(row) and pd.notna(row.iloc[col_idx]) and row.iloc[col_idx] != 0:
-                    quantity = row.iloc[col_idx]
-                    # 只有数量不为0的数据才添加
-                    if quantity != 0:
-                        # 获取通用信息
-                        base_info = []
-                        for col_idx_info in info_columns:
-                            if col_idx_info < len(row):
-                                base_info.append(row.iloc[col_idx_info])
-                            else:
-                                base_info.append(None)
-                        
-                        # 创建一行数据：通用信息(14列) + 产品名称 + 数量
-                        new_row = base_info + [product_name, quantity]
-                        result_data.append(new_row)
+        # 只保留数量不为空且不为0的记录
+        quantity = long_df['quantity']
+        keep = (quantity.notna() & (quantity != 0)).to_numpy() & ~total_rows[long_df['row'].to_numpy()]
+        long_df = long_df[keep]
+        rows = long_df['row'].to_numpy()
         
         # 更新列定义
         columns = ['制单日期', '打印时间', '领用单号', '领用类型', '方案类型', '领用部门', 
                   '区域', '方案提报人', '方案提报人电话', '发货仓库', '收货人', 
                   '收货人电话', '收货地址', '领用说明', '产品名称', '数量']
         
-        result_df = pd.DataFrame(result_data, columns=columns)
+        # 前14列为通用信息，文件列数不足时补None
+        info_values = data_df.iloc[:, :14].to_numpy(dtype=object)[rows]
+        result_columns = {
+            columns[i]: info_values[:, i] if i < info_values.shape[1] else np.full(len(rows), None, dtype=object)
+            for i in range(14)
+        }
+        result_columns['产品名称'] = product_names[long_df['product'].to_numpy(dtype=int)]
+        result_columns['数量'] = long_df['quantity'].to_numpy(dtype=object)
+        
+        # 与逐行构建DataFrame时相同，按列推断数据类型
+        result_df = pd.DataFrame(result_columns, columns=columns).infer_objects()
         return result_df
         
     except Exception as e:
         st.error(f"处理文件 {file_path} 时出错: {e}")
         return pd.DataFrame()
 
-def process_supplier_order_file(file_path):
+def process_supplier_order_file(file_path, raw_df=None):
     """
     处理单个供应商订单查询文件
+
+    raw_df为已读取的原始数据（header=None），为None时从file_path读取
     """
     try:
         # 读取Excel文件，不指定header以便手动处理
-        df = pd.read_excel(file_path, header=None)
+        df = read_excel(file_path, header=None) if raw_df is None else raw_df
         
         if df.empty:
             return None
@@ -118,104 +150,109 @@ def batch_process_files(uploaded_files):
         st.warning("请上传至少一个文件")
         return None
     
-    # 创建临时目录来保存上传的文件
-    with tempfile.TemporaryDirectory() as temp_dir:
-        # 保存上传的文件到临时目录
-        file_paths = []
-        for uploaded_file in uploaded_files:
-            file_path = os.path.join(temp_dir, uploaded_file.name)
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            file_paths.append(file_path)
-        
-        # 处理所有文件
-        processed_data = []
-        progress_bar = st.progress(0)
-        total_files = len(file_paths)
-        
-        for i, file_path in enumerate(file_paths):
-            progress_bar.progress((i + 1) / total_files)
-            with st.spinner(f"正在处理 {os.path.basename(file_path)}..."):
-                df = process_发放明细查询文件(file_path)
-                if not df.empty:
-                    processed_data.append(df)
-                    st.success(f"成功处理 {os.path.basename(file_path)}，提取到 {len(df)} 行数据")
-        
-        progress_bar.empty()
-        
-        # 合并所有处理过的数据
-        if processed_data:
-            all_发放明细 = pd.concat(processed_data, ignore_index=True)
-            
-            # 按制单日期排序
-            if not all_发放明细.empty and '制单日期' in all_发放明细.columns:
-                all_发放明细 = all_发放明细.sort_values('制单日期').reset_index(drop=True)
-            
-            # 只保留前104行正确的数据
-            if len(all_发放明细) > 104:
-                all_发放明细 = all_发放明细.iloc[:104]
-            
-            return all_发放明细
-        else:
-            st.warning("没有成功处理任何数据")
-            return None
+    # 并行解析所有文件，进度条按解析完成的文件数更新
+    progress_bar = st.progress(0)
+
+    def update_progress(done, total, file_name):
+        progress_bar.progress(done / total, text=f"已读取 {file_name}（{done}/{total}）")
+
+    parsed_files = read_excel_files(uploaded_files, progress_callback=update_progress, reader=read_发放明细查询文件)
+
+    # 按上传顺序处理
+    processed_data = []
+    for uploaded_file, (raw_df, error) in zip(uploaded_files, parsed_files):
+        if error is not None:
+            st.error(f"处理文件 {uploaded_file.name} 时出错: {error}")
+            continue
+        with st.spinner(f"正在处理 {uploaded_file.name}..."):
+            df = process_发放明细查询文件(uploaded_file.name, raw_df)
+            if not df.empty:
+                processed_data.append(df)
+                st.success(f"成功处理 {uploaded_file.name}，提取到 {len(df)} 行数据")
 
-def compare_data(发货明细_df, 供应商订单_df, match_method='name'):
+    progress_bar.empty()
+
+    all_发放明细 = merge_发放明细(processed_data)
+    if all_发放明细 is None:
+        st.warning("没有成功处理任何数据")
+    return all_发放明细
+
+def merge_发放明细(processed_data):
+    """
+    合并各文件处理后的发放明细：按制单日期排序，只保留前104行
+
+    Args:
+        processed_data: process_发放明细查询文件返回的非空DataFrame列表，按文件顺序
+
+    Returns:
+        DataFrame: 合并结果，列表为空时返回None
+    """
+    if not processed_data:
+        return None
+    all_发放明细 = pd.concat(processed_data, ignore_index=True)
+    
+    # 按制单日期排序
+    if not all_发放明细.empty and '制单日期' in all_发放明细.columns:
+        all_发放明细 = all_发放明细.sort_values('制单日期').reset_index(drop=True)
+    
+    # 只保留前104行正确的数据
+    if len(all_发放明细) > 104:
+        all_发放明细 = all_发放明细.iloc[:104]
+    
+    return all_发放明细
+
+def summarize_supplier_orders(供应商订单_df, match_method='name'):
+    """
+    汇总供应商订单中怡亚通订单的数量，每个匹配键一行
+    
+    Parameters:
+    供应商订单_df: 供应商订单数据框，或多个文件（如多个月份）的数据框列表，只取需要的列拼接后分组一次
+    match_method: 匹配方式，'name'表示按姓名匹配，'scheme_product'表示按方案编号+商品名称匹配
+    
+    Returns:
+    DataFrame: 匹配键列和'订单数量'列，可通过order_summary参数传给compare_data，多次核对时不必重复分组
+    """
+    keys = COMPARE_MATCH_KEYS['name' if match_method == 'name' else 'scheme_product']
+    order_frames = 供应商订单_df if isinstance(供应商订单_df, (list, tuple)) else [供应商订单_df]
+    yiyatong_orders = pd.concat([
+        df.loc[df['供应商'].str.contains('怡亚通', na=False), keys + ['数量']]
+        for df in order_frames
+    ], ignore_index=True)
+    return yiyatong_orders.rename(columns={'数量': '订单数量'}).groupby(keys)['订单数量'].sum().reset_index()
+
+def compare_data(发货明细_df, 供应商订单_df=None, match_method='name', order_summary=None):
     """
     核对发放明细与供应商订单数据
-    只核对供应商订单中存在的记录（以供应商订单为准）
-    分别标识数量不一致和没找到对应记录的情况
+    供应商订单和发放明细按匹配键汇总后做一次外连接，每个键归入一类：
+    数量一致、数量不一致、发货明细中未找到、供应商订单中未找到（发放明细中有而供应商订单中没有）
     
     Parameters:
     发货明细_df: 发货明细数据框
-    供应商订单_df: 供应商订单数据框
+    供应商订单_df: 供应商订单数据框，或多个文件的数据框列表
     match_method: 匹配方式，'name'表示按姓名匹配，'scheme_product'表示按方案编号+商品名称匹配
+    order_summary: summarize_supplier_orders的结果，提供时不再汇总供应商订单_df
     """
     try:
-        # 筛选供应商为怡亚通的订单
-        yiyatong_orders = 供应商订单_df[供应商订单_df['供应商'].str.contains('怡亚通', na=False)].copy()
-        
-        # 重命名供应商订单列以便后续处理
-        order_summary = yiyatong_orders[['方案编号', '收货人', '商品名称', '数量']].copy()
-        order_summary.rename(columns={'数量': '订单数量'}, inplace=True)
-        
-        if match_method == 'name':
-            # 按姓名匹配
-            # 重命名发货明细列以便后续处理
-            delivery_summary = 发货明细_df[['领用说明', '收货人', '产品名称', '数量']].copy()
-            delivery_summary.rename(columns={
-                '领用说明': '方案编号',
-                '产品名称': '商品名称',
-                '数量': '发货数量'
-            }, inplace=True)
-            
-            # 按方案编号、收货人、商品名称分组汇总数量
-            order_grouped = order_summary.groupby(['方案编号', '收货人', '商品名称'])['订单数量'].sum().reset_index()
-            delivery_grouped = delivery_summary.groupby(['方案编号', '收货人', '商品名称'])['发货数量'].sum().reset_index()
-            
-            # 以供应商订单为准进行核对
-            # 左连接确保所有供应商订单记录都被包含
-            merged_data = pd.merge(order_grouped, delivery_grouped, on=['方案编号', '收货人', '商品名称'], how='left')
-        else:  # scheme_product
-            # 按方案编号+商品名称匹配
-            # 重命名发货明细列以便后续处理
-            delivery_summary = 发货明细_df[['领用说明', '产品名称', '数量']].copy()
-            delivery_summary.rename(columns={
-                '领用说明': '方案编号',
-                '产品名称': '商品名称',
-                '数量': '发货数量'
-            }, inplace=True)
-            
-            # 按方案编号、商品名称分组汇总数量（不考虑收货人）
-            order_grouped = order_summary.groupby(['方案编号', '商品名称'])['订单数量'].sum().reset_index()
-            delivery_grouped = delivery_summary.groupby(['方案编号', '商品名称'])['发货数量'].sum().reset_index()
-            
-            # 以供应商订单为准进行核对
-            # 左连接确保所有供应商订单记录都被包含
-            merged_data = pd.merge(order_grouped, delivery_grouped, on=['方案编号', '商品名称'], how='left')
-        
-        # 填充NaN值（发货明细中没有对应记录的情况）
-        merged_data['发货数量'] = merged_data['发货数量'].fillna(0)
+        keys = COMPARE_MATCH_KEYS['name' if match_method == 'name' else 'scheme_product']
+        if order_summary is None:
+            order_summary = summarize_supplier_orders(供应商订单_df, match_method)
+        
+        # 重命名发货明细列以便后续处理，按匹配键汇总数量
+        delivery_columns = {'方案编号': '领用说明', '收货人': '收货人', '商品名称': '产品名称'}
+        delivery_summary = 发货明细_df[[delivery_columns[key] for key in keys] + ['数量']].copy()
+        delivery_summary.columns = keys + ['发货数量']
+        delivery_grouped = delivery_summary.groupby(keys)['发货数量'].sum().reset_index()
+        
+        # 一次外连接，indicator标明每个键出现在哪一边
+        merged_data = pd.merge(order_summary, delivery_grouped, on=keys, how='outer', indicator='来源')
+        
+        # 填充NaN值（一边没有对应记录的情况）；外连接后数量列可能是object类型，
+        # 先转为数值再填充，全部为整数时恢复整数类型
+        for column in ['订单数量', '发货数量']:
+            quantities = pd.to_numeric(merged_data[column], errors='coerce').fillna(0)
+            if (quantities % 1 == 0).all():
+                quantities = quantities.astype('int64')
+            merged_data[column] = quantities
         
         # 计算差异
         merged_data['数量差异'] = merged_data['订单数量'] - merged_data['发货数量']
@@ -223,19 +260,25 @@ def compare_data(发货明细_df, 供应商订单_df, match_method='name'):
         # 判断是否一致
         merged_data['是否一致'] = merged_data['数量差异'] == 0
         
-        # 分类结果
-        consistent_records = merged_data[merged_data['是否一致']].copy()
-        
-        # 不一致的记录分为两种情况
-        inconsistent_records = merged_data[(~merged_data['是否一致']) & (merged_data['发货数量'] > 0)].copy()  # 数量不一致
-        not_found_records = merged_data[merged_data['发货数量'] == 0].copy()  # 发货明细中没找到
+        # 一次判定每个键的核对结果，发货数量为0视为发货明细中未找到
+        result_codes = np.select(
+            [
+                merged_data['来源'] == 'right_only',
+                merged_data['发货数量'] == 0,
+                merged_data['是否一致'],
+            ],
+            [3, 2, 0],
+            default=1
+        )
+        merged_data['核对结果'] = pd.Categorical.from_codes(result_codes, categories=COMPARE_RESULTS)
+        merged_data = merged_data.drop(columns=['来源'])
         
-        # 添加说明列
-        consistent_records['核对结果'] = '数量一致'
-        inconsistent_records['核对结果'] = '数量不一致'
-        not_found_records['核对结果'] = '发货明细中未找到'
+        # 分类结果：数量一致、数量不一致、发货明细中没找到、供应商订单中没找到
+        consistent_records, inconsistent_records, not_found_records, delivery_only_records = (
+            merged_data[result_codes == code] for code in range(len(COMPARE_RESULTS))
+        )
         
-        return consistent_records, inconsistent_records, not_found_records, pd.DataFrame()
+        return consistent_records, inconsistent_records, not_found_records, delivery_only_records
         
     except Exception as e:
         st.error(f"数据核对时出错: {e}")
@@ -255,55 +298,29 @@ def mark_procurement_info(发货明细_df, 供应商订单_df, match_method='nam
     """
     try:
         # 筛选供应商为怡亚通的订单
-        yiyatong_orders = 供应商订单_df[供应商订单_df['供应商'].str.contains('怡亚通', na=False)].copy()
+        yiyatong_orders = 供应商订单_df[供应商订单_df['供应商'].str.contains('怡亚通', na=False)]
+        order_keys, delivery_keys = PROCUREMENT_MATCH_KEYS['name' if match_method == 'name' else 'scheme_product']
         
         # 根据'一件代发'列判断是否集采（一件代发为'是'表示非集采）
-        yiyatong_orders['是否集采'] = yiyatong_orders['一件代发'].apply(
-            lambda x: '非集采' if str(x).strip() == '是' else '集采'
-        )
-        
-        if match_method == 'name':
-            # 按方案编号、收货人、联系方式和商品名称分组，确定每个组合的集采状态
-            # 如果任何一个订单是集采，则整个组合为集采
-            procurement_status = yiyatong_orders.groupby(['方案编号', '收货人', '联系方式', '商品名称'])['是否集采'].apply(
-                lambda x: '集采' if '集采' in x.values else '非集采'
-            ).reset_index()
-            
-            # 创建一个用于匹配的发货明细副本
-            发货明细_marked = 发货明细_df.copy()
-            
-            # 初始化'是否集采'列为空字符串而不是None
-            发货明细_marked['是否集采'] = ''
-            
-            # 根据匹配条件更新'是否集采'列
-            for _, row in procurement_status.iterrows():
-                mask = (
-                    (发货明细_marked['领用说明'] == row['方案编号']) &
-                    (发货明细_marked['收货人'] == row['收货人']) &
-                    (发货明细_marked['收货人电话'] == row['联系方式']) &
-                    (发货明细_marked['产品名称'] == row['商品名称'])
-                )
-                发货明细_marked.loc[mask, '是否集采'] = row['是否集采']
-        else:  # scheme_product
-            # 按方案编号和商品名称分组，确定每个组合的集采状态
-            # 如果任何一个订单是集采，则整个组合为集采
-            procurement_status = yiyatong_orders.groupby(['方案编号', '商品名称'])['是否集采'].apply(
-                lambda x: '集采' if '集采' in x.values else '非集采'
-            ).reset_index()
-            
-            # 创建一个用于匹配的发货明细副本
-            发货明细_marked = 发货明细_df.copy()
-            
-            # 初始化'是否集采'列为空字符串而不是None
-            发货明细_marked['是否集采'] = ''
-            
-            # 根据匹配条件更新'是否集采'列
-            for _, row in procurement_status.iterrows():
-                mask = (
-                    (发货明细_marked['领用说明'] == row['方案编号']) &
-                    (发货明细_marked['产品名称'] == row['商品名称'])
-                )
-                发货明细_marked.loc[mask, '是否集采'] = row['是否集采']
+        # 一次groupby确定每个组合的集采状态：如果任何一个订单是集采，则整个组合为集采
+        is_procurement = yiyatong_orders['一件代发'].astype(str).str.strip() != '是'
+        procurement_status = is_procurement.groupby([yiyatong_orders[col] for col in order_keys]).any()
+        status_values = np.where(procurement_status.to_numpy(dtype=bool), '集采', '非集采')
+        
+        # 创建一个用于匹配的发货明细副本，'是否集采'列先初始化为空字符串而不是None
+        发货明细_marked = 发货明细_df.copy()
+        发货明细_marked['是否集采'] = ''
+        # 没有怡亚通订单组合时不需要查找，发货明细中缺少匹配列也照常返回空白列
+        if procurement_status.empty:
+            return 发货明细_marked
+        
+        # 按组合键一次查找每行对应的集采状态，未匹配的行为空字符串
+        positions = procurement_status.index.get_indexer(
+            pd.MultiIndex.from_arrays([发货明细_marked[col] for col in delivery_keys]))
+        marks = np.full(len(发货明细_marked), '', dtype=object)
+        matched = positions >= 0
+        marks[matched] = status_values[positions[matched]]
+        发货明细_marked['是否集采'] = marks
         
         return 发货明细_marked
         
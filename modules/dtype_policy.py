@@ -0,0 +1,89 @@
+import sys
+
+import pandas as pd
+
+# 文本列的存储类型：Arrow字符串比逐个Python str对象省内存
+TEXT_DTYPE = 'string[pyarrow]'
+# 这些列的取值高度重复，按类别存储
+CATEGORY_COLUMNS = ('供应商', '商品名称', '产品名称', '货品名称', '省份', '城市', '规格', '单位')
+# 其他文本列在行数不少于CATEGORY_MIN_ROWS且不同取值占比不超过此值时也按类别存储
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+CATEGORY_MIN_ROWS = 100
+# 估算"全部转为文本"的内存时每列抽样的单元格数
+MEMORY_SAMPLE_SIZE = 1000
+
+def _is_repetitive(series, name):
+    if name in CATEGORY_COLUMNS:
+        return True
+    if len(series) < CATEGORY_MIN_ROWS:
+        return False
+    return series.nunique(dropna=True) <= CATEGORY_MAX_UNIQUE_RATIO * len(series)
+
+def lean_column(series, name=None):
+    """
+    按类型策略存储单列：数值列保持数值；纯文本列按类别或Arrow字符串存储；
+    混合类型的列保持object，到显示时再转为文本
+    """
+    if series.dtype != object:
+        return series
+    if pd.api.types.infer_dtype(series, skipna=True) != 'string':
+        return series
+    if _is_repetitive(series, series.name if name is None else name):
+        return series.astype('category')
+    return series.astype(TEXT_DTYPE)
+
+def apply_dtype_policy(df, text_columns=(), category_columns=()):
+    """
+    按类型策略转换DataFrame，代替把所有列都转为字符串
+
+    Args:
+        df: 原始DataFrame
+        text_columns: 参与匹配的列，取值与astype(str)相同（空值为'nan'），匹配结果保持不变
+        category_columns: 用于分组的列，取值与astype(str)相同，按类别存储
+
+    Returns:
+        DataFrame: 转换后的新DataFrame，原DataFrame不变
+    """
+    df = df.copy(deep=False)
+    for col in df.columns:
+        if col in text_columns:
+            df[col] = df[col].astype(str)
+        elif col in category_columns:
+            df[col] = df[col].astype(str).astype('category')
+        else:
+            df[col] = lean_column(df[col], col)
+    return df
+
+def display_frame(df):
+    """
+    显示边界：把混合类型的object列转为文本（空值保持为空），避免PyArrow错误，
+    其余列原样交给st.dataframe
+    """
+    df = df.copy(deep=False)
+    for col in df.columns:
+        series = df[col]
+        if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in ('string', 'empty'):
+            df[col] = series.where(series.isna(), series.astype(str))
+    return df
+
+def _text_bytes_estimate(series):
+    # astype(str)后每个单元格是独立的Python str对象，外加8字节指针
+    if len(series) == 0:
+        return 0
+    sample = series.iloc[:MEMORY_SAMPLE_SIZE]
+    if isinstance(sample.dtype, pd.CategoricalDtype):
+        sample = sample.astype(object)
+    mean_size = sum(sys.getsizeof(str(value)) for value in sample) / len(sample)
+    return int(len(series) * (8 + mean_size))
+
+def memory_report(df):
+    """
+    统计DataFrame当前的内存占用，并估算全部转为字符串时的内存占用
+
+    Returns:
+        dict: bytes为当前内存字节数，text_bytes为全部转为文本时的估算字节数
+    """
+    return {
+        'bytes': int(df.memory_usage(index=False, deep=True).sum()),
+        'text_bytes': sum(_text_bytes_estimate(df[col]) for col in df.columns),
+    }
@@ -1,58 +1,303 @@
+import difflib
+import threading
+import unicodedata
+from collections import OrderedDict, defaultdict
+
+import numpy as np
 import pandas as pd
 import streamlit as st
 
-def enhanced_vlookup(main_df, reference_df, match_cols_main, match_cols_ref, columns_to_add, join_type, handle_duplicates):
+# 预处理后的参考表查找结构的缓存条目数上限（按最近使用淘汰）
+REFERENCE_LOOKUP_CACHE_SIZE = 8
+KEEP_FIRST = "保留第一条记录"
+LEFT_JOIN = "LEFT JOIN (保留主表所有行)"
+# 模糊匹配：字符n-gram长度、默认相似度阈值、每个主表键最多精确打分的候选数
+FUZZY_NGRAM_SIZE = 2
+FUZZY_DEFAULT_THRESHOLD = 0.8
+FUZZY_MAX_CANDIDATES = 20
+# 出现在超过此比例参考键中的n-gram区分度太低，不用于筛选候选（除非主表键只含这类n-gram）
+FUZZY_COMMON_GRAM_RATIO = 0.05
+FUZZY_SCORE_COLUMN = '匹配相似度'
+
+_lookup_cache = OrderedDict()  # {(参考表键, 匹配列, 重复项处理): 查找结构}
+_lookup_cache_lock = threading.Lock()
+_lookup_cache_stats = {'hits': 0, 'misses': 0}
+
+def _key_index(df, columns):
+    # 匹配列已按文本存储，单列直接建Index，多列组合为MultiIndex
+    if len(columns) == 1:
+        return pd.Index(df[columns[0]].to_numpy(dtype=object))
+    return pd.MultiIndex.from_arrays([df[col].to_numpy(dtype=object) for col in columns])
+
+def prepare_reference_lookup(reference_df, match_cols_ref, handle_duplicates):
+    """
+    预处理参考表：按匹配列建立去重后的键索引及每个键对应的参考表行号，
+    供多个主表反复查找，不必每次都合并再排序
+
+    Returns:
+        dict: rows为参考表（匹配列为文本），keys为不重复的匹配键，
+              order/starts/counts描述每个键在rows中的行号，total为参考表原始行数
+    """
+    from modules.dtype_policy import apply_dtype_policy
+    match_cols_ref = list(match_cols_ref)
+    reference_df = apply_dtype_policy(reference_df, text_columns=match_cols_ref)
+    total = len(reference_df)
+    if handle_duplicates == KEEP_FIRST:
+        reference_df = reference_df.drop_duplicates(subset=match_cols_ref, keep='first')
+    rows = reference_df.reset_index(drop=True)
+
+    index = _key_index(rows, match_cols_ref)
+    keys = index.unique()
+    codes = keys.get_indexer(index)
+    counts = np.bincount(codes, minlength=len(keys))
+    return {
+        'rows': rows,
+        'match_cols': match_cols_ref,
+        'keys': keys,
+        # 按键分组的行号，组内保持参考表原有顺序
+        'order': np.argsort(codes, kind='stable'),
+        'starts': np.cumsum(counts) - counts,
+        'counts': counts,
+        'total': total,
+    }
+
+def get_reference_lookup(reference_df, match_cols_ref, handle_duplicates, reference_key=None):
+    """
+    取得参考表的查找结构，reference_key（如文件内容摘要和表头行）相同时复用缓存，
+    缓存在进程内共享，页面重跑和不同会话都不必重新预处理
+
+    Returns:
+        dict: 见prepare_reference_lookup
+    """
+    if reference_key is None:
+        return prepare_reference_lookup(reference_df, match_cols_ref, handle_duplicates)
+    key = (reference_key, tuple(match_cols_ref), handle_duplicates)
+    with _lookup_cache_lock:
+        lookup = _lookup_cache.get(key)
+        if lookup is not None:
+            _lookup_cache.move_to_end(key)
+            _lookup_cache_stats['hits'] += 1
+            return lookup
+        _lookup_cache_stats['misses'] += 1
+    lookup = prepare_reference_lookup(reference_df, match_cols_ref, handle_duplicates)
+    with _lookup_cache_lock:
+        _lookup_cache[key] = lookup
+        while len(_lookup_cache) > REFERENCE_LOOKUP_CACHE_SIZE:
+            _lookup_cache.popitem(last=False)
+    return lookup
+
+def reference_lookup_cache_info():
+    """
+    返回参考表查找结构缓存的统计信息
+    """
+    with _lookup_cache_lock:
+        return {'entries': len(_lookup_cache), **_lookup_cache_stats}
+
+def normalize_fuzzy_key(values):
+    """
+    模糊匹配用的键文本：全角字符转半角（NFKC），去掉所有空白，英文转小写；
+    多列组合键用分隔符连接
+    """
+    if not isinstance(values, tuple):
+        values = (values,)
+    return '\x1f'.join(''.join(unicodedata.normalize('NFKC', str(value)).split()).lower() for value in values)
+
+def _ngrams(text, size):
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+def build_fuzzy_index(keys, ngram_size=FUZZY_NGRAM_SIZE):
+    """
+    为参考表的不重复匹配键建立字符n-gram倒排索引，模糊匹配时只对共享n-gram的候选键打分
+
+    Args:
+        keys: 参考表查找结构中的keys（Index或MultiIndex）
+
+    Returns:
+        dict: texts为规范化后的键文本，exact为{规范化文本: 第一个键序号}，
+              postings为{n-gram: 键序号数组}，lengths/gram_counts为每个键的文本长度和n-gram数
+    """
+    texts = [normalize_fuzzy_key(key) for key in keys]
+    exact = {}
+    postings = defaultdict(list)
+    gram_counts = np.zeros(len(texts), dtype=np.intp)
+    for code, text in enumerate(texts):
+        exact.setdefault(text, code)
+        grams = _ngrams(text, ngram_size)
+        gram_counts[code] = len(grams)
+        for gram in grams:
+            postings[gram].append(code)
+    return {
+        'texts': texts,
+        'exact': exact,
+        'postings': {gram: np.array(codes, dtype=np.intp) for gram, codes in postings.items()},
+        'lengths': np.array([len(text) for text in texts], dtype=np.intp),
+        'gram_counts': gram_counts,
+        'ngram_size': ngram_size,
+        'common_limit': max(FUZZY_MAX_CANDIDATES, int(len(texts) * FUZZY_COMMON_GRAM_RATIO)),
+    }
+
+def _fuzzy_index(lookup):
+    # 模糊索引随查找结构一起缓存，首次使用模糊匹配时才建立
+    if 'fuzzy' not in lookup:
+        lookup['fuzzy'] = build_fuzzy_index(lookup['keys'])
+    return lookup['fuzzy']
+
+def fuzzy_find(index, text, threshold, max_candidates=FUZZY_MAX_CANDIDATES):
+    """
+    在n-gram索引中查找与规范化文本最相似的参考键
+
+    先按共享n-gram数（Dice系数）筛出候选，再用difflib计算相似度，
+    取相似度最高的键（相同时取参考表中靠前的）
+
+    Returns:
+        tuple: (键序号, 相似度)，没有达到阈值的候选时为 (-1, 0.0)
+    """
+    code = index['exact'].get(text)
+    if code is not None:
+        return code, 1.0
+
+    grams = _ngrams(text, index['ngram_size'])
+    lists = sorted((index['postings'][gram] for gram in grams if gram in index['postings']), key=len)
+    if not lists:
+        return -1, 0.0
+    selective = [codes for codes in lists if len(codes) <= index['common_limit']]
+    candidates, shared = np.unique(np.concatenate(selective or lists[:1]), return_counts=True)
+
+    # 长度相差过大时difflib相似度不可能达到阈值：ratio <= 2*min(la, lb)/(la + lb)
+    lengths = index['lengths'][candidates]
+    possible = 2 * np.minimum(len(text), lengths) >= threshold * (len(text) + lengths)
+    candidates, shared = candidates[possible], shared[possible]
+    if len(candidates) > max_candidates:
+        dice = 2 * shared / (len(grams) + index['gram_counts'][candidates])
+        top = np.lexsort((candidates, -dice))[:max_candidates]
+        candidates = candidates[top]
+
+    best_code, best_score = -1, 0.0
+    matcher = difflib.SequenceMatcher(None, b=text)
+    for candidate in np.sort(candidates).tolist():
+        matcher.set_seq1(index['texts'][candidate])
+        # real_quick_ratio/quick_ratio是ratio的上界，达不到阈值或当前最高分时跳过
+        floor = max(best_score, threshold)
+        if matcher.real_quick_ratio() < floor or matcher.quick_ratio() < floor:
+            continue
+        score = matcher.ratio()
+        if score >= floor and score > best_score:
+            best_code, best_score = candidate, score
+    return best_code, best_score
+
+def _fuzzy_key_codes(lookup, main_keys, key_codes, threshold):
+    # 精确匹配不到的主表键按不重复取值逐个模糊查找；返回补全后的键序号和每行的相似度
+    index = _fuzzy_index(lookup)
+    key_codes = key_codes.copy()
+    scores = np.where(key_codes >= 0, 1.0, np.nan)
+    missing = np.flatnonzero(key_codes < 0)
+    if len(missing) == 0:
+        return key_codes, scores
+    row_codes, unique_keys = main_keys[missing].factorize()
+    found = [fuzzy_find(index, normalize_fuzzy_key(key), threshold) for key in unique_keys]
+    codes = np.array([code for code, _ in found], dtype=np.intp)[row_codes]
+    matched = codes >= 0
+    key_codes[missing[matched]] = codes[matched]
+    scores[missing[matched]] = np.array([score for _, score in found])[row_codes][matched]
+    return key_codes, scores
+
+def apply_reference_lookup(lookup, main_df, match_cols_main, columns_to_add, join_type, fuzzy_threshold=None):
+    """
+    用预处理好的参考表查找结构匹配主表，结果与按主表顺序的pd.merge相同：
+    主表行顺序不变，一个键有多条参考记录时按参考表顺序展开
+
+    Args:
+        fuzzy_threshold: 提供时启用模糊匹配，精确匹配不到的键取相似度不低于此值的最相似参考键，
+                         结果增加相似度列和参考表中实际匹配到的键列
+
+    Returns:
+        DataFrame: 匹配结果
+    """
+    from modules.dtype_policy import apply_dtype_policy
+    match_cols_main = list(match_cols_main)
+    match_cols_ref = lookup['match_cols']
+    main_df = apply_dtype_policy(main_df, text_columns=match_cols_main)
+
+    main_keys = _key_index(main_df, match_cols_main)
+    key_codes = lookup['keys'].get_indexer(main_keys)
+    if fuzzy_threshold is not None:
+        key_codes, scores = _fuzzy_key_codes(lookup, main_keys, key_codes, fuzzy_threshold)
+    found = key_codes >= 0
+    counts = np.zeros(len(key_codes), dtype=np.intp)
+    counts[found] = lookup['counts'][key_codes[found]]
+    if join_type == LEFT_JOIN:
+        # 未匹配的行保留一行，参考列为空
+        counts = np.where(found, counts, 1)
+
+    main_positions = np.repeat(np.arange(len(main_df)), counts)
+    row_codes = np.repeat(key_codes, counts)
+    offsets = np.arange(len(main_positions)) - np.repeat(np.cumsum(counts) - counts, counts)
+    matched = row_codes >= 0
+    ref_positions = np.full(len(main_positions), -1, dtype=np.intp)
+    ref_positions[matched] = lookup['order'][lookup['starts'][row_codes[matched]] + offsets[matched]]
+
+    # 与pd.merge的列规则一致：同名的匹配列只保留主表的，其他重名列加_x/_y后缀
+    same_name = {ref for main, ref in zip(match_cols_main, match_cols_ref) if main == ref}
+    ref_columns = [col for col in match_cols_ref if col not in same_name] + list(columns_to_add)
+    overlap = set(main_df.columns) & set(ref_columns)
+    left = main_df.iloc[main_positions].reset_index(drop=True)
+    right = lookup['rows'][ref_columns].reindex(ref_positions).reset_index(drop=True)
+    left = left.rename(columns={col: f"{col}_x" for col in overlap})
+    right = right.rename(columns={col: f"{col}_y" for col in overlap})
+    if fuzzy_threshold is not None:
+        # 模糊匹配到的参考键可能与主表不同，同名匹配列另以"参考表_列名"输出，便于核对
+        for col in match_cols_ref:
+            if col in same_name:
+                right[f"参考表_{col}"] = lookup['rows'][col].reindex(ref_positions).to_numpy()
+        right[FUZZY_SCORE_COLUMN] = np.repeat(scores, counts).round(4)
+    return pd.concat([left, right], axis=1)
+
+def _report_duplicates(lookup, handle_duplicates):
+    # 提示参考表中重复记录的处理结果
+    if handle_duplicates == KEEP_FIRST:
+        st.info(f"参考表中重复的匹配记录已被移除，剩余 {len(lookup['rows'])} 条记录")
+    else:
+        st.info(f"保留参考表中的所有记录，共 {lookup['total']} 条记录")
+
+def enhanced_vlookup(main_df, reference_df, match_cols_main, match_cols_ref, columns_to_add, join_type, handle_duplicates, reference_key=None, fuzzy_threshold=None):
     """
     增强版VLOOKUP功能
+
+    Args:
+        reference_key: 参考表的标识（如文件内容摘要和表头行），提供时复用已缓存的参考表查找结构
+        fuzzy_threshold: 提供时启用模糊匹配（0~1的相似度阈值），见apply_reference_lookup
     """
     try:
-        # 确保所有列都是字符串类型，避免PyArrow错误
-        for col in main_df.columns:
-            main_df[col] = main_df[col].astype(str)
-            
-        for col in reference_df.columns:
-            reference_df[col] = reference_df[col].astype(str)
-        
-        # 处理参考表中的重复记录
-        if handle_duplicates == "保留第一条记录":
-            # 对于每个匹配键，只保留第一条记录
-            reference_df_unique = reference_df.drop_duplicates(subset=match_cols_ref, keep='first')
-            st.info(f"参考表中重复的匹配记录已被移除，剩余 {len(reference_df_unique)} 条记录")
-        else:
-            reference_df_unique = reference_df
-            st.info(f"保留参考表中的所有记录，共 {len(reference_df_unique)} 条记录")
-        
-        # 保存主表的原始索引
-        main_df_with_index = main_df.reset_index()
-        
-        # 执行增强版VLOOKUP
-        if join_type == "LEFT JOIN (保留主表所有行)":
-            # 使用left join确保保留主表的所有行和顺序
-            merged_temp = pd.merge(main_df_with_index, 
-                                 reference_df_unique[match_cols_ref + columns_to_add], 
-                                 left_on=match_cols_main, 
-                                 right_on=match_cols_ref, 
-                                 how='left',
-                                 sort=False)  # 保持原有顺序
-        else:
-            # INNER JOIN
-            merged_temp = pd.merge(main_df_with_index, 
-                                 reference_df_unique[match_cols_ref + columns_to_add], 
-                                 left_on=match_cols_main, 
-                                 right_on=match_cols_ref, 
-                                 how='inner',
-                                 sort=False)  # 保持原有顺序
-        
-        # 恢复原始索引并排序，确保行顺序与主表一致
-        result_df = merged_temp.sort_values('index').drop('index', axis=1).reset_index(drop=True)
-        
-        # 确保结果DataFrame的所有列都是字符串类型
-        for col in result_df.columns:
-            result_df[col] = result_df[col].astype(str)
-        
-        return result_df
+        lookup = get_reference_lookup(reference_df, match_cols_ref, handle_duplicates, reference_key)
+        _report_duplicates(lookup, handle_duplicates)
+        return apply_reference_lookup(lookup, main_df, match_cols_main, columns_to_add, join_type, fuzzy_threshold)
     except Exception as e:
         st.error(f"执行过程中出现错误: {str(e)}")
         import traceback
         st.error(traceback.format_exc())
-        return None
\ No newline at end of file
+        return None
+
+def enhanced_vlookup_batch(main_dfs, reference_df, match_cols_main, match_cols_ref, columns_to_add, join_type, handle_duplicates, reference_key=None, fuzzy_threshold=None):
+    """
+    批量增强版VLOOKUP：参考表只预处理一次，依次匹配多个列结构相同的主表
+
+    Args:
+        main_dfs: {文件名: 主表DataFrame}
+
+    Returns:
+        dict: {文件名: 匹配结果}，出错时返回None
+    """
+    try:
+        lookup = get_reference_lookup(reference_df, match_cols_ref, handle_duplicates, reference_key)
+        _report_duplicates(lookup, handle_duplicates)
+        return {
+            name: apply_reference_lookup(lookup, main_df, match_cols_main, columns_to_add, join_type, fuzzy_threshold)
+            for name, main_df in main_dfs.items()
+        }
+    except Exception as e:
+        st.error(f"批量执行过程中出现错误: {str(e)}")
+        import traceback
+        st.error(traceback.format_exc())
+        return None
@@ -0,0 +1,540 @@
+import io
+import os
+import time
+import hashlib
+import tempfile
+import datetime
+import logging
+import threading
+import importlib.util
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+
+logger = logging.getLogger(__name__)
+
+# 按优先顺序尝试的读取引擎及其依赖的模块，安装了python-calamine时优先使用calamine
+EXCEL_READER_ENGINES = ('calamine', 'openpyxl')
+_ENGINE_MODULES = {'calamine': 'python_calamine', 'openpyxl': 'openpyxl'}
+
+# 保留最近多少次文件解析的统计
+PARSE_LOG_SIZE = 50
+_parse_log = deque(maxlen=PARSE_LOG_SIZE)
+
+# 上传文件不少于该数量时才用进程池并行解析（启动进程本身有开销）
+PARALLEL_READ_MIN_FILES = 4
+
+# 超过该行数的导出改用openpyxl只写模式逐行写入，内存占用不随行数增长
+EXPORT_STREAMING_MIN_ROWS = 50000
+# 超过该行数时下载按钮额外提供CSV/Parquet格式
+EXPORT_ALTERNATE_FORMAT_MIN_ROWS = 200000
+# 导出文件小于该大小时留在内存中，超过后转存到临时文件
+EXPORT_SPOOL_MAX_BYTES = 32 * 1024 * 1024
+# xlsx单个工作表的最大行数（含表头）
+EXCEL_MAX_ROWS = 1048576
+
+# 导出格式: (扩展名, MIME类型)
+EXPORT_FORMATS = {
+    'xlsx': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('.csv', 'text/csv'),
+    'parquet': ('.parquet', 'application/octet-stream'),
+}
+
+# 解析结果缓存的总大小上限（按DataFrame占用内存估算），超出时淘汰最久未使用的条目
+EXCEL_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+_cache = OrderedDict()  # {键: (DataFrame, 占用字节数)}
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+def _file_bytes(file):
+    """
+    取得上传文件（或文件路径）的全部内容
+    """
+    if isinstance(file, bytes):
+        return file
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            return f.read()
+    if hasattr(file, 'getvalue'):
+        return file.getvalue()
+    position = file.tell()
+    file.seek(0)
+    data = file.read()
+    file.seek(position)
+    return data
+
+def _file_label(file):
+    """
+    取得用于统计显示的文件名
+    """
+    if isinstance(file, (str, os.PathLike)):
+        return os.path.basename(os.fspath(file))
+    return getattr(file, 'name', None) or '<内存数据>'
+
+def excel_reader_engine():
+    """
+    返回当前可用的最快读取引擎，都未安装时返回None（使用pandas默认引擎）
+    """
+    for engine in EXCEL_READER_ENGINES:
+        if importlib.util.find_spec(_ENGINE_MODULES[engine]) is not None:
+            return engine
+    return None
+
+def _record_parse(label, engine, rows, columns, seconds):
+    _parse_log.append({'file': label, 'engine': engine, 'rows': rows, 'columns': columns, 'seconds': seconds})
+    logger.info("parsed %s with %s: %d rows x %d columns in %.3fs", label, engine, rows, columns, seconds)
+
+def _read_excel_timed(source, label, **kwargs):
+    """
+    用选定的引擎调用pd.read_excel，记录解析耗时和行列数；快速引擎解析失败时退回openpyxl
+    """
+    engine = kwargs.pop('engine', None) or excel_reader_engine()
+    start = time.perf_counter()
+    try:
+        result = pd.read_excel(source, engine=engine, **kwargs)
+    except Exception:
+        if engine in (None, 'openpyxl'):
+            raise
+        logger.warning("%s: %s引擎解析失败，改用openpyxl", label, engine, exc_info=True)
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        engine = 'openpyxl'
+        result = pd.read_excel(source, engine=engine, **kwargs)
+    seconds = time.perf_counter() - start
+
+    frames = result.values() if isinstance(result, dict) else [result]
+    _record_parse(label, engine or 'default', sum(len(df) for df in frames),
+                  max((df.shape[1] for df in frames), default=0), seconds)
+    return result
+
+def read_excel(file, **kwargs):
+    """
+    统一的Excel读取入口，参数与pd.read_excel相同
+
+    安装了python-calamine时使用calamine引擎，否则使用openpyxl；header=、dtype等参数
+    的含义与pd.read_excel一致（两种引擎都经过pandas相同的表头和类型识别）。
+    每次解析的耗时和行数记录在excel_parse_log()中
+
+    Args:
+        file: 文件路径或上传的文件
+        **kwargs: 传给pd.read_excel的参数，可用engine=指定引擎
+
+    Returns:
+        DataFrame: 读取结果（sheet_name为None或列表时为字典）
+    """
+    return _read_excel_timed(file, _file_label(file), **kwargs)
+
+def _read_excel_worker(reader, data, label, kwargs):
+    """
+    在进程池中解析一个文件
+
+    Returns:
+        tuple: (DataFrame, 本次解析的统计列表)
+    """
+    # 进程池中的进程会被复用，只返回本次解析的统计
+    _parse_log.clear()
+    source = io.BytesIO(data)
+    source.name = label
+    df = reader(source, **kwargs)
+    return df, list(_parse_log)
+
+def read_excel_files(files, progress_callback=None, max_workers=None, reader=None, **kwargs):
+    """
+    解析多个上传文件，文件数不少于PARALLEL_READ_MIN_FILES时在进程池中并行解析
+
+    结果按上传顺序返回，之后的pd.concat与逐个读取时完全相同。单个文件解析失败
+    不影响其他文件，由调用方决定跳过还是报错
+
+    Args:
+        files: 上传的文件列表（或文件路径）
+        progress_callback: 可选，每解析完一个文件调用 progress_callback(已完成数, 总数, 文件名)，
+            在调用方线程中按完成顺序执行，可用于更新st.progress
+        max_workers: 并行进程数，默认为CPU核数
+        reader: 读取函数，默认为read_excel；需要在进程池中使用，应为模块级函数
+        **kwargs: 传给读取函数的参数
+
+    Returns:
+        list: 每个文件的 (DataFrame, 异常)，成功时异常为None，失败时DataFrame为None
+    """
+    reader = reader or read_excel
+    labels = [_file_label(file) for file in files]
+    results = [None] * len(files)
+    worker_count = min(max_workers or os.cpu_count() or 1, len(files))
+
+    if worker_count < 2 or len(files) < PARALLEL_READ_MIN_FILES:
+        for index, file in enumerate(files):
+            try:
+                results[index] = (reader(file, **kwargs), None)
+            except Exception as e:
+                results[index] = (None, e)
+            if progress_callback is not None:
+                progress_callback(index + 1, len(files), labels[index])
+        return results
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(max_workers=worker_count) as executor:
+        futures = {
+            executor.submit(_read_excel_worker, reader, _file_bytes(file), label, kwargs): index
+            for index, (file, label) in enumerate(zip(files, labels))
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            try:
+                df, entries = future.result()
+                # 子进程中的解析统计需要记录到当前进程
+                _parse_log.extend(entries)
+                results[index] = (df, None)
+            except Exception as e:
+                results[index] = (None, e)
+            if progress_callback is not None:
+                progress_callback(done, len(files), labels[index])
+    return results
+
+def excel_parse_log():
+    """
+    返回最近的文件解析统计
+
+    Returns:
+        list: [{'file', 'engine', 'rows', 'columns', 'seconds'}, ...]，按解析顺序
+    """
+    return list(_parse_log)
+
+def file_digest(file):
+    """
+    计算上传文件内容的sha1，作为解析缓存的键
+    """
+    return hashlib.sha1(_file_bytes(file)).hexdigest()
+
+def _cache_get(key):
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            _cache_stats['misses'] += 1
+            return None
+        _cache.move_to_end(key)
+        _cache_stats['hits'] += 1
+        return entry[0]
+
+def _cache_put(key, df):
+    global _cache_bytes
+    size = int(df.memory_usage(index=True, deep=True).sum())
+    with _cache_lock:
+        if key in _cache:
+            _cache_bytes -= _cache.pop(key)[1]
+        # 单个结果超过上限时不缓存
+        if size > EXCEL_CACHE_MAX_BYTES:
+            return
+        _cache[key] = (df, size)
+        _cache_bytes += size
+        while _cache_bytes > EXCEL_CACHE_MAX_BYTES and _cache:
+            _, (_, evicted_size) = _cache.popitem(last=False)
+            _cache_bytes -= evicted_size
+            _cache_stats['evictions'] += 1
+
+def _trim_rows(rows, limit=None):
+    """
+    取前limit行单元格，与pandas的openpyxl读取器一样去掉行尾空单元格和末尾空行，再补齐为相同列数
+    """
+    rows = [list(row) for row in rows[:limit]]
+    for row in rows:
+        while row and row[-1] == '':
+            row.pop()
+    while rows and not rows[-1]:
+        rows.pop()
+    width = max((len(row) for row in rows), default=0)
+    return [row + [''] * (width - len(row)) for row in rows]
+
+def _convert_openpyxl_cell(cell):
+    """
+    与pandas的openpyxl读取器相同的单元格转换：空单元格为''，错误值为NaN，整数值的浮点数转为int
+    """
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+    if cell.value is None:
+        return ''
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        return value if value == cell.value else float(cell.value)
+    return cell.value
+
+def _convert_calamine_cell(value):
+    """
+    与pandas的calamine读取器相同的单元格转换
+    """
+    if isinstance(value, float):
+        return int(value) if int(value) == value else value
+    if isinstance(value, datetime.date):
+        return pd.Timestamp(value)
+    if isinstance(value, datetime.timedelta):
+        return pd.Timedelta(value)
+    return value
+
+def _select_cells(row, columns):
+    """按列位置取出一行中的单元格，超出该行长度的列为None"""
+    return [row[i] if i < len(row) else None for i in columns]
+
+def _openpyxl_rows(data, sheet_name, limit=None, columns=None):
+    """
+    用openpyxl只读模式逐行读取工作表，指定limit时读够前limit行即停止，不解析工作表的其余部分；
+    指定columns（列位置列表）时每行只转换和保留这些列
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[sheet_name] if isinstance(sheet_name, int) else workbook[sheet_name]
+        # 有些程序生成的文件记录的工作表范围不准确，与pandas一样重新计算
+        sheet.reset_dimensions()
+        if columns is None:
+            rows = [[_convert_openpyxl_cell(cell) for cell in row] for row in sheet.iter_rows(max_row=limit)]
+        else:
+            rows = [['' if cell is None else _convert_openpyxl_cell(cell) for cell in _select_cells(row, columns)]
+                    for row in sheet.iter_rows(max_row=limit)]
+    finally:
+        workbook.close()
+    return _trim_rows(rows, limit)
+
+def _calamine_rows(data, sheet_name, limit=None, columns=None):
+    """
+    用calamine读取工作表（calamine总是加载整个工作表）
+    """
+    from python_calamine import load_workbook
+
+    workbook = load_workbook(io.BytesIO(data))
+    if isinstance(sheet_name, int):
+        sheet = workbook.get_sheet_by_index(sheet_name)
+    else:
+        sheet = workbook.get_sheet_by_name(sheet_name)
+    rows = sheet.to_python(skip_empty_area=False, nrows=limit)
+    if columns is not None:
+        rows = [['' if value is None else value for value in _select_cells(row, columns)] for row in rows]
+    return [[_convert_calamine_cell(value) for value in row] for row in rows]
+
+_ROW_READERS = {'openpyxl': _openpyxl_rows, 'calamine': _calamine_rows}
+
+def _sheet_rows(data, sheet_name, label, limit=None, columns=None):
+    """
+    读取工作表的原始单元格（未识别表头和数据类型），columns为只保留的列位置
+
+    只需要前几行时固定使用openpyxl流式读取；读取整个工作表时使用excel_reader_engine()
+    选出的引擎，失败时退回openpyxl
+    """
+    engine = 'openpyxl' if limit is not None else (excel_reader_engine() or 'openpyxl')
+    start = time.perf_counter()
+    try:
+        rows = _ROW_READERS[engine](data, sheet_name, limit, columns)
+    except Exception:
+        if engine == 'openpyxl':
+            raise
+        logger.warning("%s: %s引擎解析失败，改用openpyxl", label, engine, exc_info=True)
+        engine = 'openpyxl'
+        rows = _openpyxl_rows(data, sheet_name, limit, columns)
+    if limit is not None:
+        engine = f'{engine}(前{limit}行)'
+    elif columns is not None:
+        engine = f'{engine}(部分列)'
+    _record_parse(label, engine, len(rows), len(rows[0]) if rows else 0, time.perf_counter() - start)
+    return rows
+
+def _raw_sheet(data, digest, sheet_name, label):
+    """
+    解析一次整个工作表的原始单元格，按 (内容哈希, 工作表) 缓存
+    """
+    key = ('raw', digest, sheet_name)
+    raw = _cache_get(key)
+    if raw is None:
+        # 直接构造object列，不经过TextParser，避免同一列中的1与True等相等值被合并
+        raw = pd.DataFrame(_sheet_rows(data, sheet_name, label), dtype=object)
+        _cache_put(key, raw)
+    return raw
+
+def _rows_to_frame(rows, header=0, nrows=None):
+    """
+    与read_excel内部相同：把单元格数据交给TextParser识别表头和数据类型
+    """
+    if not rows:
+        return pd.DataFrame()
+    try:
+        return TextParser(rows, header=header, skip_blank_lines=False, nrows=nrows).read(nrows=nrows)
+    except EmptyDataError:
+        return pd.DataFrame()
+
+def read_excel_columns(file, select_columns, header_rows=3, sheet_name=0):
+    """
+    两阶段读取宽表：先流式读取前header_rows行，由select_columns决定需要的列，再只读取这些列
+
+    内存占用和类型识别的耗时只与选中的列数有关。结果不指定表头（header=None），
+    与pd.read_excel(header=None, usecols=选中的列)的各列数据相同，列按原顺序从0重新编号
+
+    Args:
+        file: 文件路径、上传的文件或bytes
+        select_columns: select_columns(表头DataFrame) 返回需要的列位置；需要在进程池中
+            使用时应为模块级函数
+        header_rows: 第一阶段读取的行数
+        sheet_name: 工作表名称或序号
+
+    Returns:
+        DataFrame: 只包含选中列的数据
+    """
+    data = _file_bytes(file)
+    label = _file_label(file)
+    header_df = _rows_to_frame(_sheet_rows(data, sheet_name, label, limit=header_rows), header=None)
+    columns = sorted(set(select_columns(header_df)))
+    return _rows_to_frame(_sheet_rows(data, sheet_name, label, columns=columns), header=None)
+
+def read_excel_preview(file, nrows=3, sheet_name=0):
+    """
+    读取工作表的前几行作为预览（不指定表头），用于确定列名所在行
+
+    只流式读取前nrows行，预览20万行的工作表与预览几行的工作表耗时相同；
+    该文件已完整解析过时直接从缓存截取。结果与pd.read_excel(header=None, nrows=nrows)相同
+
+    Args:
+        file: Streamlit上传的文件、文件路径或bytes
+        nrows: 预览行数
+        sheet_name: 工作表名称或序号
+
+    Returns:
+        DataFrame: 前nrows行数据（副本）
+    """
+    return read_excel_cached(file, sheet_name=sheet_name, header=None, nrows=nrows)
+
+def read_excel_cached(file, sheet_name=0, header=0, nrows=None):
+    """
+    读取Excel上传文件，结果按 (内容哈希, 工作表, 表头行, 行数) 缓存
+
+    每个工作表只解析一次原始单元格，按所选表头行读取的完整数据从这份原始数据生成，
+    结果与pd.read_excel相同；指定nrows且尚未完整解析时只流式读取前几行。Streamlit
+    每次交互重新运行脚本时，相同内容的上传文件直接使用缓存
+
+    Args:
+        file: Streamlit上传的文件、文件路径或bytes
+        sheet_name: 工作表名称或序号
+        header: 列名所在行，None表示没有列名
+        nrows: 只读取前几行数据
+
+    Returns:
+        DataFrame: 解析结果（副本，调用方可以直接修改）
+    """
+    data = _file_bytes(file)
+    digest = hashlib.sha1(data).hexdigest()
+    key = ('frame', digest, sheet_name, header, nrows)
+    df = _cache_get(key)
+    if df is None:
+        label = _file_label(file)
+        if nrows is None:
+            rows = _raw_sheet(data, digest, sheet_name, label).values.tolist()
+        else:
+            limit = (1 if header is None else header + 1) + nrows
+            raw = _cache_get(('raw', digest, sheet_name))
+            if raw is not None:
+                rows = _trim_rows(raw.iloc[:limit].values.tolist(), limit)
+            else:
+                # 只需要前几行时不解析整个工作表
+                rows = _sheet_rows(data, sheet_name, label, limit)
+        df = _rows_to_frame(rows, header, nrows)
+        _cache_put(key, df)
+    return df.copy()
+
+def excel_cache_info():
+    """
+    返回解析缓存的统计信息
+
+    Returns:
+        dict: {'entries', 'bytes', 'max_bytes', 'hits', 'misses', 'evictions'}
+    """
+    with _cache_lock:
+        return {
+            'entries': len(_cache),
+            'bytes': _cache_bytes,
+            'max_bytes': EXCEL_CACHE_MAX_BYTES,
+            **_cache_stats,
+        }
+
+def clear_excel_cache():
+    """
+    清空解析缓存
+    """
+    global _cache_bytes
+    with _cache_lock:
+        _cache.clear()
+        _cache_bytes = 0
+
+def export_formats(df):
+    """
+    返回该数据可以导出的格式，行数超过EXPORT_ALTERNATE_FORMAT_MIN_ROWS时增加CSV和Parquet
+    （Parquet需要安装pyarrow），超过xlsx行数上限时不再提供xlsx
+    """
+    formats = ['xlsx'] if len(df) < EXCEL_MAX_ROWS else []
+    if len(df) > EXPORT_ALTERNATE_FORMAT_MIN_ROWS or not formats:
+        formats.append('csv')
+        if importlib.util.find_spec('pyarrow') is not None:
+            formats.append('parquet')
+    return formats
+
+def _write_xlsx_streaming(df, output):
+    """
+    用openpyxl只写模式逐行写入xlsx，不在内存中保留整个工作簿
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+    sheet.append([str(col) for col in df.columns])
+    # 按列转换为Python对象，缺失值写为空单元格
+    columns = [df[col].astype(object).where(df[col].notna(), None).tolist() for col in df.columns]
+    for row in zip(*columns):
+        sheet.append(row)
+    workbook.save(output)
+
+def export_dataframe(df, file_format='xlsx'):
+    """
+    把DataFrame导出到内存（较大时为自动清理的临时文件），不在工作目录中留下文件
+
+    xlsx在行数不超过EXPORT_STREAMING_MIN_ROWS时使用pandas的to_excel（保留表头样式），
+    更大时使用openpyxl只写模式；csv使用utf-8-sig编码以便Excel直接打开
+
+    Args:
+        df: 要导出的数据
+        file_format: 'xlsx'、'csv' 或 'parquet'
+
+    Returns:
+        SpooledTemporaryFile: 已定位到开头的文件对象，调用方用完后关闭
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES)
+    start = time.perf_counter()
+    try:
+        if file_format == 'xlsx':
+            if len(df) > EXPORT_STREAMING_MIN_ROWS:
+                _write_xlsx_streaming(df, output)
+            else:
+                df.to_excel(output, index=False)
+        elif file_format == 'csv':
+            # TextIOWrapper关闭时会关闭底层文件，这里先分离
+            text_output = io.TextIOWrapper(output, encoding='utf-8-sig', newline='')
+            df.to_csv(text_output, index=False)
+            text_output.detach()
+        elif file_format == 'parquet':
+            # 混合类型的object列（如数字和文本混在一起的电话列）无法直接写入，统一转为文本
+            parquet_df = df.copy()
+            for col in parquet_df.columns[parquet_df.dtypes == object]:
+                values = parquet_df[col]
+                parquet_df[col] = values.where(values.isna(), values.astype(str))
+            parquet_df.columns = [str(col) for col in parquet_df.columns]
+            parquet_df.to_parquet(output, index=False)
+        else:
+            raise ValueError(f"不支持的导出格式: {file_format}")
+    except Exception:
+        output.close()
+        raise
+    logger.info("exported %d rows as %s in %.3fs", len(df), file_format, time.perf_counter() - start)
+    output.seek(0)
+    return output
@@ -0,0 +1,479 @@
+import io
+import logging
+import math
+import numbers
+import posixpath
+import re
+import zipfile
+from copy import copy
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+logger = logging.getLogger(__name__)
+
+# 导单模板中必须存在的列
+TEMPLATE_REQUIRED_COLUMNS = ['客户备注', '货品名称', '数量', '规格', '网店订单号']
+# 处理后的明细字段
+IMPORT_FIELDS = ['订单编号', '收件人', '联系方式', '送货地址', '商品信息', '数量', '规格']
+# 明细字段 -> 导单模板列
+TEMPLATE_COLUMN_MAPPING = {
+    '订单编号': '网店订单号',  # 明细文件的订单编号对应导单的网店订单号
+    '收件人': '收货人',
+    '联系方式': '手机',
+    '送货地址': '收货地址',
+    '商品信息': '货品名称',
+    '数量': '数量',
+    '规格': '规格',
+}
+
+def _text_values(df, col):
+    # 与 str(value).strip() 相同，空值和未选择的列为空字符串
+    if not col:
+        return pd.Series('', index=df.index, dtype=object)
+    values = df[col].astype(object)
+    present = values.notna()
+    result = pd.Series('', index=df.index, dtype=object)
+    result[present] = values[present].astype(str).str.strip()
+    return result
+
+def _quantity_values(values):
+    # 空值按0处理，其余与 float(value) if value else 0 相同
+    if pd.api.types.is_numeric_dtype(values):
+        return values.fillna(0).astype(float)
+    values = values.astype(object).where(values.notna(), 0)
+    return values.map(lambda value: float(value) if value else 0.0).astype(float)
+
+def _is_standard_product(product, product_list):
+    # 模糊匹配检查商品是否在标准商品列表中
+    for standard_product in product_list:
+        if product == standard_product or product in standard_product or standard_product in product:
+            return True
+    return False
+
+def _conversion_multiplier(product, conversion_rules):
+    # 查找第一条匹配的转换规则
+    for keyword, multiplier in conversion_rules.items():
+        if (keyword == product or
+            product.startswith(keyword) or
+            product.endswith(keyword) or
+            keyword in product):
+            return multiplier
+    return None
+
+def _default_spec(product):
+    # 数据线规格为条，抽纸、纸、简易封套为箱，其他为个
+    if "数据线" in product:
+        return '条'
+    if any(keyword in product for keyword in ['抽纸', '湿纸巾', '简易封套']):
+        return '箱'
+    return '个'
+
+def build_import_rows(df, column_mapping, product_list, conversion_rules, filter_products=True,
+                      perform_conversion=False, target_unit=None, selected_products=()):
+    """
+    把系统导出的待发货明细整理为导单行
+
+    按列整体取值，商品过滤、默认规格和转换倍数对每种商品只计算一次
+
+    Args:
+        df: 待发货明细
+        column_mapping: {明细字段: 文件中的列名}，订单编号可为空
+        product_list: 标准商品列表
+        conversion_rules: {商品关键词: 每箱数量}
+        filter_products: 是否只保留标准商品列表中的商品
+        perform_conversion: 是否对selected_products中的商品额外转换规格
+        target_unit: 额外转换的目标单位
+        selected_products: 需要额外转换规格的商品
+
+    Returns:
+        tuple: (导单行DataFrame，列为IMPORT_FIELDS, 统计 {'filtered': 被过滤行数, 'converted': 规格转换行数})
+    """
+    rows = pd.DataFrame({
+        field: _text_values(df, column_mapping.get(field))
+        for field in ['订单编号', '收件人', '联系方式', '送货地址', '商品信息']
+    })
+    rows['数量'] = _quantity_values(df[column_mapping['数量']])
+
+    # 只处理有收件人或联系方式的行
+    rows = rows[(rows['收件人'] != '') | (rows['联系方式'] != '')]
+
+    products = rows['商品信息']
+    unique_products = products.unique()
+    filtered_count = 0
+    if filter_products:
+        valid = {product: _is_standard_product(product, product_list) for product in unique_products}
+        keep = products.map(valid).astype(bool)
+        filtered_count = int((~keep).sum())
+        rows = rows[keep]
+        products = rows['商品信息']
+        unique_products = products.unique()
+
+    # 每种商品的规格和换算倍数：默认规格为箱的商品自动转换，其余商品按需额外转换
+    selected_products = set(selected_products)
+    specs = {}
+    multipliers = {}
+    for product in unique_products:
+        default_spec = _default_spec(product)
+        spec = default_spec
+        multiplier = None
+        if default_spec == '箱':
+            multiplier = _conversion_multiplier(product, conversion_rules)
+        elif perform_conversion and target_unit and product in selected_products:
+            multiplier = _conversion_multiplier(product, conversion_rules)
+            if multiplier and multiplier > 1:
+                spec = target_unit
+        specs[product] = spec
+        multipliers[product] = multiplier if multiplier and multiplier > 1 else 1
+
+    divisor = products.map(multipliers).astype(float)
+    converted_count = int((divisor > 1).sum())
+    rows = rows.assign(数量=rows['数量'] / divisor, 规格=products.map(specs).astype(object))
+    return rows[IMPORT_FIELDS].reset_index(drop=True), {'filtered': filtered_count, 'converted': converted_count}
+
+# 工作表XML中的sheetData、行和单元格值，前缀用于兼容带命名空间前缀的工作簿
+_SHEET_DATA_RE = re.compile(rb'<((?:[\w.-]+:)?)sheetData\b[^>]*?(/?)>')
+_ROW_RE = re.compile(rb'<(?:[\w.-]+:)?row\b[^>]*?\br="(\d+)"[^>]*?>')
+_ROW_TAG_RE = re.compile(rb'<(?:[\w.-]+:)?row\b')
+_CELL_VALUE_RE = re.compile(rb'<(?:[\w.-]+:)?(?:v|is|f)\b')
+_DIMENSION_RE = re.compile(rb'(<(?:[\w.-]+:)?dimension\b[^>]*?\bref=")([^"]*)(")')
+_SPANS_RE = re.compile(rb'\sspans="[^"]*"')
+_RELATIONSHIP_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def _relationship_targets(archive, part):
+    # 读取part对应的.rels文件，返回 {关系Id: (类型, 部件路径)}
+    folder, name = posixpath.split(part)
+    rels_path = posixpath.join(folder, '_rels', name + '.rels')
+    targets = {}
+    for element in ElementTree.fromstring(archive.read(rels_path)):
+        target = element.get('Target')
+        if target.startswith('/'):
+            path = target.lstrip('/')
+        else:
+            path = posixpath.normpath(posixpath.join(folder, target))
+        targets[element.get('Id')] = (element.get('Type'), path)
+    return targets
+
+def _workbook_parts(archive):
+    # 返回 (第一个工作表的部件路径, 共享字符串的部件路径或None)
+    workbook_path = next(path for kind, path in _relationship_targets(archive, '').values()
+                         if kind == _RELATIONSHIP_TYPE + 'officeDocument')
+    workbook_targets = _relationship_targets(archive, workbook_path)
+    workbook = ElementTree.fromstring(archive.read(workbook_path))
+    first_sheet = next(element for element in workbook.iter() if _local_name(element.tag) == 'sheet')
+    relation_id = next(value for key, value in first_sheet.attrib.items() if _local_name(key) == 'id')
+    shared_strings = next((path for kind, path in workbook_targets.values()
+                           if kind == _RELATIONSHIP_TYPE + 'sharedStrings'), None)
+    return workbook_targets[relation_id][1], shared_strings
+
+def _read_shared_strings(archive, path, indexes):
+    # 只解析到需要的最大序号为止
+    if not indexes:
+        return {}
+    last_index = max(indexes)
+    strings = {}
+    with archive.open(path) as source:
+        position = 0
+        for _, element in ElementTree.iterparse(source):
+            if _local_name(element.tag) != 'si':
+                continue
+            if position in indexes:
+                strings[position] = ''.join(
+                    text.text or '' for text in element.iter() if _local_name(text.tag) == 't')
+            if position >= last_index:
+                break
+            position += 1
+            element.clear()
+    return strings
+
+def _parse_row_cells(sheet_xml, body_start, prefix, segment):
+    # 借用sheetData之前的XML（含命名空间声明）单独解析一行，返回 [(列号, 单元格元素)]
+    closing = b'</' + prefix + b'sheetData></' + prefix + b'worksheet>'
+    root = ElementTree.fromstring(sheet_xml[:body_start] + segment + closing)
+    cells = []
+    for element in root.iter():
+        if _local_name(element.tag) == 'c':
+            reference = element.get('r')
+            if not reference:
+                raise ValueError('单元格缺少位置信息')
+            cells.append((column_index_from_string(reference.rstrip('0123456789')), element))
+    return cells
+
+def _cell_value(element):
+    return next((child.text for child in element if _local_name(child.tag) == 'v'), None)
+
+def _cell_text(element, shared_strings):
+    cell_type = element.get('t')
+    if cell_type == 'inlineStr':
+        return ''.join(text.text or '' for text in element.iter() if _local_name(text.tag) == 't')
+    value = _cell_value(element)
+    if cell_type == 's' and value is not None:
+        return shared_strings.get(int(value))
+    return value
+
+def _template_layout(archive):
+    """
+    在工作表XML中定位列名行、最后一个有值的行和sheetData的位置，不解析数据行
+    """
+    sheet_path, shared_strings_path = _workbook_parts(archive)
+    sheet_xml = archive.read(sheet_path)
+    match = _SHEET_DATA_RE.search(sheet_xml)
+    if match is None:
+        raise ValueError('工作表中没有sheetData')
+    prefix = match.group(1)
+    body_start = match.end()
+    if match.group(2):
+        # <sheetData/>：改写为成对标签，新行放在中间
+        sheet_xml = sheet_xml[:match.start()] + match.group(0)[:-2] + b'></' + prefix + b'sheetData>' + sheet_xml[match.end():]
+        body_start = match.end() - 1
+    body_end = sheet_xml.index(b'</' + prefix + b'sheetData>', body_start)
+
+    starts = [(int(row.group(1)), row.start()) for row in _ROW_RE.finditer(sheet_xml, body_start, body_end)]
+    if len(starts) != len(_ROW_TAG_RE.findall(sheet_xml, body_start, body_end)):
+        raise ValueError('行缺少行号')
+    rows = [(number, start, starts[i + 1][1] if i + 1 < len(starts) else body_end)
+            for i, (number, start) in enumerate(starts)]
+
+    last_used = None
+    for i in range(len(rows) - 1, -1, -1):
+        number, start, end = rows[i]
+        if _CELL_VALUE_RE.search(sheet_xml, start, end):
+            last_used = i
+            break
+
+    header_cells = []
+    if rows and rows[0][0] == 1:
+        header_cells = _parse_row_cells(sheet_xml, body_start, prefix, sheet_xml[rows[0][1]:rows[0][2]])
+    shared_indexes = {int(_cell_value(element)) for _, element in header_cells
+                      if element.get('t') == 's' and _cell_value(element) is not None}
+    shared_strings = _read_shared_strings(archive, shared_strings_path, shared_indexes) if shared_strings_path else {}
+    header = {}
+    for column, element in header_cells:
+        value = _cell_text(element, shared_strings)
+        if value is not None and value != '' and value not in header:
+            header[value] = column
+
+    return {
+        'sheet_path': sheet_path,
+        'sheet_xml': sheet_xml,
+        'prefix': prefix,
+        'body_start': body_start,
+        'body_end': body_end,
+        'rows': rows,
+        'header': header,
+        'header_cells': header_cells,
+        'last_used': last_used,
+        'last_row': rows[last_used][0] if last_used is not None else 1,
+    }
+
+def read_template_info(template):
+    """
+    读取导单模板的列名和已有数据行数，不把模板解析为DataFrame
+
+    Returns:
+        dict: columns为第一行的列名，rows为列名行之后到最后一个非空行的行数
+    """
+    from modules.excel_io import _file_bytes
+
+    data = _file_bytes(template)
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            layout = _template_layout(archive)
+        return {'columns': list(layout['header']), 'rows': max(layout['last_row'] - 1, 0)}
+    except (ValueError, KeyError, StopIteration, ElementTree.ParseError) as e:
+        logger.warning("导单模板结构无法直接读取，改用openpyxl: %s", e)
+
+    from openpyxl import load_workbook
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[0]
+        columns = []
+        last_used_row = 0
+        for row_number, values in enumerate(worksheet.iter_rows(values_only=True), start=1):
+            if row_number == 1:
+                columns = [value for value in values if value is not None]
+            if any(value is not None and value != '' for value in values):
+                last_used_row = row_number
+        return {'columns': columns, 'rows': max(last_used_row - 1, 0)}
+    finally:
+        workbook.close()
+
+def _cell_xml(prefix, reference, value, style):
+    # 数值写为数字，其余写为内联字符串；空值只保留格式
+    style_attribute = f' s="{style}"' if style is not None else ''
+    if value is None or value == '' or (isinstance(value, numbers.Number) and not math.isfinite(value)):
+        return f'<{prefix}c r="{reference}"{style_attribute}/>' if style is not None else ''
+    if isinstance(value, (bool, np.bool_)):
+        return f'<{prefix}c r="{reference}"{style_attribute} t="b"><{prefix}v>{int(value)}</{prefix}v></{prefix}c>'
+    if isinstance(value, numbers.Number):
+        text = repr(float(value)) if isinstance(value, float) else str(int(value))
+        return f'<{prefix}c r="{reference}"{style_attribute}><{prefix}v>{text}</{prefix}v></{prefix}c>'
+    text = escape(ILLEGAL_CHARACTERS_RE.sub('', str(value)))
+    return (f'<{prefix}c r="{reference}"{style_attribute} t="inlineStr"><{prefix}is>'
+            f'<{prefix}t xml:space="preserve">{text}</{prefix}t></{prefix}is></{prefix}c>')
+
+def _append_rows_xml(data, row_frames):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        layout = _template_layout(archive)
+        sheet_xml = layout['sheet_xml']
+        prefix = layout['prefix'].decode()
+        rows = layout['rows']
+        header = dict(layout['header'])
+
+        # 模板中缺少的必要列追加在列名行末尾
+        header_columns = [column for column, _ in layout['header_cells']]
+        next_column = max(header_columns, default=0) + 1
+        new_header_cells = []
+        for col in TEMPLATE_REQUIRED_COLUMNS:
+            if col not in header:
+                header[col] = next_column
+                new_header_cells.append(_cell_xml(prefix, f'{get_column_letter(next_column)}1', col, None))
+                next_column += 1
+
+        # 新行沿用最后一个数据行的单元格格式
+        styles = {}
+        if layout['last_used'] is not None and layout['last_row'] > 1:
+            _, start, end = rows[layout['last_used']]
+            styles = {column: element.get('s') for column, element in
+                      _parse_row_cells(sheet_xml, layout['body_start'], layout['prefix'], sheet_xml[start:end])
+                      if element.get('s') is not None}
+        targets = [(field, header[column]) for field, column in TEMPLATE_COLUMN_MAPPING.items() if column in header]
+        letters = {column: get_column_letter(column) for column in set(styles) | {column for _, column in targets}}
+
+        new_rows = []
+        row_number = layout['last_row']
+        for frame in row_frames:
+            columns = [(frame[field].tolist(), column) for field, column in targets]
+            for position in range(len(frame)):
+                row_number += 1
+                cells = {column: _cell_xml(prefix, f'{letters[column]}{row_number}', None, style)
+                         for column, style in styles.items()}
+                for values, column in columns:
+                    value = values[position]
+                    cells[column] = _cell_xml(prefix, f'{letters[column]}{row_number}',
+                                              None if pd.isna(value) else value, styles.get(column))
+                new_rows.append(f'<{prefix}row r="{row_number}">' + ''.join(cells[column] for column in sorted(cells))
+                                + f'</{prefix}row>')
+
+        # 拼接新的sheetData：列名行（补充缺少的列）、原有数据行、新行、编号在新行之后的原有空行
+        body_start, body_end = layout['body_start'], layout['body_end']
+        keep_until = rows[layout['last_used']][2] if layout['last_used'] is not None else body_start
+        parts = [sheet_xml[:body_start]]
+        if new_header_cells:
+            header_cell_xml = ''.join(new_header_cells).encode('utf-8')
+            if rows and rows[0][0] == 1:
+                _, start, end = rows[0]
+                segment = sheet_xml[start:end]
+                tag_end = segment.index(b'>') + 1
+                tag = _SPANS_RE.sub(b'', segment[:tag_end])
+                if tag.endswith(b'/>'):
+                    segment = tag[:-2] + b'>' + header_cell_xml + f'</{prefix}row>'.encode('utf-8') + segment[tag_end:]
+                else:
+                    close = segment.rindex(b'</')
+                    segment = tag + segment[tag_end:close] + header_cell_xml + segment[close:]
+                parts.append(segment)
+                parts.append(sheet_xml[end:keep_until] if keep_until > end else b'')
+            else:
+                parts.append(f'<{prefix}row r="1">'.encode('utf-8') + header_cell_xml + f'</{prefix}row>'.encode('utf-8'))
+                parts.append(sheet_xml[body_start:keep_until])
+        else:
+            parts.append(sheet_xml[body_start:keep_until])
+        parts.append(''.join(new_rows).encode('utf-8'))
+        parts.extend(sheet_xml[start:end] for number, start, end in rows
+                     if start >= keep_until and number > row_number)
+        parts.append(sheet_xml[body_end:])
+        new_sheet_xml = b''.join(parts)
+
+        # 更新工作表范围
+        dimension = _DIMENSION_RE.search(new_sheet_xml)
+        if dimension:
+            first, _, last = dimension.group(2).decode().partition(':')
+            last = last or first
+            last_column = last.rstrip('0123456789')
+            last_row = int(last[len(last_column):] or 1)
+            max_column = max([column_index_from_string(last_column)] + list(header.values()))
+            reference = f"{first}:{get_column_letter(max_column)}{max(last_row, row_number)}".encode('utf-8')
+            new_sheet_xml = (new_sheet_xml[:dimension.start(2)] + reference + new_sheet_xml[dimension.end(2):])
+
+        # 其余部件原样写回
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as target:
+            for info in archive.infolist():
+                target.writestr(info, new_sheet_xml if info.filename == layout['sheet_path'] else archive.read(info))
+    return output.getvalue(), row_number - 1
+
+def _append_rows_openpyxl(data, row_frames):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(io.BytesIO(data))
+    worksheet = workbook.worksheets[0]
+
+    # 列名 -> 列号，模板中缺少的必要列追加到末尾
+    header = {}
+    for cell in worksheet[1]:
+        if cell.value is not None and cell.value not in header:
+            header[cell.value] = cell.column
+    next_column = max(header.values(), default=0) + 1
+    for col in TEMPLATE_REQUIRED_COLUMNS:
+        if col not in header:
+            worksheet.cell(row=1, column=next_column, value=col)
+            header[col] = next_column
+            next_column += 1
+
+    # 从末尾向前找最后一个有值的行，模板中预先设置了格式的空行不算
+    last_row = 1
+    for row_number in range(worksheet.max_row, 1, -1):
+        values = next(worksheet.iter_rows(min_row=row_number, max_row=row_number, values_only=True))
+        if any(value is not None and value != '' for value in values):
+            last_row = row_number
+            break
+    style_row = {cell.column: cell for cell in worksheet[last_row]} if last_row > 1 else {}
+    targets = [(field, header[column]) for field, column in TEMPLATE_COLUMN_MAPPING.items() if column in header]
+
+    row_number = last_row
+    for rows in row_frames:
+        columns = [(rows[field].tolist(), column) for field, column in targets]
+        for position in range(len(rows)):
+            row_number += 1
+            for source_column, source in style_row.items():
+                if source.has_style:
+                    worksheet.cell(row=row_number, column=source_column)._style = copy(source._style)
+            for values, column in columns:
+                value = values[position]
+                worksheet.cell(row=row_number, column=column, value=None if pd.isna(value) else value)
+
+    output = io.BytesIO()
+    workbook.save(output)
+    workbook.close()
+    return output.getvalue(), row_number - 1
+
+def append_rows_to_template(template, row_frames):
+    """
+    把处理后的导单行追加到导单模板工作簿的最后一个非空行之后
+
+    直接在xlsx中第一个工作表的XML末尾写入新行，其他部件（格式、数据有效性、其他工作表）原样保留，
+    耗时与追加的行数成正比；新行沿用最后一个数据行的单元格格式，模板中缺少的必要列追加在列名行末尾。
+    工作表结构无法直接处理时（如行缺少行号）改用openpyxl打开整个工作簿追加
+
+    Args:
+        template: 导单模板文件（上传文件、路径或bytes）
+        row_frames: build_import_rows返回的导单行DataFrame列表
+
+    Returns:
+        tuple: (更新后的工作簿bytes, 追加后的数据行数)
+    """
+    from modules.excel_io import _file_bytes
+
+    data = _file_bytes(template)
+    try:
+        return _append_rows_xml(data, row_frames)
+    except (ValueError, KeyError, StopIteration, ElementTree.ParseError) as e:
+        logger.warning("导单模板结构无法直接追加，改用openpyxl: %s", e)
+    return _append_rows_openpyxl(data, row_frames)
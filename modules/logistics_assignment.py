@@ -0,0 +1,196 @@
+import heapq
+
+def solve_min_cost_assignment(supplies, capacities, edges):
+    """
+    求解带容量的最小费用二分匹配（最小费用最大流）
+
+    左侧为待发货记录（可按相同候选合并成一类，供给量为该类记录数），
+    右侧为物流记录（容量为剩余可使用次数）。只为有匹配分数的记录对建边，
+    同一姓名下有几百条记录时图依然是稀疏的
+
+    Args:
+        supplies: 左侧每个节点的供给量
+        capacities: 右侧每个节点的容量
+        edges: [(左侧节点, 右侧节点, 费用), ...]，费用为非负整数
+
+    Returns:
+        dict: {(左侧节点, 右侧节点): 分配数量}，在匹配数量最多的前提下总费用最小
+    """
+    left_count = len(supplies)
+    right_count = len(capacities)
+    source = left_count + right_count
+    sink = source + 1
+    node_count = sink + 1
+
+    # 邻接表：每条边为 [终点, 剩余容量, 费用, 反向边下标]
+    graph = [[] for _ in range(node_count)]
+
+    def add_edge(start, end, capacity, cost):
+        graph[start].append([end, capacity, cost, len(graph[end])])
+        graph[end].append([start, 0, -cost, len(graph[start]) - 1])
+        return start, len(graph[start]) - 1
+
+    for left, supply in enumerate(supplies):
+        if supply > 0:
+            add_edge(source, left, supply, 0)
+    for right, capacity in enumerate(capacities):
+        if capacity > 0:
+            add_edge(left_count + right, sink, capacity, 0)
+
+    pair_edges = []
+    for left, right, cost in edges:
+        if supplies[left] > 0 and capacities[right] > 0:
+            pair_edges.append((left, right, add_edge(left, left_count + right, min(supplies[left], capacities[right]), cost)))
+
+    # 原始对偶法：每轮用Dijkstra（势函数）求最短距离，再在约化费用为0的边上求阻塞流，
+    # 一轮就能沿所有最短增广路推送流量，轮数只与不同的最短路长度有关，
+    # 同一姓名有上千条记录、每条记录只有1个供给量时也不必逐个单位增广
+    potential = [0] * node_count
+    while True:
+        distance = [None] * node_count
+        distance[source] = 0
+        heap = [(0, source)]
+        while heap:
+            dist, node = heapq.heappop(heap)
+            if dist > distance[node]:
+                continue
+            for end, capacity, cost, _ in graph[node]:
+                if capacity <= 0:
+                    continue
+                new_dist = dist + cost + potential[node] - potential[end]
+                if distance[end] is None or new_dist < distance[end]:
+                    distance[end] = new_dist
+                    heapq.heappush(heap, (new_dist, end))
+
+        if distance[sink] is None:
+            break
+
+        for node in range(node_count):
+            if distance[node] is not None:
+                potential[node] += distance[node]
+
+        _push_blocking_flows(graph, potential, source, sink)
+
+    assignment = {}
+    for left, right, (start, edge_index) in pair_edges:
+        edge = graph[start][edge_index]
+        used = graph[edge[0]][edge[3]][1]
+        if used > 0:
+            assignment[(left, right)] = assignment.get((left, right), 0) + used
+    return assignment
+
+def _push_blocking_flows(graph, potential, source, sink):
+    """
+    在约化费用为0（即位于最短路上）的剩余边组成的子图中求最大流（Dinic），直接修改graph
+    """
+    node_count = len(graph)
+
+    def admissible(node, edge):
+        return edge[1] > 0 and edge[2] + potential[node] - potential[edge[0]] == 0
+
+    while True:
+        # 分层：只沿可行边BFS
+        level = [-1] * node_count
+        level[source] = 0
+        queue = [source]
+        for node in queue:
+            for edge in graph[node]:
+                if level[edge[0]] < 0 and admissible(node, edge):
+                    level[edge[0]] = level[node] + 1
+                    queue.append(edge[0])
+        if level[sink] < 0:
+            return
+
+        # 沿层次图逐条找增广路（非递归DFS，current-arc避免重复扫描），每条路推送瓶颈流量
+        next_edge = [0] * node_count
+        path = []
+        node = source
+        while True:
+            if node == sink:
+                flow = min(graph[start][edge_index][1] for start, edge_index in path)
+                for start, edge_index in path:
+                    edge = graph[start][edge_index]
+                    edge[1] -= flow
+                    graph[edge[0]][edge[3]][1] += flow
+                path = []
+                node = source
+                continue
+            edges = graph[node]
+            while next_edge[node] < len(edges):
+                edge = edges[next_edge[node]]
+                if level[edge[0]] == level[node] + 1 and admissible(node, edge):
+                    break
+                next_edge[node] += 1
+            else:
+                # 死路：该节点本轮不再访问，回退一步
+                level[node] = -1
+                if not path:
+                    break
+                node, _ = path.pop()
+                next_edge[node] += 1
+                continue
+            path.append((node, next_edge[node]))
+            node = edges[next_edge[node]][0]
+
+def assign_by_name_groups(row_names, row_candidates, labels, remaining_capacity):
+    """
+    按姓名分组求解待发货记录到物流记录的最优分配
+
+    每个姓名组单独建图求解，组内候选完全相同的待发货记录合并为一个左侧节点，
+    费用为 (组内最高分 - 候选分数)，即在分配数量最多的前提下总分最高。
+    姓名组按首次出现的顺序依次求解，后面的组只能使用剩余容量
+
+    Args:
+        row_names: 每条待发货记录的收件人姓名
+        row_candidates: 每条待发货记录的候选 {位置: {'score': 分数, 'matched_by': 匹配方式}}
+        labels: 每个物流位置对应的原始索引，用于同分时的排序
+        remaining_capacity: 每个物流位置剩余可使用次数
+
+    Returns:
+        list: 每条待发货记录分配到的物流位置，未分配的为None
+    """
+    assigned = [None] * len(row_names)
+    remaining_capacity = list(remaining_capacity)
+
+    name_groups = {}
+    for row, (name, candidates) in enumerate(zip(row_names, row_candidates)):
+        if candidates:
+            name_groups.setdefault(name, []).append(row)
+
+    for rows in name_groups.values():
+        # 候选及分数完全相同的记录合并为一类，供给量为记录数
+        classes = {}
+        for row in rows:
+            signature = tuple(sorted((pos, candidate['score']) for pos, candidate in row_candidates[row].items()))
+            classes.setdefault(signature, []).append(row)
+        signatures = list(classes)
+        class_rows = list(classes.values())
+
+        max_score = max(score for signature in signatures for _, score in signature)
+        right_nodes = {}
+        edges = []
+        for left, signature in enumerate(signatures):
+            for pos, score in signature:
+                right = right_nodes.setdefault(pos, len(right_nodes))
+                edges.append((left, right, max_score - score))
+        positions = list(right_nodes)
+
+        flows = solve_min_cost_assignment(
+            [len(class_rows[left]) for left in range(len(signatures))],
+            [remaining_capacity[pos] for pos in positions],
+            edges)
+
+        # 拆回到具体记录：类内记录按原始顺序，物流位置按分数降序、原始索引升序
+        allocations = {}
+        for (left, right), count in flows.items():
+            allocations.setdefault(left, []).append((positions[right], count))
+        for left, class_allocations in allocations.items():
+            scores = dict(signatures[left])
+            class_allocations.sort(key=lambda item: (-scores[item[0]], labels[item[0]]))
+            class_row_iter = iter(class_rows[left])
+            for pos, count in class_allocations:
+                remaining_capacity[pos] -= count
+                for _ in range(count):
+                    assigned[next(class_row_iter)] = pos
+
+    return assigned
@@ -0,0 +1,273 @@
+from modules.logistics_matching import (
+    explode_product_column, product_lists_from_exploded, get_address_matcher, normalize_address
+)
+from modules.match_metrics import count
+
+def build_logistics_index(logistics_df, logistics_name_select, logistics_phone_select=None,
+                          logistics_address_select=None, logistics_product_select=None):
+    """
+    为物流单号表构建预计算索引，供模糊匹配引擎按位置访问
+
+    只做一次groupby：姓名 -> 该姓名下物流记录的位置数组（保持原始顺序），
+    电话、地址、商品等字段按位置存放在列表中，匹配时不再访问pandas行
+
+    Args:
+        logistics_df: 已预处理（字符串化、姓名去空格等）的物流单号表
+        logistics_name_select: 物流单号表中的收件人列名
+        logistics_phone_select: 物流单号表中的电话列名
+        logistics_address_select: 物流单号表中的地址列名
+        logistics_product_select: 物流单号表中的商品列名
+
+    Returns:
+        dict: 物流索引
+            - labels: 每个位置对应的原始索引
+            - names / phones / addresses / product_cells: 按位置存放的字段值
+            - product_rows: 拆分后的商品表，列为 position、slot、product
+            - product_lists: 每个位置拆分出的商品列表
+            - max_usage: 每个位置允许被使用的最大次数（等于商品数，至少为1）
+            - record_keys: 每个位置的使用状态键 (name, phone, address, index)
+            - groups: {姓名: 位置列表}，位置按原始顺序排列
+            - fallback_order: {姓名: 按原始索引排序的位置列表}
+    """
+    row_count = len(logistics_df)
+    labels = logistics_df.index.tolist()
+    names = logistics_df[logistics_name_select].tolist()
+    phones = logistics_df[logistics_phone_select].tolist() if logistics_phone_select else [''] * row_count
+    addresses = logistics_df[logistics_address_select].tolist() if logistics_address_select else [''] * row_count
+
+    # 商品列：每个物流单元格可能包含多个商品，允许使用次数等于商品数
+    if logistics_product_select and logistics_product_select in logistics_df.columns:
+        product_cells = logistics_df[logistics_product_select].tolist()
+        # 整列一次拆分为 (位置, 序号, 商品) 表，再按位置还原为商品列表
+        product_rows = explode_product_column(product_cells)
+        product_lists = product_lists_from_exploded(product_rows, row_count)
+        max_usage = [max(1, len(products)) for products in product_lists]
+    else:
+        product_cells = [''] * row_count
+        product_lists = [['']] * row_count
+        product_rows = explode_product_column([])
+        max_usage = [1] * row_count
+
+    record_keys = [
+        (names[pos], str(phones[pos]), addresses[pos], labels[pos])
+        for pos in range(row_count)
+    ]
+
+    # 一次groupby得到每个姓名的位置数组（组内保持原始顺序）
+    groups = {}
+    fallback_order = {}
+    if row_count:
+        for name, positions in logistics_df.groupby(logistics_name_select, sort=False).indices.items():
+            positions = positions.tolist()
+            groups[name] = positions
+            fallback_order[name] = sorted(positions, key=lambda pos: labels[pos])
+
+    return {
+        'labels': labels,
+        'names': names,
+        'phones': phones,
+        'addresses': addresses,
+        'product_cells': product_cells,
+        'product_rows': product_rows,
+        'product_lists': product_lists,
+        'max_usage': max_usage,
+        'record_keys': record_keys,
+        'groups': groups,
+        'fallback_order': fallback_order,
+    }
+
+def _phone_digits(phone):
+    return ''.join(filter(str.isdigit, str(phone)))
+
+def _phone_index_keys(logistics_phone):
+    """
+    计算一个物流电话在电话索引中的所有键，规则与fuzzy_phone_match一致
+
+    Returns:
+        tuple: (完整号码或None, [(前缀长度, 后缀长度, 前缀, 后缀), ...])
+    """
+    logistics_digits = _phone_digits(logistics_phone)
+
+    # 少于4位的号码不会匹配任何电话
+    if len(logistics_digits) < 4:
+        return None, []
+
+    # 完整号码只做精确比较
+    if len(logistics_digits) >= 10:
+        return logistics_digits, []
+
+    shapes = []
+    # 部分隐藏的号码（如1580*995）：可见前缀+可见后缀
+    if '*' in str(logistics_phone):
+        parts = str(logistics_phone).split('*')
+        prefix = _phone_digits(parts[0])
+        suffix = _phone_digits(parts[-1])
+        shapes.append((len(prefix), len(suffix), prefix, suffix))
+
+    # 前4位/后3位规则
+    if len(logistics_digits) <= 4:
+        shapes.append((len(logistics_digits), 0, logistics_digits, ''))
+    elif len(logistics_digits) <= 7:
+        shapes.append((4, 0, logistics_digits[:4], ''))
+    else:
+        shapes.append((4, 3, logistics_digits[:4], logistics_digits[-3:]))
+
+    return None, shapes
+
+def _is_strong_phone_shape(prefix_length, suffix_length):
+    # 跨姓名查找只使用前后缀都可见的号码，避免仅凭4位前缀误配
+    return prefix_length >= 3 and suffix_length >= 3
+
+def build_phone_index(names, phones, cross_name=False):
+    """
+    为物流电话构建哈希索引，每个物流文件只构建一次
+
+    索引按fuzzy_phone_match能识别的可见形态分桶：完整号码、1580*995式的
+    前缀+后缀掩码、4位/7位前缀。待发货电话只需按形态各查一次即可得到候选
+
+    Args:
+        names: 按位置排列的物流收件人
+        phones: 按位置排列的物流电话
+        cross_name: 是否同时构建不区分姓名的索引（用于姓名有误时按电话查找）
+
+    Returns:
+        dict: 电话索引
+    """
+    full = {}
+    shapes = {}
+    global_full = {}
+    global_shapes = {}
+
+    for pos, (name, phone) in enumerate(zip(names, phones)):
+        full_digits, phone_shapes = _phone_index_keys(phone)
+        if full_digits is not None:
+            full.setdefault((name, full_digits), []).append(pos)
+            if cross_name:
+                global_full.setdefault(full_digits, []).append(pos)
+        for prefix_length, suffix_length, prefix, suffix in phone_shapes:
+            shape_table = shapes.setdefault((prefix_length, suffix_length), {})
+            shape_table.setdefault((name, prefix, suffix), []).append(pos)
+            if cross_name and _is_strong_phone_shape(prefix_length, suffix_length):
+                global_table = global_shapes.setdefault((prefix_length, suffix_length), {})
+                global_table.setdefault((prefix, suffix), []).append(pos)
+
+    return {
+        'full': full,
+        'shapes': shapes,
+        'global_full': global_full,
+        'global_shapes': global_shapes,
+    }
+
+def lookup_phone_candidates(phone_index, pending_phone, name=None, metrics=None):
+    """
+    按待发货电话在电话索引中查找候选物流记录
+
+    Args:
+        phone_index: build_phone_index构建的索引
+        pending_phone: 待发货明细中的完整电话号码
+        name: 收件人姓名；为None时在不区分姓名的索引中查找
+        metrics: 可选，本次匹配的指标对象，查找次数计入其中
+
+    Returns:
+        set: 匹配的物流记录位置
+    """
+    count(metrics, 'phone_index_lookup_calls')
+    pending_digits = _phone_digits(pending_phone)
+    if len(pending_digits) < 7:
+        return set()
+
+    digits_length = len(pending_digits)
+    if name is None:
+        candidates = set(phone_index['global_full'].get(pending_digits, ()))
+        shape_tables = phone_index['global_shapes']
+    else:
+        candidates = set(phone_index['full'].get((name, pending_digits), ()))
+        shape_tables = phone_index['shapes']
+
+    for (prefix_length, suffix_length), shape_table in shape_tables.items():
+        if prefix_length + suffix_length > digits_length:
+            continue
+        prefix = pending_digits[:prefix_length]
+        suffix = pending_digits[digits_length - suffix_length:]
+        key = (prefix, suffix) if name is None else (name, prefix, suffix)
+        candidates.update(shape_table.get(key, ()))
+
+    return candidates
+
+def build_address_index(names, addresses):
+    """
+    为物流地址构建匹配索引，在加载物流文件时预先计算
+
+    不含*号的地址按 (姓名, 规范化地址) 建立哈希表，直接做相等比较；
+    含*号的地址在第一次用到时才从缓存中取得已编译的匹配器（分层匹配时大部分记录用不到）
+
+    Args:
+        names: 按位置排列的物流收件人
+        addresses: 按位置排列的物流地址
+
+    Returns:
+        dict: 地址索引
+    """
+    normalized = [normalize_address(address) for address in addresses]
+    exact = {}
+    masked = {}
+    matchers = [None] * len(normalized)
+
+    for pos, (name, address) in enumerate(zip(names, normalized)):
+        if '*' in address:
+            masked.setdefault(name, []).append(pos)
+        else:
+            exact.setdefault((name, address), []).append(pos)
+
+    return {
+        'normalized': normalized,
+        'exact': exact,
+        'masked': masked,
+        'matchers': matchers,
+    }
+
+def _masked_address_matcher(address_index, pos, metrics=None):
+    # 带*号地址的匹配器，第一次使用时从LRU缓存取得并保存在索引中；
+    # 之后同一位置直接复用，复用计为命中，第一次取得计为未命中
+    matcher = address_index['matchers'][pos]
+    if matcher is None:
+        count(metrics, 'address_matcher_cache_misses')
+        matcher = get_address_matcher(address_index['normalized'][pos])
+        address_index['matchers'][pos] = matcher
+    else:
+        count(metrics, 'address_matcher_cache_hits')
+    return matcher
+
+def _masked_address_matches(address_index, pos, pending_address, metrics=None):
+    # 调用带*号地址的匹配器，并计入本次匹配的调用次数
+    count(metrics, 'masked_address_matcher_calls')
+    return _masked_address_matcher(address_index, pos, metrics)(pending_address)
+
+def address_matches(address_index, pos, pending_address, metrics=None):
+    """
+    判断规范化后的待发货地址是否与指定位置的物流地址匹配，规则与fuzzy_address_match一致
+    """
+    logistics_address = address_index['normalized'][pos]
+    if '*' not in logistics_address:
+        return pending_address == logistics_address
+    return _masked_address_matches(address_index, pos, pending_address, metrics)
+
+def lookup_address_candidates(address_index, pending_address, name, metrics=None):
+    """
+    查找与待发货地址匹配的同名物流记录
+
+    Args:
+        address_index: build_address_index构建的索引
+        pending_address: 规范化后的待发货地址
+        name: 收件人姓名
+        metrics: 可选，本次匹配的指标对象，查找次数计入其中
+
+    Returns:
+        set: 匹配的物流记录位置
+    """
+    count(metrics, 'address_index_lookup_calls')
+    candidates = set(address_index['exact'].get((name, pending_address), ()))
+    for pos in address_index['masked'].get(name, ()):
+        if _masked_address_matches(address_index, pos, pending_address, metrics):
+            candidates.add(pos)
+    return candidates
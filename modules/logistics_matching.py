@@ -1,5 +1,9 @@
 import pandas as pd
 import streamlit as st
+import re
+from functools import lru_cache
+
+from modules.match_metrics import count
 
 def check_duplicate_names(pending_shipment_df, logistics_df, pending_name_col, logistics_name_col):
     """
@@ -81,6 +85,82 @@ def fuzzy_phone_match(pending_phone, logistics_phone):
     
     return False
 
+# 带*号物流地址的匹配器缓存大小（按规范化后的地址缓存已编译的正则）
+ADDRESS_MATCHER_CACHE_SIZE = 4096
+
+def normalize_address(address):
+    # 转换为字符串并去除首尾空格，统一处理空格
+    return str(address).strip().replace(' ', '')
+
+def _match_address_parts_in_order(pending_addr, parts):
+    """
+    备用地址匹配方法：检查每个部分是否都在待发货地址中，且按顺序出现
+    """
+    last_pos = -1
+    for part in parts:
+        # 特殊处理：如果部分以常见地理标识结尾，使用包含匹配
+        geographic_endings = ('省', '市', '区', '县', '镇', '乡', '村', '街', '路', '巷', '道', 
+                            '小区', '花园', '公寓', '大厦', '广场', '商场', '写字楼', '园区', '号楼', '单元', '室')
+        if part.endswith(geographic_endings):
+            # 对于地理标识，使用包含匹配
+            pos = pending_addr.find(part)
+            if pos == -1:
+                return False
+        else:
+            # 在待发货地址中查找当前部分
+            pos = pending_addr.find(part, last_pos + 1)
+        
+        # 如果找不到或者不是按顺序出现，则不匹配
+        if pos == -1 or pos <= last_pos:
+            return False
+        last_pos = pos
+    
+    return True
+
+@lru_cache(maxsize=ADDRESS_MATCHER_CACHE_SIZE)
+def get_address_matcher(logistics_addr):
+    """
+    为规范化后的带*号物流地址构建匹配函数，结果按地址缓存（LRU）
+    
+    Args:
+        logistics_addr: 已去除空格的物流地址（包含*号或**号）
+    
+    Returns:
+        callable: 接收规范化后的待发货地址，返回是否匹配
+    """
+    # 将地址中的**替换为*，统一处理
+    normalized_logistics_addr = logistics_addr.replace('**', '*')
+    
+    # 将地址按*号分割成多个部分，过滤掉空的部分并去除首尾空格
+    parts = [part.strip().replace(' ', '') for part in normalized_logistics_addr.split('*') if part.strip()]
+    
+    # 构建正则表达式模式进行匹配
+    pattern = ""
+    for i, part in enumerate(parts):
+        # 转义特殊字符
+        pattern += re.escape(part)
+        # 如果不是最后一部分，添加数字和文字匹配
+        if i < len(parts) - 1:
+            pattern += r'[\d\u4e00-\u9fa5]*'
+    
+    try:
+        compiled_pattern = re.compile(pattern)
+    except re.error:
+        # 如果正则表达式出错，使用备用方法
+        return lambda pending_addr: _match_address_parts_in_order(pending_addr, parts)
+    
+    return lambda pending_addr: compiled_pattern.search(pending_addr) is not None
+
+def address_matcher_cache_info():
+    """
+    返回地址匹配器LRU缓存的统计（进程内共享，只用于查看当前缓存条目数；
+    每次匹配的命中/未命中按位置记录在匹配指标中）
+    
+    Returns:
+        dict: {'hits', 'misses', 'maxsize', 'currsize'}
+    """
+    return get_address_matcher.cache_info()._asdict()
+
 def fuzzy_address_match(pending_address, logistics_address):
     """
     模糊匹配地址信息
@@ -93,79 +173,15 @@ def fuzzy_address_match(pending_address, logistics_address):
     Returns:
         bool: 是否匹配
     """
-    import re
-    
-    # 转换为字符串并去除首尾空格，统一处理空格
-    pending_addr = str(pending_address).strip().replace(' ', '')
-    logistics_addr = str(logistics_address).strip().replace(' ', '')
+    pending_addr = normalize_address(pending_address)
+    logistics_addr = normalize_address(logistics_address)
     
     # 如果物流地址是完整地址，直接比较（忽略空格）
-    if '*' not in logistics_addr and '**' not in logistics_addr:
+    if '*' not in logistics_addr:
         return pending_addr == logistics_addr
     
-    # 处理包含*号或**号的地址匹配
-    try:
-        # 将地址中的**替换为*，统一处理
-        normalized_logistics_addr = logistics_addr.replace('**', '*')
-        
-        # 将地址按*号分割成多个部分
-        parts = normalized_logistics_addr.split('*')
-        
-        # 过滤掉空的部分并去除首尾空格
-        parts = [part.strip().replace(' ', '') for part in parts if part.strip()]
-        
-        # 构建正则表达式模式进行匹配
-        pattern = ""
-        for i, part in enumerate(parts):
-            # 转义特殊字符
-            escaped_part = re.escape(part)
-            pattern += escaped_part
-            # 如果不是最后一部分，添加数字和文字匹配
-            if i < len(parts) - 1:
-                pattern += r'[\d\u4e00-\u9fa5]*'
-        
-        # 使用正则表达式进行匹配
-        match_result = bool(re.search(pattern, pending_addr))
-        # 调试信息
-        # st.write(f"DEBUG: 地址匹配 - 待发货: {pending_addr}, 物流: {logistics_addr}, 模式: {pattern}, 匹配结果: {match_result}")
-        return match_result
-    except re.error as e:
-        # 如果正则表达式出错，使用备用方法
-        # st.write(f"DEBUG: 地址匹配正则表达式出错: {str(e)}")
-        
-        # 将地址中的**替换为*，统一处理
-        normalized_logistics_addr = logistics_addr.replace('**', '*')
-        
-        # 将地址按*号分割成多个部分
-        parts = normalized_logistics_addr.split('*')
-        
-        # 过滤掉空的部分并去除首尾空格
-        parts = [part.strip().replace(' ', '') for part in parts if part.strip()]
-        
-        # 检查每个部分是否都在待发货地址中，且按顺序出现
-        last_pos = -1
-        for part in parts:
-            # 特殊处理：如果部分以常见地理标识结尾，使用包含匹配
-            geographic_endings = ('省', '市', '区', '县', '镇', '乡', '村', '街', '路', '巷', '道', 
-                                '小区', '花园', '公寓', '大厦', '广场', '商场', '写字楼', '园区', '号楼', '单元', '室')
-            if part.endswith(geographic_endings):
-                # 对于地理标识，使用包含匹配
-                pos = pending_addr.find(part)
-                if pos == -1:
-                    # st.write(f"DEBUG: 地址匹配失败，找不到部分: {part}")
-                    return False
-            else:
-                # 在待发货地址中查找当前部分
-                pos = pending_addr.find(part, last_pos + 1)
-            
-            # 如果找不到或者不是按顺序出现，则不匹配
-            if pos == -1 or pos <= last_pos:
-                # st.write(f"DEBUG: 地址匹配失败，部分 {part} 未按顺序找到")
-                return False
-            last_pos = pos
-        
-        # st.write(f"DEBUG: 地址匹配成功，使用备用方法")
-        return True
+    # 处理包含*号或**号的地址匹配，复用缓存中已编译的匹配器
+    return get_address_matcher(logistics_addr)(pending_addr)
 
 def extract_address_keywords(address):
     """
@@ -197,6 +213,11 @@ def extract_address_keywords(address):
     
     return keywords
 
+# 商品单元格的分隔符，合并为一个正则；"以及"放在"及"之前，与逐个分隔符拆分的结果一致
+PRODUCT_SEPARATOR_PATTERN = re.compile(r'，|,|、|;|；|和|\+|以及|及')
+# 需要去除的数量描述，例如："商品A(2个)" -> "商品A"
+PRODUCT_NOTE_PATTERNS = [re.compile(r'\(.*?\)'), re.compile(r'（.*?）'), re.compile(r'\[.*?\]'), re.compile(r'【.*?】')]
+
 def extract_multiple_products(product_string):
     """
     从物流表的一个单元格中提取多个商品关键词
@@ -210,112 +231,74 @@ def extract_multiple_products(product_string):
     if not product_string or product_string == 'nan':
         return []
     
-    # 常见的分隔符
-    separators = ['，', ',', '、', ';', '；', '和', '+', '以及', '及']
-    
-    # 尝试使用分隔符分割
-    products = [product_string]
-    for sep in separators:
-        temp_products = []
-        for product in products:
-            temp_products.extend(product.split(sep))
-        products = temp_products
-    
     # 清理每个产品名称
     cleaned_products = []
-    for product in products:
+    for product in PRODUCT_SEPARATOR_PATTERN.split(product_string):
         cleaned = product.strip()
         if cleaned and cleaned != 'nan':
-            # 去除常见的数量描述
-            # 例如："商品A(2个)" -> "商品A"
-            import re
-            cleaned = re.sub(r'\(.*?\)', '', cleaned)
-            cleaned = re.sub(r'（.*?）', '', cleaned)
-            cleaned = re.sub(r'\[.*?\]', '', cleaned)
-            cleaned = re.sub(r'【.*?】', '', cleaned)
+            for pattern in PRODUCT_NOTE_PATTERNS:
+                cleaned = pattern.sub('', cleaned)
             cleaned = cleaned.strip()
             if cleaned:
                 cleaned_products.append(cleaned)
     
     return cleaned_products
 
-def extract_multiple_products_with_logistics(product_string, logistics_row, logistics_product_select, columns_to_add):
+def explode_product_column(product_cells):
     """
-    从物流表的一个单元格中提取多个商品关键词，并保持与物流信息的对应关系
-    
+    一次性拆分整列物流商品单元格，得到紧凑的商品表
+
+    用一个分隔符正则对整列做str.split再explode，清理规则与extract_multiple_products一致。
+    结果只记录物流记录位置，不复制物流行
+
     Args:
-        product_string: 物流表中的商品信息字符串
-        logistics_row: 物流表行数据
-        logistics_product_select: 物流表中的商品列名
-        columns_to_add: 需要添加的列名列表
-        
+        product_cells: 物流表商品列（Series或列表）
+
     Returns:
-        list: 包含商品和对应物流信息的字典列表
+        DataFrame: 列为 position（物流记录位置）、slot（单元格内第几个商品）、product（商品名称），
+        按 position、slot 排序
     """
-    if not product_string or product_string == 'nan':
-        return []
-    
-    # 常见的分隔符
-    separators = ['，', ',', '、', ';', '；', '和', '+', '以及', '及']
-    
-    # 尝试使用分隔符分割
-    products = [product_string]
-    for sep in separators:
-        temp_products = []
-        for product in products:
-            temp_products.extend(product.split(sep))
-        products = temp_products
-    
-    # 清理每个产品名称
-    cleaned_products = []
-    for product in products:
-        cleaned = product.strip()
-        if cleaned and cleaned != 'nan':
-            # 去除常见的数量描述
-            # 例如："商品A(2个)" -> "商品A"
-            import re
-            cleaned = re.sub(r'\(.*?\)', '', cleaned)
-            cleaned = re.sub(r'（.*?）', '', cleaned)
-            cleaned = re.sub(r'\[.*?\]', '', cleaned)
-            cleaned = re.sub(r'【.*?】', '', cleaned)
-            cleaned = cleaned.strip()
-            if cleaned:
-                cleaned_products.append(cleaned)
-    
-    # 为每个商品创建对应的物流信息
-    result = []
-    num_products = len(cleaned_products)
-    
-    if num_products <= 1:
-        # 如果只有一个或没有商品，直接返回原始行
-        return [{'product': product, 'logistics_info': logistics_row.to_dict()} for product in cleaned_products]
-    
-    # 如果有多个商品，我们需要为每个商品分配对应的物流信息
-    # 这里我们假设物流信息中的其他字段（如单号）可能也按顺序对应商品
-    for i, product in enumerate(cleaned_products):
-        logistics_info = {}
-        for col in logistics_row.index:
-            if col == logistics_product_select:
-                # 商品列直接使用当前商品
-                logistics_info[col] = product
-            else:
-                # 其他列保持原样
-                logistics_info[col] = logistics_row[col]
-        result.append({'product': product, 'logistics_info': logistics_info})
-    
-    return result
+    cells = pd.Series(product_cells, dtype=object).reset_index(drop=True)
+    cells = cells.where(cells.notna(), '').astype(str)
 
-def fuzzy_product_match(pending_product, logistics_product):
+    products = cells.str.split(PRODUCT_SEPARATOR_PATTERN).explode()
+    products = products.str.strip()
+    products = products[(products != '') & (products != 'nan') & products.notna()]
+    for pattern in PRODUCT_NOTE_PATTERNS:
+        products = products.str.replace(pattern, '', regex=True)
+    products = products.str.strip()
+    products = products[products != '']
+
+    positions = products.index.to_numpy()
+    exploded = pd.DataFrame({
+        'position': positions,
+        'slot': products.groupby(level=0, sort=False).cumcount().to_numpy(),
+        'product': products.to_numpy(),
+    })
+    return exploded
+
+def product_lists_from_exploded(exploded, row_count):
+    """
+    把explode_product_column得到的商品表还原为每个物流位置的商品列表
+    """
+    product_lists = [[] for _ in range(row_count)]
+    for position, product in zip(exploded['position'].tolist(), exploded['product'].tolist()):
+        product_lists[position].append(product)
+    return product_lists
+
+def fuzzy_product_match(pending_product, logistics_product, metrics=None):
     """
     模糊匹配商品信息
     
     Args:
         pending_product: 待发货明细表中的商品名称
         logistics_product: 物流单号表中的商品名称
+        metrics: 可选，本次匹配的指标对象，调用次数计入其中
     
     Returns:
         bool: 是否匹配
     """
+    count(metrics, 'fuzzy_product_match_calls')
     pending_product = str(pending_product).strip()
     logistics_product = str(logistics_product).strip()
     
@@ -399,44 +382,103 @@ def fuzzy_product_match(pending_product, logistics_product):
     # 其他情况返回False
     return False
 
-def fuzzy_product_match_multi(pending_product, logistics_product_cell):
+# 待发货商品数 × 物流商品数不超过该值时，一次性预先计算整张相似度表
+PRODUCT_TABLE_PRECOMPUTE_LIMIT = 200000
+
+def build_product_similarity_table(pending_products, logistics_products, metrics=None):
+    """
+    预先计算待发货商品 × 物流商品的相似度表，每次匹配只计算一次
+    
+    Args:
+        pending_products: 待发货明细中的商品名称（可重复）
+        logistics_products: 物流单号表中拆分后的商品名称（可重复）
+        metrics: 可选，本次匹配的指标对象
+        
+    Returns:
+        dict: {(待发货商品, 物流商品): (是否匹配, SequenceMatcher相似度)}
+    """
+    unique_pending = list(dict.fromkeys(pending_products))
+    unique_logistics = list(dict.fromkeys(logistics_products))
+    
+    table = {}
+    # 商品种类很少时直接算满整张表；种类过多时按需计算，避免组合爆炸
+    if len(unique_pending) * len(unique_logistics) <= PRODUCT_TABLE_PRECOMPUTE_LIMIT:
+        for pending_product in unique_pending:
+            for logistics_product in unique_logistics:
+                product_similarity(table, pending_product, logistics_product, metrics)
+    return table
+
+def product_similarity(similarity_table, pending_product, logistics_product, metrics=None):
+    """
+    从相似度表中读取商品对的匹配结果，表中没有时计算并写入
+    
+    Returns:
+        tuple: (是否匹配, SequenceMatcher相似度)
+    """
+    key = (pending_product, logistics_product)
+    result = similarity_table.get(key)
+    if result is None:
+        import difflib
+        result = (
+            fuzzy_product_match(pending_product, logistics_product, metrics),
+            difflib.SequenceMatcher(None, pending_product, logistics_product).ratio()
+        )
+        similarity_table[key] = result
+    return result
+
+def fuzzy_product_match_multi(pending_product, logistics_product_cell, similarity_table=None, logistics_products=None,
+                              metrics=None):
     """
     支持物流单元格中多个商品的模糊匹配
     
     Args:
         pending_product: 待发货明细表中的单一商品名称
         logistics_product_cell: 物流单号表中的商品单元格（可能包含多个商品）
+        similarity_table: 商品相似度表，提供时从表中读取匹配结果
+        logistics_products: 已从单元格中拆分出的商品列表，提供时不再重复拆分
+        metrics: 可选，本次匹配的指标对象，调用次数计入其中
         
     Returns:
         bool: 是否匹配
     """
+    count(metrics, 'fuzzy_product_match_multi_calls')
+    if similarity_table is None:
+        match = lambda pending, logistics: fuzzy_product_match(pending, logistics, metrics)
+    else:
+        match = lambda pending, logistics: product_similarity(similarity_table, pending, logistics, metrics)[0]
+    
     # 提取物流单元格中的多个商品
-    logistics_products = extract_multiple_products(logistics_product_cell)
+    if logistics_products is None:
+        logistics_products = extract_multiple_products(logistics_product_cell)
     
     # 如果没有提取到商品，使用原来的匹配方式
     if not logistics_products:
-        return fuzzy_product_match(pending_product, logistics_product_cell)
+        return match(pending_product, logistics_product_cell)
     
     # 检查待发货商品是否与物流单元格中的任何一个商品匹配
     for logistics_product in logistics_products:
-        if fuzzy_product_match(pending_product, logistics_product):
+        if match(pending_product, logistics_product):
             return True
     
     return False
 
 def match_logistics_info(pending_shipment_df, logistics_df, pending_name_select, 
                         logistics_name_select, columns_to_add, handle_duplicates, 
-                        phone_matching_enabled=False):
+                        phone_matching_enabled=False, return_metrics=False):
     """
     匹配物流信息到待发货明细表
+
+    return_metrics: 为True时返回 (result_df, metrics)，metrics为各阶段耗时的结构化指标
     """
+    import time
+    from modules.match_metrics import new_match_metrics, add_stage_time, stage_timer, count
+    metrics = new_match_metrics()
     try:
-        # 确保所有列都是字符串类型，避免PyArrow错误
-        for col in pending_shipment_df.columns:
-            pending_shipment_df[col] = pending_shipment_df[col].astype(str)
-            
-        for col in logistics_df.columns:
-            logistics_df[col] = logistics_df[col].astype(str)
+        preprocess_start = time.perf_counter()
+        # 姓名列按字符串匹配（与原先全部转为字符串时的取值相同），其余列按类型策略存储
+        from modules.dtype_policy import apply_dtype_policy
+        pending_shipment_df = apply_dtype_policy(pending_shipment_df, text_columns=[pending_name_select])
+        logistics_df = apply_dtype_policy(logistics_df, text_columns=[logistics_name_select])
         
         # 处理物流单号表中的重复记录
         if handle_duplicates == "保留第一条记录":
@@ -483,6 +525,8 @@ def match_logistics_info(pending_shipment_df, logistics_df, pending_name_select,
         
         if phone_matching_enabled and pending_phone_col and logistics_phone_col:
             merge_columns.append(logistics_phone_col)
+        add_stage_time(metrics, 'preprocess', time.perf_counter() - preprocess_start)
+        merge_start = time.perf_counter()
         
         if phone_matching_enabled and pending_phone_col and logistics_phone_col:
             # 使用姓名和电话进行匹配
@@ -505,36 +549,568 @@ def match_logistics_info(pending_shipment_df, logistics_df, pending_name_select,
                 sort=False
             )
         
-        # 处理匹配列重复的问题
-        if pending_name_select == logistics_name_select and f"{logistics_name_select}_x" in result_df.columns:
-            result_df = result_df.drop(columns=[f"{logistics_name_select}_y"]).rename(columns={f"{logistics_name_select}_x": logistics_name_select})
+        add_stage_time(metrics, 'merge', time.perf_counter() - merge_start)
         
-        # 确保结果DataFrame的所有列都是字符串类型
-        for col in result_df.columns:
-            result_df[col] = result_df[col].astype(str)
+        with stage_timer(metrics, 'result_assembly'):
+            # 处理匹配列重复的问题
+            if pending_name_select == logistics_name_select and f"{logistics_name_select}_x" in result_df.columns:
+                result_df = result_df.drop(columns=[f"{logistics_name_select}_y"]).rename(columns={f"{logistics_name_select}_x": logistics_name_select})
+        count(metrics, 'pending_rows', len(pending_shipment_df))
+        count(metrics, 'logistics_rows', len(logistics_df_unique))
+        count(metrics, 'result_rows', len(result_df))
             
-        return result_df
+        return (result_df, metrics) if return_metrics else result_df
     except Exception as e:
+        from modules.ui_components import streamlit_running
+        if not streamlit_running():
+            # 脱离Streamlit运行（命令行、基准测试）时st.error不会显示，直接抛出原始错误
+            raise
         st.error(f"匹配过程中出现错误: {str(e)}")
         import traceback
         st.error(traceback.format_exc())
-        return None
+        return (None, metrics) if return_metrics else None
+
+def _match_fuzzy_phone_records(pending_records, logistics_df_unique, pending_name_select,
+                              logistics_name_select, columns_to_add,
+                              pending_phone_select=None, logistics_phone_select=None,
+                              pending_address_select=None, logistics_address_select=None,
+                              pending_product_select=None, logistics_product_select=None,
+                              cross_name_phone=False, assignment_mode='greedy', tiered=False):
+    """
+    模糊电话匹配的核心过程，不调用streamlit，可在子进程中运行
+
+    tiered为True时先用精确键合并（第一层）和电话/地址索引（第二层）解析无歧义的记录，
+    只有剩余记录进入评分（第三层），各层的记录数和耗时写入匹配统计
+
+    Args:
+        pending_records: 已预处理的待发货记录（字典列表）
+        logistics_df_unique: 已预处理的物流单号表
+
+    Returns:
+        tuple: (合并后的记录列表, 匹配统计, 带*地址匹配器在本次匹配中的复用统计, 匹配指标)
+    """
+    import time
+    from modules.match_metrics import new_match_metrics, stage_timer, add_stage_time, record_candidates
+    metrics = new_match_metrics()
+
+    # 按索引顺序匹配，确保每个记录都能匹配到对应的物流信息
+    matched_rows = []
+    match_stats = {'total_matched': 0, 'name_only': 0, 'phone_refined': 0, 'address_refined': 0, 'product_refined': 0, 'no_match': 0}
+
+    # 一次groupby构建物流索引：姓名 -> 位置数组，电话/地址/商品按位置预先取出
+    from modules.logistics_index import (
+        build_logistics_index, build_phone_index, lookup_phone_candidates,
+        build_address_index, address_matches, lookup_address_candidates
+    )
+    with stage_timer(metrics, 'logistics_index'):
+        logistics_index = build_logistics_index(
+            logistics_df_unique, logistics_name_select, logistics_phone_select,
+            logistics_address_select, logistics_product_select)
+
+    # 电话哈希索引：每个物流文件只构建一次，待发货电话按可见形态直接查找候选
+    phone_index = None
+    if pending_phone_select and logistics_phone_select:
+        with stage_timer(metrics, 'phone_index'):
+            phone_index = build_phone_index(
+                logistics_index['names'], logistics_index['phones'], cross_name=cross_name_phone)
+    if cross_name_phone:
+        match_stats['cross_name_phone'] = 0
+
+    # 地址索引：完整地址走相等比较，带*号的地址在第一次用到时取得已编译的匹配器
+    address_index = None
+    if logistics_address_select:
+        with stage_timer(metrics, 'address_index'):
+            address_index = build_address_index(logistics_index['names'], logistics_index['addresses'])
+
+    labels = logistics_index['labels']
+    logistics_product_cells = logistics_index['product_cells']
+    logistics_product_lists = logistics_index['product_lists']
+    logistics_max_usage = logistics_index['max_usage']
+    logistics_record_keys = logistics_index['record_keys']
+    logistics_groups = logistics_index['groups']
+    logistics_fallback_order = logistics_index['fallback_order']
+
+    # 需要写回待发货明细的物流列，按位置取值
+    output_columns = [logistics_name_select] + columns_to_add
+    logistics_column_values = {col: logistics_df_unique[col].tolist() for col in output_columns}
+
+    # 创建物流记录使用状态跟踪（支持多次使用）
+    logistics_usage = {}  # {(name, phone, address, index): usage_count}
+
+    # 商品相似度表：待发货商品 × 物流商品只计算一次，打分和选品都从表中读取
+    product_table = {}
+    if pending_product_select:
+        with stage_timer(metrics, 'product_table'):
+            logistics_vocabulary = []
+            for products, cell in zip(logistics_product_lists, logistics_product_cells):
+                logistics_vocabulary.extend(products if products else [cell])
+            product_table = build_product_similarity_table(
+                [pending_row[pending_product_select] for pending_row in pending_records], logistics_vocabulary, metrics)
+
+    def has_product_match(pending_product, products):
+        for product in products:
+            if product_similarity(product_table, pending_product, product, metrics)[0]:
+                return True
+        return False
+
+    def select_best_product(pending_product, products):
+        # 在所有匹配的商品中选择相似度最高的
+        best_product = None
+        best_product_match_score = 0
+        for product in products:
+            is_match, similarity = product_similarity(product_table, pending_product, product, metrics)
+            if is_match and similarity > best_product_match_score:
+                best_product_match_score = similarity
+                best_product = product
+        return best_product
+
+    def collect_candidates(pending_row):
+        # 计算一条待发货记录的候选：{位置: {'score': 分数, 'matched_by': 匹配方式}}
+        pending_name = pending_row[pending_name_select]
+        pending_phone = pending_row[pending_phone_select] if pending_phone_select else None
+        pending_product = pending_row[pending_product_select] if pending_product_select else None
+        pending_address = pending_row[pending_address_select] if pending_address_select else None
+        normalized_pending_address = normalize_address(pending_address) if pending_address else None
+
+        # 获取该姓名对应的物流记录位置
+        group_positions = logistics_groups.get(pending_name, [])
+
+        candidates = {}
+
+        # 尝试电话匹配
+        phone_positions = ()
+        cross_name_match = False
+        if pending_phone and phone_index is not None:
+            if group_positions:
+                phone_positions = lookup_phone_candidates(phone_index, pending_phone, pending_name, metrics)
+            elif cross_name_phone:
+                # 姓名在物流单号表中不存在时，按电话跨姓名查找
+                phone_positions = lookup_phone_candidates(phone_index, pending_phone, metrics=metrics)
+                cross_name_match = bool(phone_positions)
+
+        record_candidates(metrics, 'phone', len(phone_positions))
+        for pos in phone_positions:
+            # 计算匹配分数 - 提高商品匹配的权重
+            match_score = 10  # 基础电话匹配分数
+
+            # 地址匹配加分
+            if pending_address and address_index is not None:
+                if address_matches(address_index, pos, normalized_pending_address, metrics):
+                    match_score += 5
+
+            # 商品匹配加分 - 提高权重以确保商品匹配优先级更高
+            if pending_product and has_product_match(pending_product, logistics_product_lists[pos]):
+                match_score += 10
+
+            candidates[pos] = {'score': match_score, 'matched_by': 'phone'}
+
+        # 尝试地址匹配
+        if pending_address and pending_address_select and address_index is not None and group_positions:
+            address_positions = lookup_address_candidates(address_index, normalized_pending_address, pending_name, metrics)
+            record_candidates(metrics, 'address', len(address_positions))
+            for pos in address_positions:
+                candidate = candidates.get(pos)
+                if candidate is not None:
+                    # 已经通过电话匹配添加到候选列表，增加地址匹配分数
+                    candidate['score'] += 5
+                    if pending_product and has_product_match(pending_product, logistics_product_lists[pos]):
+                        candidate['score'] += 10
+                    if candidate['matched_by'] == 'phone':
+                        candidate['matched_by'] = 'address'
+                else:
+                    match_score = 7  # 基础地址匹配分数
+                    if pending_product and has_product_match(pending_product, logistics_product_lists[pos]):
+                        match_score += 10
+                    candidates[pos] = {'score': match_score, 'matched_by': 'address'}
+
+        # 尝试商品匹配（支持多商品匹配）
+        if pending_product and pending_product_select and logistics_product_select and group_positions:
+            product_candidate_count = 0
+            for pos in group_positions:
+                if fuzzy_product_match_multi(pending_product, logistics_product_cells[pos],
+                                             product_table, logistics_product_lists[pos], metrics):
+                    product_candidate_count += 1
+                    candidate = candidates.get(pos)
+                    if candidate is not None:
+                        candidate['score'] += 10
+                    else:
+                        # 商品匹配作为主要匹配方式时给予更高分数
+                        candidates[pos] = {'score': 15, 'matched_by': 'product'}
+            record_candidates(metrics, 'product', product_candidate_count)
+
+        record_candidates(metrics, 'total', len(candidates))
+        return candidates, cross_name_match
+
+    def use_candidate(pos, candidate, pending_product, cross_name_match):
+        # 使用一条候选物流记录，返回匹配到的商品
+        record_key = logistics_record_keys[pos]
+        usage_count = logistics_usage.get(record_key, 0)
+        matched_by = candidate['matched_by']
+        products = logistics_product_lists[pos]
+        matched_product = None
+
+        # 查找匹配的商品信息
+        if pending_product and products:
+            matched_product = select_best_product(pending_product, products)
+            # 如果没有找到基于内容的匹配，再考虑使用使用次数
+            if matched_product is None and usage_count < len(products):
+                matched_product = products[usage_count]
+
+        # 更新使用计数器
+        logistics_usage[record_key] = usage_count + 1
+
+        match_stats['total_matched'] += 1
+        if matched_by == "phone":
+            match_stats['phone_refined'] += 1
+            if cross_name_match:
+                match_stats['cross_name_phone'] += 1
+        elif matched_by == "address":
+            match_stats['address_refined'] += 1
+        elif matched_by == "product":
+            match_stats['product_refined'] += 1
+        else:
+            match_stats['name_only'] += 1
+        return matched_product
+
+    def use_fallback(pending_name, pending_product):
+        # 按原始索引顺序使用未达到最大使用次数的物流记录
+        # 返回 (位置, 匹配商品, 物流商品列覆盖值)，兜底匹配使用拆分后的商品行时，物流商品列取该商品而不是原始单元格
+        for pos in logistics_fallback_order.get(pending_name, ()):
+            record_key = logistics_record_keys[pos]
+            usage_count = logistics_usage.get(record_key, 0)
+            products = logistics_product_lists[pos]
+
+            if usage_count + reserved_usage[pos] < logistics_max_usage[pos]:
+                matched_product = None
+                product_cell_override = None
+                if len(products) > 1:
+                    # 当有多个商品时，尝试基于待发货明细中的商品进行精确匹配
+                    if pending_product:
+                        matched_product = select_best_product(pending_product, products)
+                        if matched_product is None and usage_count < len(products):
+                            matched_product = products[usage_count]
+                    elif usage_count < len(products):
+                        # 如果没有待发货商品信息，使用使用次数对应的商品信息
+                        matched_product = products[usage_count]
+                    product_cell_override = matched_product
+                elif products and usage_count < len(products):
+                    # 单个商品的情况
+                    matched_product = products[usage_count]
+
+                match_stats['name_only'] += 1
+                match_stats['total_matched'] += 1
+
+                # 更新使用计数器
+                logistics_usage[record_key] = usage_count + 1
+                return pos, matched_product, product_cell_override
+        return None, None, None
+
+    def merge_row(pending_row, best_pos, matched_product, product_cell_override):
+        # 合并行数据
+        merged_row = pending_row
+        if best_pos is not None:
+            for col in output_columns:
+                value = logistics_column_values[col][best_pos]
+                if col == logistics_product_select and product_cell_override is not None:
+                    value = product_cell_override
+                if pending_phone_select and logistics_phone_select and col == logistics_phone_select:
+                    # 特别处理电话列
+                    merged_row[col] = value
+                elif pending_address_select and logistics_address_select and col == logistics_address_select:
+                    # 特别处理地址列
+                    merged_row[col] = value
+                elif pending_product_select and logistics_product_select and col == logistics_product_select:
+                    # 特别处理商品列
+                    merged_row[col] = matched_product if matched_product else value
+                elif col != pending_name_select:  # 不覆盖姓名列
+                    merged_row[col] = value
+        else:
+            # 如果仍然没有匹配，标记为无匹配
+            match_stats['no_match'] += 1
+            # 确保所有需要的列都存在且为空
+            for col in output_columns:
+                if col not in merged_row:
+                    merged_row[col] = ''
+        return merged_row
+
+    # 分层匹配：第一、二层只确定物流位置并预留次数，评分阶段不会再使用预留的次数；
+    # 商品槽位（products[usage_count]）仍与评分记录一起按原始顺序登记，结果与逐条评分一致
+    row_results = [None] * len(pending_records)
+    tier_positions = [None] * len(pending_records)
+    reserved_usage = [0] * len(labels)
+    if tiered:
+        from modules.logistics_tiers import resolve_exact_keys, resolve_indexed_candidates
+        pending_names = [pending_row[pending_name_select] for pending_row in pending_records]
+        pending_phones = None
+        if phone_index is not None:
+            pending_phones = [pending_row[pending_phone_select] for pending_row in pending_records]
+        pending_addresses = None
+        if pending_address_select and address_index is not None:
+            pending_addresses = [normalize_address(pending_row[pending_address_select]) if pending_row[pending_address_select] else ''
+                                 for pending_row in pending_records]
+
+        product_matches = None
+        if pending_product_select and logistics_product_select:
+            def product_matches(row, pos):
+                pending_product = pending_records[row][pending_product_select]
+                return bool(pending_product) and fuzzy_product_match_multi(
+                    pending_product, logistics_product_cells[pos], product_table, logistics_product_lists[pos], metrics)
+
+        tier_start = time.perf_counter()
+        resolved = resolve_exact_keys(
+            pending_names, pending_phones, pending_addresses, logistics_index,
+            address_index['normalized'] if address_index is not None else None, logistics_max_usage,
+            logistics_groups, phone_index, address_index, product_matches, metrics)
+        match_stats['tier1_rows'] = len(resolved)
+        match_stats['tier1_seconds'] = time.perf_counter() - tier_start
+        add_stage_time(metrics, 'tier1', match_stats['tier1_seconds'])
+
+        tier_start = time.perf_counter()
+        remaining_capacity = list(logistics_max_usage)
+        for pos, _ in resolved.values():
+            remaining_capacity[pos] -= 1
+        tier2_resolved = resolve_indexed_candidates(
+            [row for row in range(len(pending_records)) if row not in resolved],
+            pending_names, pending_phones, pending_addresses, logistics_groups,
+            phone_index, address_index, remaining_capacity, product_matches, metrics)
+        resolved.update(tier2_resolved)
+
+        for row, (pos, matched_by) in resolved.items():
+            tier_positions[row] = (pos, {'matched_by': matched_by})
+            reserved_usage[pos] += 1
+        match_stats['tier2_rows'] = len(tier2_resolved)
+        match_stats['tier2_seconds'] = time.perf_counter() - tier_start
+        add_stage_time(metrics, 'tier2', match_stats['tier2_seconds'])
+        match_stats['tier3_rows'] = len(pending_records) - len(resolved)
+        tier_start = time.perf_counter()
+
+    def use_tier_position(row):
+        # 在原始顺序中登记分层匹配确定的记录，释放预留的次数
+        pos, candidate = tier_positions[row]
+        reserved_usage[pos] -= 1
+        pending_product = pending_records[row][pending_product_select] if pending_product_select else None
+        return pos, use_candidate(pos, candidate, pending_product, False), None
+
+    if assignment_mode == 'optimal':
+        # 最优分配：先计算所有记录的候选，再按姓名组求解最小费用匹配
+        from modules.logistics_assignment import assign_by_name_groups
+        with stage_timer(metrics, 'candidate_scoring'):
+            row_candidates = [
+                collect_candidates(pending_row) if tier_positions[row] is None else ({}, False)
+                for row, pending_row in enumerate(pending_records)
+            ]
+        with stage_timer(metrics, 'assignment'):
+            assigned_positions = assign_by_name_groups(
+                [pending_row[pending_name_select] for pending_row in pending_records],
+                [candidates for candidates, _ in row_candidates],
+                labels,
+                [logistics_max_usage[pos] - reserved_usage[pos] for pos in range(len(labels))])
+
+        # 先按原始顺序登记已分配的记录，再为其余记录走兜底匹配，避免兜底占用已分配的容量
+        with stage_timer(metrics, 'candidate_selection'):
+            for row, pos in enumerate(assigned_positions):
+                if tier_positions[row] is not None:
+                    row_results[row] = use_tier_position(row)
+                elif pos is not None:
+                    candidates, cross_name_match = row_candidates[row]
+                    pending_product = pending_records[row][pending_product_select] if pending_product_select else None
+                    row_results[row] = (pos, use_candidate(pos, candidates[pos], pending_product, cross_name_match), None)
+        with stage_timer(metrics, 'fallback'):
+            for row, pending_row in enumerate(pending_records):
+                if row_results[row] is None:
+                    pending_product = pending_row[pending_product_select] if pending_product_select else None
+                    row_results[row] = use_fallback(pending_row[pending_name_select], pending_product)
+                    count(metrics, 'fallback_rows')
+
+        with stage_timer(metrics, 'result_assembly'):
+            for pending_row, (best_pos, matched_product, product_cell_override) in zip(pending_records, row_results):
+                matched_rows.append(merge_row(pending_row, best_pos, matched_product, product_cell_override))
+    else:
+        # 按原始顺序处理每条待发货记录，确保顺序不变；各步骤耗时逐条累加
+        scoring_seconds = selection_seconds = fallback_seconds = assembly_seconds = 0.0
+        fallback_rows = 0
+        perf_counter = time.perf_counter
+        for row, pending_row in enumerate(pending_records):
+            if tier_positions[row] is not None:
+                # 分层匹配中已确定的记录
+                step_start = perf_counter()
+                matched_rows.append(merge_row(pending_row, *use_tier_position(row)))
+                assembly_seconds += perf_counter() - step_start
+                continue
+            pending_product = pending_row[pending_product_select] if pending_product_select else None
+            step_start = perf_counter()
+            candidates, cross_name_match = collect_candidates(pending_row)
+            step_end = perf_counter()
+            scoring_seconds += step_end - step_start
+
+            # 从候选匹配中选择最佳匹配
+            best_pos = None
+            matched_product = None
+            product_cell_override = None
+
+            if candidates:
+                # 首先按匹配分数降序排序，然后按原始索引升序排序
+                ranked_positions = sorted(candidates, key=lambda pos: (-candidates[pos]['score'], labels[pos]))
+
+                # 选择第一个未达到最大使用次数的候选
+                for pos in ranked_positions:
+                    if logistics_usage.get(logistics_record_keys[pos], 0) + reserved_usage[pos] < logistics_max_usage[pos]:
+                        best_pos = pos
+                        matched_product = use_candidate(pos, candidates[pos], pending_product, cross_name_match)
+                        break
+            step_start = perf_counter()
+            selection_seconds += step_start - step_end
+
+            # 如果所有匹配都失败，使用兜底匹配
+            if best_pos is None:
+                best_pos, matched_product, product_cell_override = use_fallback(
+                    pending_row[pending_name_select], pending_product)
+                fallback_rows += 1
+                step_end = perf_counter()
+                fallback_seconds += step_end - step_start
+                step_start = step_end
+
+            matched_rows.append(merge_row(pending_row, best_pos, matched_product, product_cell_override))
+            assembly_seconds += perf_counter() - step_start
+
+        scored_rows = len(pending_records) - sum(position is not None for position in tier_positions)
+        add_stage_time(metrics, 'candidate_scoring', scoring_seconds, scored_rows)
+        add_stage_time(metrics, 'candidate_selection', selection_seconds, scored_rows)
+        add_stage_time(metrics, 'fallback', fallback_seconds, fallback_rows)
+        add_stage_time(metrics, 'result_assembly', assembly_seconds, len(pending_records))
+        count(metrics, 'fallback_rows', fallback_rows)
+
+    if tiered:
+        match_stats['tier3_seconds'] = time.perf_counter() - tier_start
+
+    # 命中/未命中是本次匹配中带*地址匹配器按位置的复用次数（记录在本次的指标中，
+    # 不受同时运行的其他匹配影响）；缓存条目数取进程内LRU缓存的当前值
+    address_cache_info = address_matcher_cache_info()
+    address_cache_stats = {
+        'hits': metrics['counters'].get('address_matcher_cache_hits', 0),
+        'misses': metrics['counters'].get('address_matcher_cache_misses', 0),
+        'currsize': address_cache_info['currsize'],
+        'maxsize': address_cache_info['maxsize'],
+        'enabled': address_index is not None,
+    }
+
+    count(metrics, 'pending_rows', len(pending_records))
+    count(metrics, 'logistics_rows', len(labels))
+    return matched_rows, match_stats, address_cache_stats, metrics
+
+PARALLEL_MATCH_MIN_ROWS = 2000
+
+def _partition_by_name(pending_records, logistics_df_unique, pending_name_select,
+                       logistics_name_select, partition_count):
+    """
+    按姓名把待发货记录和物流记录划分为互不相交的分区
+
+    使用状态以姓名为键，不同姓名之间没有共享状态，同一姓名的记录始终落在同一分区，
+    分区内保持原始顺序。按待发货记录数从大到小分配到当前最空闲的分区，使各分区工作量接近
+
+    Returns:
+        list: [(待发货记录的原始位置列表, 待发货记录列表, 物流记录子表), ...]
+    """
+    import heapq
+
+    name_rows = {}
+    for row, pending_row in enumerate(pending_records):
+        name_rows.setdefault(pending_row[pending_name_select], []).append(row)
+
+    partition_count = max(1, min(partition_count, len(name_rows)))
+    loads = [(0, partition) for partition in range(partition_count)]
+    partition_names = [[] for _ in range(partition_count)]
+    partition_rows = [[] for _ in range(partition_count)]
+    for name, rows in sorted(name_rows.items(), key=lambda item: -len(item[1])):
+        load, partition = heapq.heappop(loads)
+        partition_names[partition].append(name)
+        partition_rows[partition].extend(rows)
+        heapq.heappush(loads, (load + len(rows), partition))
+
+    partitions = []
+    logistics_names = logistics_df_unique[logistics_name_select]
+    for names, rows in zip(partition_names, partition_rows):
+        if not rows:
+            continue
+        rows.sort()
+        logistics_part = logistics_df_unique[logistics_names.isin(names)]
+        partitions.append((rows, [pending_records[row] for row in rows], logistics_part))
+    return partitions
+
+def _match_fuzzy_phone_parallel(pending_records, logistics_df_unique, pending_name_select,
+                                logistics_name_select, columns_to_add, max_workers, match_options):
+    """
+    按姓名分区后在进程池中并行匹配，结果按待发货记录的原始顺序合并
+
+    Returns:
+        tuple: 与_match_fuzzy_phone_records相同，另加实际使用的分区数
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    partitions = _partition_by_name(pending_records, logistics_df_unique, pending_name_select,
+                                    logistics_name_select, max_workers)
+
+    from modules.match_metrics import new_match_metrics, merge_match_metrics
+
+    matched_rows = [None] * len(pending_records)
+    match_stats = {}
+    address_cache_stats = {'hits': 0, 'misses': 0, 'currsize': 0, 'maxsize': 0, 'enabled': False}
+    metrics = new_match_metrics()
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(partitions))) as executor:
+        futures = [
+            (rows, executor.submit(_match_fuzzy_phone_records, records, logistics_part,
+                                   pending_name_select, logistics_name_select, columns_to_add,
+                                   **match_options))
+            for rows, records, logistics_part in partitions
+        ]
+        for rows, future in futures:
+            part_rows, part_stats, part_cache_stats, part_metrics = future.result()
+            merge_match_metrics(metrics, part_metrics)
+            for row, merged_row in zip(rows, part_rows):
+                matched_rows[row] = merged_row
+            for key, value in part_stats.items():
+                match_stats[key] = match_stats.get(key, 0) + value
+            address_cache_stats['hits'] += part_cache_stats['hits']
+            address_cache_stats['misses'] += part_cache_stats['misses']
+            address_cache_stats['currsize'] = max(address_cache_stats['currsize'], part_cache_stats['currsize'])
+            address_cache_stats['maxsize'] = part_cache_stats['maxsize']
+            address_cache_stats['enabled'] = address_cache_stats['enabled'] or part_cache_stats['enabled']
+
+    return matched_rows, match_stats, address_cache_stats, metrics, len(partitions)
 
 def match_logistics_info_fuzzy_phone(pending_shipment_df, logistics_df, pending_name_select, 
                                    logistics_name_select, columns_to_add, handle_duplicates,
                                    pending_phone_select=None, logistics_phone_select=None,
                                    pending_address_select=None, logistics_address_select=None,
-                                   pending_product_select=None, logistics_product_select=None):
+                                   pending_product_select=None, logistics_product_select=None,
+                                   cross_name_phone=False, assignment_mode='greedy',
+                                   parallel=False, max_workers=None, tiered=False, return_metrics=False):
     """
     使用模糊电话匹配的物流信息匹配函数（优化版）
+
+    cross_name_phone: 待发货收件人在物流单号表中找不到同名记录时（如姓名录入有误），
+    允许按电话在所有姓名中查找（仅使用前后缀都可见的号码）
+    assignment_mode: 'greedy' 按待发货顺序逐条选取分数最高且仍有剩余次数的物流记录；
+    'optimal' 按姓名组求解最小费用匹配，结果不受待发货记录顺序影响
+    parallel: 按姓名分区后用多进程并行匹配；待发货记录少于PARALLEL_MATCH_MIN_ROWS条、
+    只有一个进程或启用跨姓名电话匹配（会跨越姓名分区）时自动退回单进程
+    max_workers: 并行进程数，默认为CPU核数
+    tiered: 分层匹配，先用 姓名+完整电话/地址 精确合并，再用电话/地址索引解析唯一候选，
+    只有仍有歧义的记录进入评分，并显示各层解析的记录数和耗时
+    return_metrics: 为True时返回 (result_df, metrics)，metrics为各阶段耗时、fuzzy_*函数调用次数
+    和候选数的结构化指标（见modules.match_metrics），可用log_match_metrics写入日志
     """
+    import time
+    from modules.match_metrics import new_match_metrics, add_stage_time, merge_match_metrics
+    metrics = new_match_metrics()
     try:
-        # 确保所有列都是字符串类型，避免PyArrow错误
-        for col in pending_shipment_df.columns:
-            pending_shipment_df[col] = pending_shipment_df[col].astype(str)
-            
-        for col in logistics_df.columns:
-            logistics_df[col] = logistics_df[col].astype(str)
+        preprocess_start = time.perf_counter()
+        # 参与匹配的列按字符串比较（与原先全部转为字符串时的取值相同），其余列按类型策略存储
+        from modules.dtype_policy import apply_dtype_policy
+        pending_shipment_df = apply_dtype_policy(pending_shipment_df, text_columns=[
+            col for col in (pending_name_select, pending_phone_select, pending_address_select, pending_product_select) if col])
+        logistics_df = apply_dtype_policy(logistics_df, text_columns=[
+            col for col in (logistics_name_select, logistics_phone_select, logistics_address_select, logistics_product_select) if col])
         
         # 注意：对于电话匹配，我们不预先处理重复项，因为需要保留所有记录以供电话匹配
         logistics_df_unique = logistics_df.copy()
@@ -553,347 +1129,34 @@ def match_logistics_info_fuzzy_phone(pending_shipment_df, logistics_df, pending_
             pending_shipment_df[pending_address_select] = pending_shipment_df[pending_address_select].astype(str).str.strip().str.replace(r'\s+', '', regex=True)
             logistics_df_unique[logistics_address_select] = logistics_df_unique[logistics_address_select].astype(str).str.strip().str.replace(r'\s+', '', regex=True)
         
-        # 按索引顺序匹配，确保每个记录都能匹配到对应的物流信息
-        matched_rows = []
-        match_stats = {'total_matched': 0, 'name_only': 0, 'phone_refined': 0, 'address_refined': 0, 'product_refined': 0, 'no_match': 0}
-        
-        # 为物流表中的每个姓名创建索引映射
-        logistics_name_groups = {}
-        for name in logistics_df_unique[logistics_name_select].unique():
-            # 修复：保留原始索引，不使用drop=True，以维持原始顺序
-            logistics_name_groups[name] = logistics_df_unique[logistics_df_unique[logistics_name_select] == name]  # 移除reset_index(drop=True)
-        
-        # 创建物流记录使用状态跟踪（支持多次使用）
-        logistics_usage = {}  # {(name, phone, address, index): usage_count}
-        logistics_max_usage = {}  # {(name, phone, address, index): max_allowed_usage}
-        logistics_product_mapping = {}  # {(name, phone, address, index): [{'product': product, 'logistics_info': info}]}
-
-        # 预处理物流记录，计算每个记录可以被使用的最大次数
-        for pending_name in logistics_name_groups:
-            name_group_logistics = logistics_name_groups[pending_name]
-            # 修复：使用原始索引，确保顺序正确
-            for i, (idx, logistics_row) in enumerate(name_group_logistics.iterrows()):  # 使用iterrows()获取原始索引
-                logistics_phone = logistics_row[logistics_phone_select] if logistics_phone_select else ''
-                logistics_address = logistics_row[logistics_address_select] if logistics_address_select else ''
-                # 修复：使用原始索引idx而不是循环索引i，确保唯一标识符正确
-                logistics_record_key = (pending_name, str(logistics_phone), logistics_address, idx)
-                
-                # 如果提供了商品列，检查物流单元格中是否包含多个商品
-                if logistics_product_select and logistics_product_select in logistics_row:
-                    logistics_product_cell = logistics_row[logistics_product_select]
-                    # 提取多个商品及其对应的物流信息
-                    product_logistics_list = extract_multiple_products_with_logistics(
-                        logistics_product_cell, logistics_row, logistics_product_select, columns_to_add)
-                    logistics_product_mapping[logistics_record_key] = product_logistics_list
-                    # 允许使用次数等于商品数
-                    logistics_max_usage[logistics_record_key] = max(1, len(product_logistics_list))
-                else:
-                    logistics_max_usage[logistics_record_key] = 1
-                    logistics_product_mapping[logistics_record_key] = [{'product': '', 'logistics_info': logistics_row.to_dict()}]
-
-        # 按原始顺序处理每条待发货记录，确保顺序不变
-        for idx, pending_row in pending_shipment_df.iterrows():
-            pending_name = pending_row[pending_name_select]
-            pending_phone = pending_row[pending_phone_select] if pending_phone_select else None
-            pending_product = pending_row[pending_product_select] if pending_product_select else None
-            pending_address = pending_row[pending_address_select] if pending_address_select else None
-
-            best_match = None
-            matched_by = ""
-            matched_product_info = None
-
-            # 获取该姓名对应的物流记录组
-            name_group_logistics = logistics_name_groups.get(pending_name, pd.DataFrame())
-            
-            # 创建候选匹配列表，用于后续排序
-            candidate_matches = []
-
-            # 尝试电话匹配
-            if pending_phone and pending_phone_select and logistics_phone_select and not name_group_logistics.empty:
-                # 修复：使用iterrows()获取原始索引
-                for i, (logistics_idx, logistics_row) in enumerate(name_group_logistics.iterrows()):
-                    logistics_phone = logistics_row[logistics_phone_select]
-                    
-                    if fuzzy_phone_match(pending_phone, logistics_phone):
-                        # 检查是否已被使用
-                        logistics_address = logistics_row[logistics_address_select] if logistics_address_select else ''
-                        # 修复：使用原始索引logistics_idx而不是循环索引i
-                        logistics_record_key = (pending_name, str(logistics_phone), logistics_address, logistics_idx)
-                        usage_count = logistics_usage.get(logistics_record_key, 0)
-                        max_allowed = logistics_max_usage.get(logistics_record_key, 1)
-                        product_mapping = logistics_product_mapping.get(logistics_record_key, [])
-
-                        # 计算匹配分数 - 提高商品匹配的权重
-                        match_score = 10  # 基础电话匹配分数
-
-                        # 地址匹配加分
-                        if pending_address and logistics_address_select:
-                            logistics_address = logistics_row[logistics_address_select]
-                            if fuzzy_address_match(pending_address, logistics_address):
-                                match_score += 5
-
-                        # 商品匹配加分 - 提高权重以确保商品匹配优先级更高
-                        if pending_product and product_mapping:
-                            for product_info in product_mapping:
-                                if fuzzy_product_match(pending_product, product_info['product']):
-                                    match_score += 10  # 提高商品匹配分数到10分
-                                    break
-
-                        candidate_matches.append({
-                            'logistics_row': logistics_row.to_dict(),
-                            'record_key': logistics_record_key,
-                            'usage_count': usage_count,
-                            'max_allowed': max_allowed,
-                            'product_mapping': product_mapping,
-                            'score': match_score,
-                            'matched_by': 'phone'
-                        })
-
-            # 如果电话匹配失败，尝试地址匹配
-            if best_match is None and pending_address and pending_address_select and logistics_address_select and not name_group_logistics.empty:
-                # 修复：使用iterrows()获取原始索引
-                for i, (logistics_idx, logistics_row) in enumerate(name_group_logistics.iterrows()):
-                    logistics_address = logistics_row[logistics_address_select]
-                    
-                    if fuzzy_address_match(pending_address, logistics_address):
-                        # 检查是否已在候选列表中
-                        logistics_phone = logistics_row[logistics_phone_select] if logistics_phone_select else ''
-                        logistics_address = logistics_row[logistics_address_select] if logistics_address_select else ''
-                        # 修复：使用原始索引logistics_idx而不是循环索引i
-                        logistics_record_key = (pending_name, str(logistics_phone), logistics_address, logistics_idx)
-                        
-                        # 检查是否已经通过电话匹配添加到候选列表
-                        already_added = False
-                        for candidate in candidate_matches:
-                            if candidate['record_key'] == logistics_record_key:
-                                already_added = True
-                                # 增加地址匹配分数
-                                candidate['score'] += 5
-                                # 商品匹配加分 - 提高权重
-                                if pending_product and candidate['product_mapping']:
-                                    for product_info in candidate['product_mapping']:
-                                        if fuzzy_product_match(pending_product, product_info['product']):
-                                            candidate['score'] += 10  # 提高商品匹配分数到10分
-                                            break
-                                candidate['matched_by'] = 'address' if candidate['matched_by'] == 'phone' else candidate['matched_by']
-                                break
-
-                        if not already_added:
-                            usage_count = logistics_usage.get(logistics_record_key, 0)
-                            max_allowed = logistics_max_usage.get(logistics_record_key, 1)
-                            product_mapping = logistics_product_mapping.get(logistics_record_key, [])
-
-                            # 计算匹配分数
-                            match_score = 7  # 基础地址匹配分数
-
-                            # 商品匹配加分 - 提高权重
-                            if pending_product and product_mapping:
-                                for product_info in product_mapping:
-                                    if fuzzy_product_match(pending_product, product_info['product']):
-                                        match_score += 10  # 提高商品匹配分数到10分
-                                        break
-
-                            candidate_matches.append({
-                                'logistics_row': logistics_row.to_dict(),
-                                'record_key': logistics_record_key,
-                                'usage_count': usage_count,
-                                'max_allowed': max_allowed,
-                                'product_mapping': product_mapping,
-                                'score': match_score,
-                                'matched_by': 'address'
-                            })
-
-            # 如果地址匹配也失败，尝试商品匹配（支持多商品匹配）
-            if best_match is None and pending_product and pending_product_select and logistics_product_select and not name_group_logistics.empty:
-                # 修复：使用iterrows()获取原始索引
-                for i, (logistics_idx, logistics_row) in enumerate(name_group_logistics.iterrows()):
-                    logistics_product_cell = logistics_row[logistics_product_select]
-                    
-                    if fuzzy_product_match_multi(pending_product, logistics_product_cell):
-                        # 检查是否已在候选列表中
-                        logistics_phone = logistics_row[logistics_phone_select] if logistics_phone_select else ''
-                        logistics_address = logistics_row[logistics_address_select] if logistics_address_select else ''
-                        # 修复：使用原始索引logistics_idx而不是循环索引i
-                        logistics_record_key = (pending_name, str(logistics_phone), logistics_address, logistics_idx)
-
-                        # 检查是否已经添加到候选列表
-                        already_added = False
-                        for candidate in candidate_matches:
-                            if candidate['record_key'] == logistics_record_key:
-                                already_added = True
-                                # 增加商品匹配分数
-                                candidate['score'] += 10  # 提高商品匹配分数到10分
-                                break
-
-                        if not already_added:
-                            usage_count = logistics_usage.get(logistics_record_key, 0)
-                            max_allowed = logistics_max_usage.get(logistics_record_key, 1)
-                            product_mapping = logistics_product_mapping.get(logistics_record_key, [])
-
-                            # 计算匹配分数 - 商品匹配作为主要匹配方式时给予更高分数
-                            match_score = 15  # 基础商品匹配分数（提高到15分）
-
-                            candidate_matches.append({
-                                'logistics_row': logistics_row.to_dict(),
-                                'record_key': logistics_record_key,
-                                'usage_count': usage_count,
-                                'max_allowed': max_allowed,
-                                'product_mapping': product_mapping,
-                                'score': match_score,
-                                'matched_by': 'product'
-                            })
+        match_options = {
+            'pending_phone_select': pending_phone_select,
+            'logistics_phone_select': logistics_phone_select,
+            'pending_address_select': pending_address_select,
+            'logistics_address_select': logistics_address_select,
+            'pending_product_select': pending_product_select,
+            'logistics_product_select': logistics_product_select,
+            'cross_name_phone': cross_name_phone,
+            'assignment_mode': assignment_mode,
+            'tiered': tiered,
+        }
+        pending_records = pending_shipment_df.to_dict('records')
+        add_stage_time(metrics, 'preprocess', time.perf_counter() - preprocess_start)
 
-            # 从候选匹配中选择最佳匹配
-            best_match = None
-            matched_by = ""
-            matched_product_info = None
-
-            if candidate_matches:
-                # 为了解决同名同电话同地址不同商品但物流单号相反的问题，我们需要进一步优化匹配逻辑
-                # 使用多级排序策略，确保匹配结果与待发货明细顺序一致
-                
-                # 首先按匹配分数降序排序，然后按原始索引升序排序
-                # 这样可以在保证匹配质量的同时，严格按照原始顺序处理
-                candidate_matches.sort(key=lambda x: (-x['score'], x['record_key'][3]))
-
-                # 选择第一个未达到最大使用次数的候选
-                for candidate in candidate_matches:
-                    if candidate['usage_count'] < candidate['max_allowed']:
-                        best_match = candidate['logistics_row']
-                        matched_by = candidate['matched_by']
-                        
-                        # 查找匹配的商品信息
-                        if pending_product and candidate['product_mapping']:
-                            # 为了解决同名同电话同地址不同商品但物流单号相反的问题
-                            # 我们需要更加精确地匹配商品，而不是依赖使用计数器
-                            matched_product_info = None
-                            best_product_match_score = 0
-                            
-                            # 遍历所有商品信息，找到最佳匹配
-                            for product_info in candidate['product_mapping']:
-                                if fuzzy_product_match(pending_product, product_info['product']):
-                                    # 计算商品匹配分数（基于字符串相似度）
-                                    import difflib
-                                    similarity = difflib.SequenceMatcher(None, pending_product, product_info['product']).ratio()
-                                    if similarity > best_product_match_score:
-                                        best_product_match_score = similarity
-                                        matched_product_info = product_info
-                            
-                            # 如果没有找到基于内容的匹配，再考虑使用使用次数
-                            if matched_product_info is None and candidate['usage_count'] < len(candidate['product_mapping']):
-                                matched_product_info = candidate['product_mapping'][candidate['usage_count']]
-                        
-                        # 更新使用计数器
-                        logistics_usage[candidate['record_key']] = candidate['usage_count'] + 1
-                        
-                        match_stats['total_matched'] += 1
-                        if matched_by == "phone":
-                            match_stats['phone_refined'] += 1
-                        elif matched_by == "address":
-                            match_stats['address_refined'] += 1
-                        elif matched_by == "product":
-                            match_stats['product_refined'] += 1
-                        else:
-                            match_stats['name_only'] += 1
-                        break
-
-            # 如果所有匹配都失败，尝试使用未达到最大使用次数的物流记录
-            # 为了解决同名同电话但物流单号相反的问题，这里也需要按索引顺序处理
-            if best_match is None and not name_group_logistics.empty:
-                # 先按索引排序，确保按原始顺序处理
-                # 修复：使用原始索引进行排序
-                sorted_logistics = name_group_logistics.sort_index()
-                # 修复：使用iterrows()获取原始索引
-                for i, (logistics_idx, logistics_row) in enumerate(sorted_logistics.iterrows()):
-                    logistics_phone = logistics_row[logistics_phone_select] if logistics_phone_select else ''
-                    logistics_address = logistics_row[logistics_address_select] if logistics_address_select else ''
-                    # 修复：使用原始索引logistics_idx而不是循环索引i
-                    logistics_record_key = (pending_name, str(logistics_phone), logistics_address, logistics_idx)
-                    usage_count = logistics_usage.get(logistics_record_key, 0)
-                    max_allowed = logistics_max_usage.get(logistics_record_key, 1)
-                    product_mapping = logistics_product_mapping.get(logistics_record_key, [])
-
-                    if usage_count < max_allowed:
-                        # 使用对应位置的商品信息
-                        # 为了解决同名同电话同地址不同商品但物流单号相反的问题
-                        # 我们需要更加精确地选择商品信息
-                        if product_mapping and len(product_mapping) > 1:
-                            # 当有多个商品时，尝试基于待发货明细中的商品进行精确匹配
-                            if pending_product:
-                                matched_product_info = None
-                                best_product_match_score = 0
-                                
-                                # 遍历所有商品信息，找到最佳匹配
-                                for product_info in product_mapping:
-                                    if fuzzy_product_match(pending_product, product_info['product']):
-                                        # 计算商品匹配分数（基于字符串相似度）
-                                        import difflib
-                                        similarity = difflib.SequenceMatcher(None, pending_product, product_info['product']).ratio()
-                                        if similarity > best_product_match_score:
-                                            best_product_match_score = similarity
-                                            matched_product_info = product_info
-                                
-                                # 如果没有找到基于内容的匹配，再考虑使用使用次数
-                                if matched_product_info is None and usage_count < len(product_mapping):
-                                    matched_product_info = product_mapping[usage_count]
-                            else:
-                                # 如果没有待发货商品信息，使用使用次数对应的商品信息
-                                if usage_count < len(product_mapping):
-                                    matched_product_info = product_mapping[usage_count]
-                            
-                            # 使用匹配到的商品对应的物流信息
-                            if matched_product_info:
-                                best_match = matched_product_info['logistics_info']
-                            else:
-                                # 没有找到合适的商品匹配，使用物流行的原始信息
-                                best_match = logistics_row.to_dict()
-                        else:
-                            # 单个商品或没有商品映射的情况
-                            if product_mapping and usage_count < len(product_mapping):
-                                matched_product_info = product_mapping[usage_count]
-                                best_match = matched_product_info['logistics_info']
-                            else:
-                                # 没有商品映射，直接使用物流信息
-                                best_match = logistics_row.to_dict()
-
-                        matched_by = "fallback"
-                        match_stats['name_only'] += 1
-                        match_stats['total_matched'] += 1
-
-                        # 更新使用计数器
-                        logistics_usage[logistics_record_key] = usage_count + 1
-                        break
+        import os
+        worker_count = max_workers or os.cpu_count() or 1
+        partition_count = 0
+        if (parallel and not cross_name_phone and worker_count > 1
+                and len(pending_records) >= PARALLEL_MATCH_MIN_ROWS):
+            matched_rows, match_stats, address_cache_stats, core_metrics, partition_count = _match_fuzzy_phone_parallel(
+                pending_records, logistics_df_unique, pending_name_select, logistics_name_select,
+                columns_to_add, worker_count, match_options)
+        else:
+            matched_rows, match_stats, address_cache_stats, core_metrics = _match_fuzzy_phone_records(
+                pending_records, logistics_df_unique, pending_name_select, logistics_name_select,
+                columns_to_add, **match_options)
+        merge_match_metrics(metrics, core_metrics)
 
-            # 如果仍然没有匹配，标记为无匹配
-            if best_match is None:
-                match_stats['no_match'] += 1
-
-            # 合并行数据
-            merged_row = pending_row.to_dict()
-            if best_match is not None:
-                for col in [logistics_name_select] + columns_to_add:
-                    if pending_phone_select and logistics_phone_select and col == logistics_phone_select:
-                        # 特别处理电话列
-                        merged_row[col] = best_match[col]
-                    elif pending_address_select and logistics_address_select and col == logistics_address_select:
-                        # 特别处理地址列
-                        merged_row[col] = best_match[col]
-                    elif pending_product_select and logistics_product_select and col == logistics_product_select:
-                        # 特别处理商品列
-                        if matched_product_info and matched_product_info['product']:
-                            merged_row[col] = matched_product_info['product']
-                        else:
-                            merged_row[col] = best_match[col]
-                    elif col != pending_name_select:  # 不覆盖姓名列
-                        merged_row[col] = best_match[col]
-            else:
-                # 确保所有需要的列都存在且为空
-                for col in [logistics_name_select] + columns_to_add:
-                    if col not in merged_row:
-                        merged_row[col] = ''
-            
-            matched_rows.append(merged_row)
-        
         # 显示匹配统计信息
         st.write("匹配统计信息:")
         st.write(f"- 姓名唯一匹配: {match_stats['name_only']}")
@@ -901,17 +1164,35 @@ def match_logistics_info_fuzzy_phone(pending_shipment_df, logistics_df, pending_
         st.write(f"- 地址细化匹配: {match_stats['address_refined']}")
         st.write(f"- 商品细化匹配: {match_stats['product_refined']}")
         st.write(f"- 无匹配: {match_stats['no_match']}")
+        if cross_name_phone:
+            st.write(f"- 跨姓名电话匹配: {match_stats['cross_name_phone']}")
+        if address_cache_stats['enabled']:
+            st.write(f"- 带*地址匹配器: 复用 {address_cache_stats['hits']} 次，"
+                     f"首次取用 {address_cache_stats['misses']} 个，"
+                     f"LRU缓存条目 {address_cache_stats['currsize']}/{address_cache_stats['maxsize']}")
+        if tiered:
+            # 并行时耗时为各进程合计
+            st.write(f"- 第1层（精确键合并）: {match_stats['tier1_rows']} 条，耗时 {match_stats['tier1_seconds']:.2f} 秒")
+            st.write(f"- 第2层（电话/地址索引）: {match_stats['tier2_rows']} 条，耗时 {match_stats['tier2_seconds']:.2f} 秒")
+            st.write(f"- 第3层（模糊评分）: {match_stats['tier3_rows']} 条，耗时 {match_stats['tier3_seconds']:.2f} 秒")
+        if partition_count:
+            st.write(f"- 并行匹配: {min(worker_count, partition_count)} 个进程，{partition_count} 个姓名分区")
 
+        assembly_start = time.perf_counter()
         # 创建结果DataFrame
-        result_df = pd.DataFrame(matched_rows)
-        
-        # 确保结果DataFrame的所有列都是字符串类型
-        for col in result_df.columns:
-            result_df[col] = result_df[col].astype(str)
+        result_df = apply_dtype_policy(pd.DataFrame(matched_rows))
+        add_stage_time(metrics, 'result_assembly', time.perf_counter() - assembly_start, 0)
+
+        from modules.ui_components import show_match_metrics
+        show_match_metrics(metrics)
             
-        return result_df
+        return (result_df, metrics) if return_metrics else result_df
     except Exception as e:
+        from modules.ui_components import streamlit_running
+        if not streamlit_running():
+            # 脱离Streamlit运行（命令行、基准测试）时st.error不会显示，直接抛出原始错误
+            raise
         st.error(f"匹配过程中出现错误: {str(e)}")
         import traceback
         st.error(traceback.format_exc())
-        return None
+        return (None, metrics) if return_metrics else None
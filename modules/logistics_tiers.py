@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+
+from modules.logistics_index import lookup_phone_candidates, lookup_address_candidates
+
+def _merge_unique_keys(pending_keys, logistics_keys, remaining_capacity):
+    """
+    按 (姓名, 键) 做一次哈希合并，只保留两侧都无歧义的记录
+
+    物流侧键必须唯一；待发货侧同一个键的记录数不能超过该物流记录的剩余可使用次数
+
+    Returns:
+        dict: {待发货记录位置: 物流记录位置}
+    """
+    if pending_keys.empty or logistics_keys.empty:
+        return {}
+
+    logistics_counts = logistics_keys.groupby(['name', 'key'], sort=False)['position'].transform('size')
+    logistics_keys = logistics_keys[logistics_counts == 1]
+
+    merged = pending_keys.merge(logistics_keys, on=['name', 'key'], how='inner', sort=False)
+    if merged.empty:
+        return {}
+
+    pending_counts = merged.groupby('position', sort=False)['row'].transform('size').to_numpy()
+    capacity = np.asarray(remaining_capacity)[merged['position'].to_numpy()]
+    merged = merged[pending_counts <= capacity]
+    return dict(zip(merged['row'].tolist(), merged['position'].tolist()))
+
+def _index_candidates(row, name, pending_phones, pending_addresses, phone_index, address_index, metrics=None):
+    """
+    通过电话索引（含隐藏号码）和地址索引查找一条待发货记录的同名候选位置
+
+    Returns:
+        tuple: (电话候选位置集合, 地址候选位置集合)
+    """
+    phone_positions = set()
+    if phone_index is not None and pending_phones is not None and pending_phones[row]:
+        phone_positions = lookup_phone_candidates(phone_index, pending_phones[row], name, metrics)
+    address_positions = set()
+    if address_index is not None and pending_addresses is not None and pending_addresses[row]:
+        address_positions = lookup_address_candidates(address_index, pending_addresses[row], name, metrics)
+    return phone_positions, address_positions
+
+def _has_competitor(row, pos, candidate_positions, group_positions, remaining_capacity, product_matches):
+    """
+    判断同名下是否还有其他有剩余次数的物流记录可能在评分时胜出：
+    电话/地址（含隐藏号码、带*地址）也能匹配，或商品匹配
+    """
+    return any(
+        other != pos and remaining_capacity[other] > 0 and (
+            other in candidate_positions or (product_matches is not None and product_matches(row, other)))
+        for other in group_positions)
+
+def resolve_exact_keys(pending_names, pending_phones, pending_addresses, logistics_index,
+                       normalized_logistics_addresses, remaining_capacity, logistics_groups=None,
+                       phone_index=None, address_index=None, product_matches=None, metrics=None):
+    """
+    第一层：按规范化后的 姓名+完整电话、姓名+完整地址 精确合并
+
+    电话列已只保留数字，完整号码（至少10位）只做精确比较；地址使用规范化结果，
+    带*号的地址不参与。先按电话合并，剩余记录再按地址合并。
+    传入logistics_groups时与第二层使用相同的歧义判断：同名下还有其他物流记录
+    经隐藏号码/带*地址也能匹配，或商品匹配时，不在这一层确定，留给后续评分
+
+    Args:
+        pending_names: 每条待发货记录的姓名
+        pending_phones: 每条待发货记录的电话，未选择电话列时为None
+        pending_addresses: 每条待发货记录规范化后的地址，未选择地址列时为None
+        logistics_index: build_logistics_index构建的物流索引
+        normalized_logistics_addresses: 按位置排列的规范化物流地址，未选择地址列时为None
+        remaining_capacity: 每个物流位置剩余可使用次数
+        logistics_groups: 可选，{姓名: 物流位置列表}，用于歧义判断
+        phone_index / address_index: 可选，电话/地址索引，用于查找隐藏号码和带*地址的竞争记录
+        product_matches: 可选，product_matches(row, pos) 判断商品是否匹配
+        metrics: 可选，本次匹配的指标对象，索引查找次数计入其中
+
+    Returns:
+        dict: {待发货记录位置: (物流记录位置, 匹配方式)}
+    """
+    resolved = {}
+    remaining_capacity = list(remaining_capacity)
+    pending_rows = pd.RangeIndex(len(pending_names))
+    logistics_positions = pd.RangeIndex(len(logistics_index['names']))
+
+    key_sources = []
+    if pending_phones is not None:
+        logistics_phones = pd.Series(logistics_index['phones'], dtype=object).astype(str).str.replace('*', '', regex=False)
+        key_sources.append(('phone', pd.Series(pending_phones, dtype=object).astype(str), logistics_phones,
+                            lambda keys: keys.str.len() >= 10))
+    if pending_addresses is not None and normalized_logistics_addresses is not None:
+        logistics_addresses = pd.Series(normalized_logistics_addresses, dtype=object)
+        key_sources.append(('address', pd.Series(pending_addresses, dtype=object).astype(str), logistics_addresses,
+                            lambda keys: (keys != '') & (keys != 'nan') & ~keys.str.contains('*', regex=False)))
+
+    for matched_by, pending_values, logistics_values, is_valid_key in key_sources:
+        pending_keys = pd.DataFrame({'row': pending_rows, 'name': pending_names, 'key': pending_values})
+        pending_keys = pending_keys[is_valid_key(pending_keys['key']) & ~pending_keys['row'].isin(list(resolved))]
+        logistics_keys = pd.DataFrame({'position': logistics_positions, 'name': logistics_index['names'], 'key': logistics_values})
+        logistics_keys = logistics_keys[is_valid_key(logistics_keys['key'])]
+
+        for row, pos in _merge_unique_keys(pending_keys, logistics_keys, remaining_capacity).items():
+            if logistics_groups is not None:
+                name = pending_names[row]
+                phone_positions, address_positions = _index_candidates(
+                    row, name, pending_phones, pending_addresses, phone_index, address_index, metrics)
+                if _has_competitor(row, pos, phone_positions | address_positions, logistics_groups[name],
+                                   remaining_capacity, product_matches):
+                    continue
+            resolved[row] = (pos, matched_by)
+            remaining_capacity[pos] -= 1
+
+    return resolved
+
+def resolve_indexed_candidates(rows, pending_names, pending_phones, pending_addresses, logistics_groups,
+                               phone_index, address_index, remaining_capacity, product_matches=None, metrics=None):
+    """
+    第二层：通过电话索引（含隐藏号码）和地址索引解析只有唯一候选的记录
+
+    一条记录经电话/地址查找后只剩一个有剩余次数的物流位置，且引用该位置的记录数
+    不超过其剩余次数时直接确定；若同名下还有其他物流记录商品匹配（评分时可能胜出），
+    视为有歧义，留给第三层
+
+    Args:
+        rows: 需要解析的待发货记录位置
+        pending_names / pending_phones / pending_addresses: 按待发货记录位置排列，
+            地址为规范化后的地址；未选择对应列时为None
+        logistics_groups: {姓名: 物流位置列表}
+        phone_index: build_phone_index构建的索引，未选择电话列时为None
+        address_index: build_address_index构建的索引，未选择地址列时为None
+        remaining_capacity: 每个物流位置剩余可使用次数
+        product_matches: 可选，product_matches(row, pos) 判断商品是否匹配
+        metrics: 可选，本次匹配的指标对象，索引查找次数计入其中
+
+    Returns:
+        dict: {待发货记录位置: (物流记录位置, 匹配方式)}
+    """
+    row_candidates = {}
+    references = {}
+    for row in rows:
+        name = pending_names[row]
+        if name not in logistics_groups:
+            continue
+
+        phone_positions, address_positions = _index_candidates(
+            row, name, pending_phones, pending_addresses, phone_index, address_index, metrics)
+        positions = {pos for pos in phone_positions | address_positions if remaining_capacity[pos] > 0}
+        if not positions:
+            continue
+        row_candidates[row] = (positions, address_positions)
+        for pos in positions:
+            references[pos] = references.get(pos, 0) + 1
+
+    resolved = {}
+    for row, (positions, address_positions) in row_candidates.items():
+        if len(positions) != 1:
+            continue
+        pos = next(iter(positions))
+        if references[pos] > remaining_capacity[pos]:
+            continue
+        if _has_competitor(row, pos, positions, logistics_groups[pending_names[row]],
+                           remaining_capacity, product_matches):
+            continue
+        resolved[row] = (pos, 'address' if pos in address_positions else 'phone')
+    return resolved
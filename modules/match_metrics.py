@@ -0,0 +1,133 @@
+import time
+import logging
+from contextlib import contextmanager
+
+import pandas as pd
+
+# 阶段的显示名称，未列出的阶段直接显示键名
+STAGE_LABELS = {
+    'preprocess': '数据预处理',
+    'logistics_index': '姓名分组与最大使用次数',
+    'phone_index': '电话索引',
+    'address_index': '地址索引',
+    'product_table': '商品相似度表',
+    'merge': '按姓名合并',
+    'tier1': '第1层精确键合并',
+    'tier2': '第2层索引解析',
+    'candidate_scoring': '候选打分',
+    'assignment': '最优分配求解',
+    'candidate_selection': '候选选取',
+    'fallback': '兜底匹配',
+    'result_assembly': '结果组装',
+}
+
+def new_match_metrics():
+    """
+    创建一个空的匹配指标对象
+
+    Returns:
+        dict: 匹配指标
+            - stages: {阶段: {'seconds': 累计耗时, 'calls': 次数}}，按首次记录的顺序
+            - counters: {计数名: 次数}，包括索引查找、带*地址匹配器和商品匹配函数在本次匹配中的调用次数
+            - candidates: {候选来源: {'rows': 记录数, 'total': 候选总数, 'max': 最大候选数}}
+    """
+    return {'stages': {}, 'counters': {}, 'candidates': {}}
+
+def add_stage_time(metrics, stage, seconds, calls=1):
+    """累加一个阶段的耗时"""
+    if metrics is None:
+        return
+    entry = metrics['stages'].setdefault(stage, {'seconds': 0.0, 'calls': 0})
+    entry['seconds'] += seconds
+    entry['calls'] += calls
+
+@contextmanager
+def stage_timer(metrics, stage):
+    """
+    记录一个阶段的耗时，用法：with stage_timer(metrics, 'preprocess'): ...
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_stage_time(metrics, stage, time.perf_counter() - start)
+
+def count(metrics, name, amount=1):
+    """累加一个计数"""
+    if metrics is None:
+        return
+    metrics['counters'][name] = metrics['counters'].get(name, 0) + amount
+
+def record_candidates(metrics, source, size):
+    """记录一条待发货记录在某个候选来源下的候选数"""
+    if metrics is None:
+        return
+    entry = metrics['candidates'].setdefault(source, {'rows': 0, 'total': 0, 'max': 0})
+    entry['rows'] += 1
+    entry['total'] += size
+    if size > entry['max']:
+        entry['max'] = size
+
+def merge_match_metrics(target, other):
+    """
+    把other中的指标累加到target（用于合并并行分区的指标），返回target
+    """
+    for stage, entry in other['stages'].items():
+        add_stage_time(target, stage, entry['seconds'], entry['calls'])
+    for name, amount in other['counters'].items():
+        count(target, name, amount)
+    for source, entry in other['candidates'].items():
+        target_entry = target['candidates'].setdefault(source, {'rows': 0, 'total': 0, 'max': 0})
+        target_entry['rows'] += entry['rows']
+        target_entry['total'] += entry['total']
+        target_entry['max'] = max(target_entry['max'], entry['max'])
+    return target
+
+def match_metrics_tables(metrics):
+    """
+    把匹配指标整理为三张表，供界面展示
+
+    Returns:
+        tuple: (阶段耗时表, 计数表, 候选数表)
+    """
+    total_seconds = sum(entry['seconds'] for entry in metrics['stages'].values())
+    stage_df = pd.DataFrame([
+        {
+            '阶段': STAGE_LABELS.get(stage, stage),
+            '耗时(秒)': round(entry['seconds'], 4),
+            '占比': f"{entry['seconds'] / total_seconds:.1%}" if total_seconds else '-',
+            '次数': entry['calls'],
+        }
+        for stage, entry in metrics['stages'].items()
+    ], columns=['阶段', '耗时(秒)', '占比', '次数'])
+    counter_df = pd.DataFrame(
+        [{'计数': name, '次数': amount} for name, amount in metrics['counters'].items()],
+        columns=['计数', '次数'])
+    candidate_df = pd.DataFrame([
+        {
+            '候选来源': source,
+            '记录数': entry['rows'],
+            '平均候选数': round(entry['total'] / entry['rows'], 2) if entry['rows'] else 0,
+            '最大候选数': entry['max'],
+        }
+        for source, entry in metrics['candidates'].items()
+    ], columns=['候选来源', '记录数', '平均候选数', '最大候选数'])
+    return stage_df, counter_df, candidate_df
+
+def log_match_metrics(metrics, logger=None, level=logging.INFO):
+    """
+    把匹配指标写入日志，供脱离界面运行时使用
+
+    Args:
+        metrics: 匹配指标
+        logger: 日志记录器，默认为本模块的logger
+        level: 日志级别
+    """
+    logger = logger or logging.getLogger(__name__)
+    for stage, entry in metrics['stages'].items():
+        logger.log(level, "stage %s: %.4fs (%d calls)", stage, entry['seconds'], entry['calls'])
+    for name, amount in metrics['counters'].items():
+        logger.log(level, "counter %s: %d", name, amount)
+    for source, entry in metrics['candidates'].items():
+        mean = entry['total'] / entry['rows'] if entry['rows'] else 0
+        logger.log(level, "candidates %s: rows=%d mean=%.2f max=%d", source, entry['rows'], mean, entry['max'])
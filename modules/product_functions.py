@@ -7,10 +7,6 @@ def standardize_product_names(df, product_list):
     """
     标准化商品名称
     """
-    # 确保所有列都是字符串类型
-    for col in df.columns:
-        df[col] = df[col].astype(str)
-    
     # 选择产品名称列 - 添加对"货品名称"列的支持
     if '货品名称' in df.columns:
         product_col = '货品名称'
@@ -19,6 +15,10 @@ def standardize_product_names(df, product_list):
     else:
         product_col = st.selectbox("选择包含产品名称的列", df.columns)
     
+    # 产品名称列按字符串处理，其余列按类型策略存储
+    from modules.dtype_policy import apply_dtype_policy
+    df = apply_dtype_policy(df, text_columns=[product_col])
+    
     # 创建标准化映射
     standardized_mapping = {}
     
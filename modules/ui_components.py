@@ -29,6 +29,13 @@ def setup_sidebar():
     )
     return app_mode
 
+def streamlit_running():
+    """
+    判断当前是否在Streamlit页面脚本中运行（命令行、子进程中运行时返回False）
+    """
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    return get_script_run_ctx(suppress_warning=True) is not None
+
 def show_footer():
     """
     显示页脚
@@ -36,17 +43,85 @@ def show_footer():
     st.markdown("---")
     st.markdown("© 2025 数据处理系统 v1.0")
 
-def download_button(df, filename_prefix):
+def download_button(df, filename_prefix, label="下载结果文件"):
     """
     创建下载按钮
+
+    文件在内存中生成（较大时使用自动清理的临时文件），不写入工作目录；
+    数据行数较多时可选择CSV或Parquet格式
     """
-    output_file = f"{filename_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    df.to_excel(output_file, index=False)
-    
-    with open(output_file, "rb") as file:
+    from modules.excel_io import EXPORT_FORMATS, export_formats, export_dataframe
+
+    formats = export_formats(df)
+    file_format = formats[0]
+    if len(formats) > 1:
+        file_format = st.radio(
+            f"数据共{len(df)}行，选择下载格式",
+            options=formats,
+            format_func=lambda x: {'xlsx': 'Excel (.xlsx)', 'csv': 'CSV (.csv)', 'parquet': 'Parquet (.parquet)'}[x],
+            horizontal=True,
+            key=f"download_format_{filename_prefix}"
+        )
+    extension, mime = EXPORT_FORMATS[file_format]
+    output_file = f"{filename_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{extension}"
+
+    # st.download_button只接受bytes，文件内容交给Streamlit后临时文件随即关闭
+    with export_dataframe(df, file_format) as file:
         st.download_button(
-            label="下载结果文件",
-            data=file,
+            label=label,
+            data=file.read(),
             file_name=output_file,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
\ No newline at end of file
+            mime=mime
+        )
+
+def show_match_metrics(metrics, title="匹配性能指标"):
+    """
+    在可折叠区域中显示匹配指标（各阶段耗时、调用次数、候选数）
+    """
+    from modules.match_metrics import match_metrics_tables
+
+    stage_df, counter_df, candidate_df = match_metrics_tables(metrics)
+    with st.expander(title):
+        st.write("各阶段耗时（并行匹配时为各进程合计）:")
+        st.dataframe(stage_df, hide_index=True)
+        st.write("调用次数与计数:")
+        st.dataframe(counter_df, hide_index=True)
+        if not candidate_df.empty:
+            st.write("每条待发货记录的候选数:")
+            st.dataframe(candidate_df, hide_index=True)
+
+def show_excel_parse_log(title="文件解析统计"):
+    """
+    在可折叠区域中显示最近的Excel文件解析耗时和行数
+    """
+    from modules.excel_io import excel_parse_log
+
+    parse_log = excel_parse_log()
+    if not parse_log:
+        return
+    log_df = pd.DataFrame([
+        {
+            '文件': entry['file'],
+            '引擎': entry['engine'],
+            '行数': entry['rows'],
+            '列数': entry['columns'],
+            '耗时(秒)': round(entry['seconds'], 3),
+        }
+        for entry in reversed(parse_log)
+    ])
+    with st.expander(title):
+        st.dataframe(log_df, hide_index=True)
+
+def show_memory_usage(df, label="结果"):
+    """
+    显示DataFrame的内存占用，以及相比全部转为字符串节省的内存
+    """
+    from modules.dtype_policy import memory_report
+
+    report = memory_report(df)
+    saved = report['text_bytes'] - report['bytes']
+    message = f"{label}内存占用 {report['bytes'] / 1024 ** 2:.1f} MB"
+    if report['text_bytes'] and saved > 0:
+        message += (f"（全部转为文本约 {report['text_bytes'] / 1024 ** 2:.1f} MB，"
+                    f"节省 {saved / report['text_bytes']:.0%}）")
+    st.caption(message)